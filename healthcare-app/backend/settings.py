@@ -1,3 +1,5 @@
+import copy
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -16,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'fhirapi',
@@ -23,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'fhirapi.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware', 
     'django.middleware.security.SecurityMiddleware',
@@ -31,6 +35,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fhirapi.routers.ReplicaPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -55,13 +60,45 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'doctor_finder',
+        'NAME': os.environ.get('DATABASE_NAME', 'doctor_finder'),
         'USER': 'postgres',
         'PASSWORD': 'Haswanth@13',
         'HOST': 'localhost',
         'PORT': '5432',      
+        # Seconds a connection is kept for the next request on the same
+        # thread; 0 reconnects on every request.
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# psycopg's connection pool, at most DATABASE_POOL_SIZE connections per
+# process, instead of one persistent connection per thread. Use it under
+# ASGI, where every request runs on its own thread.
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+if DATABASE_POOL_SIZE:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {'min_size': 1, 'max_size': DATABASE_POOL_SIZE, 'timeout': 10},
+    }
+# Behind pgbouncer in transaction mode a cursor cannot outlive its transaction.
+if os.environ.get('DATABASE_PGBOUNCER'):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Read replica for the doctor search views and admin (fhirapi.routers), used
+# when DATABASE_REPLICA_HOST or DATABASE_REPLICA_NAME is set. The alias
+# always exists; in tests it mirrors default.
+DATABASES['replica'] = {
+    **copy.deepcopy(DATABASES['default']),
+    'HOST': os.environ.get('DATABASE_REPLICA_HOST', DATABASES['default']['HOST']),
+    'NAME': os.environ.get('DATABASE_REPLICA_NAME', DATABASES['default']['NAME']),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_READ_REPLICA = (
+    'replica' if os.environ.get('DATABASE_REPLICA_HOST') or os.environ.get('DATABASE_REPLICA_NAME') else None
+)
+DATABASE_ROUTERS = ['fhirapi.routers.PrimaryReplicaRouter']
+# Seconds a client keeps reading from the primary after a write, to cover replica lag.
+DATABASE_REPLICA_PIN_SECONDS = 5
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -77,8 +114,16 @@ SIMPLE_JWT = {
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,  
+    'DEFAULT_RENDERER_CLASSES': [
+        'fhirapi.metrics.MeteredJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Runs of one SQL statement in a request from which fhirapi.metrics logs
+# and counts it as an N+1 pattern.
+METRICS_N_PLUS_ONE_THRESHOLD = 10
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -88,6 +133,42 @@ STATIC_URL = 'static/'
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'django-db'
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-outbox': {'task': 'fhirapi.tasks.dispatch_outbox', 'schedule': 10},
+    'purge-idempotency-keys': {'task': 'fhirapi.tasks.purge_idempotency_keys', 'schedule': 60 * 60},
+    'refresh-facets': {'task': 'fhirapi.tasks.refresh_facets', 'schedule': 15 * 60},
+    'appointment-partitions': {'task': 'fhirapi.tasks.maintain_appointment_partitions', 'schedule': 24 * 60 * 60},
+}
+
+# Local memory by default; point CACHE_REDIS_URL at Redis (e.g. the Celery
+# broker instance, another db number) to share the cache between workers.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'doctor-finder',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+if CACHE_REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    }
+# Seconds a cached doctor response is kept; data changes bump the version instead of expiring it.
+DOCTOR_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a booking's Idempotency-Key is remembered and its response replayed.
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# NDJSON files written by FHIR bulk $export jobs
+FHIR_EXPORT_ROOT = BASE_DIR / 'exports'
+
+# Monthly appointment partitions: months created ahead of today, and past
+# months kept before they are archived as gzipped CSV (see fhirapi.partitions).
+APPOINTMENT_PARTITION_MONTHS_AHEAD = 12
+APPOINTMENT_RETENTION_MONTHS = 24
+APPOINTMENT_ARCHIVE_ROOT = BASE_DIR / 'archive' / 'appointments'
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
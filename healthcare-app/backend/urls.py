@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.http import JsonResponse
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from fhirapi.metrics import metrics_view
+
 
 def home_view(request):
     return JsonResponse({
@@ -11,7 +13,8 @@ def home_view(request):
             "/admin/",
             "/api/",
             "/api/token/",
-            "/api/token/refresh/"
+            "/api/token/refresh/",
+            "/metrics"
         ]
     })
 
@@ -21,4 +24,5 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/', include('fhirapi.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,21 +1,44 @@
-from django.contrib import admin
-from .models import Doctor, Appointment
+import re
+
+from django.contrib import admin, messages
+from django.utils import timezone
+from .facets import cached_choices as facet_choices
+from .models import (
+    Appointment, Doctor, DoctorSchedule, DoctorSyncRun, Location, OutboxMessage, ScheduleException, Specialty,
+)
+from .pagination import EstimatedCountPaginator
+from .routers import SAFE_METHODS, replica_reads
+
+ZIP_CODE = re.compile(r"\d{5}(?:-?\d{4})?")
+# field:value prefixes of the admin search, to filter params.
+SEARCH_PREFIXES = {
+    "id": "id", "first_name": "first_name", "last_name": "last_name", "specialization": "specialization",
+    "city": "city", "state": "state", "zip": "zip_code", "zip_code": "zip_code", "q": "q",
+}
+
+
+def search_params(term):
+    """
+    Filter params (as for /doctors/filter/) for a doctor admin search:
+    ``field:value`` filters on that field, a 5- or 9-digit number is a ZIP
+    prefix, any other number an id, and anything else a full-text search.
+    """
+    term = term.strip()
+    field, separator, value = term.partition(":")
+    if separator and field.strip().lower() in SEARCH_PREFIXES:
+        return {SEARCH_PREFIXES[field.strip().lower()]: value.strip()}
+    if ZIP_CODE.fullmatch(term):
+        return {"zip_code": term.replace("-", "")}
+    if term.isdigit():
+        return {"id": term}
+    return {"q": term} if term else {}
 
 class NameListFilter(admin.SimpleListFilter):
     title = 'Name'
     parameter_name = 'name'
 
     def lookups(self, request, model_admin):
-        names = (
-            Doctor.objects
-            .values_list('first_name', 'last_name')
-            .distinct()
-            .order_by('first_name')[:100]
-        )
-        return [
-            (f"{first} {last}", f"{first} {last}")
-            for first, last in names if first and last
-        ]
+        return [(name, name) for name in facet_choices('name')]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -29,17 +52,11 @@ class CityListFilter(admin.SimpleListFilter):
     parameter_name = 'city'
 
     def lookups(self, request, model_admin):
-        cities = (
-            Doctor.objects
-            .values_list('city', flat=True)
-            .distinct()
-            .order_by('city')[:100]
-        )
-        return [(city, city) for city in cities if city]
+        return [(city, city) for city in facet_choices('city')]
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(city=self.value())
+            return queryset.filter(location__city=self.value())
         return queryset
 
 class StateListFilter(admin.SimpleListFilter):
@@ -47,17 +64,11 @@ class StateListFilter(admin.SimpleListFilter):
     parameter_name = 'state'
 
     def lookups(self, request, model_admin):
-        states = (
-            Doctor.objects
-            .values_list('state', flat=True)
-            .distinct()
-            .order_by('state')[:100]
-        )
-        return [(state, state) for state in states if state]
+        return [(state, state) for state in facet_choices('state')]
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(state=self.value())
+            return queryset.filter(location__state=self.value())
         return queryset
 
 class ZipCodeListFilter(admin.SimpleListFilter):
@@ -65,17 +76,12 @@ class ZipCodeListFilter(admin.SimpleListFilter):
     parameter_name = 'zip_code'
 
     def lookups(self, request, model_admin):
-        zips = (
-            Doctor.objects
-            .values_list('zip_code', flat=True)
-            .distinct()
-            .order_by('zip_code')[:100]
-        )
-        return [(z, z) for z in zips if z]
+        return [(z, z) for z in facet_choices('zip_code')]
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(zip_code=self.value())
+            # The choices are 5-digit ZIPs; stored codes may be ZIP+4.
+            return queryset.filter(zip_code__startswith=self.value())
         return queryset
 
 class SpecializationListFilter(admin.SimpleListFilter):
@@ -83,17 +89,11 @@ class SpecializationListFilter(admin.SimpleListFilter):
     parameter_name = 'specialization'
 
     def lookups(self, request, model_admin):
-        specs = (
-            Doctor.objects
-            .values_list('specialization', flat=True)
-            .distinct()
-            .order_by('specialization')[:100]
-        )
-        return [(spec, spec) for spec in specs if spec]
+        return [(spec, spec) for spec in facet_choices('specialization')]
 
     def queryset(self, request, queryset):
         if self.value():
-            return queryset.filter(specialization=self.value())
+            return queryset.filter(specialty__name=self.value())
         return queryset
 
 @admin.register(Doctor)
@@ -102,10 +102,19 @@ class DoctorAdmin(admin.ModelAdmin):
         'practitioner_id', 'first_name', 'last_name',
         'specialization', 'city', 'state', 'zip_code', 'phone'
     )
-    search_fields = (
-        'practitioner_id', 'first_name', 'last_name',
-        'specialization', 'city', 'state', 'zip_code'
+    # Only turns the search box on: get_search_results routes the input to
+    # the indexed filters instead of OR-ing icontains over every column.
+    search_fields = ('practitioner_id',)
+    search_help_text = (
+        'An ID, a ZIP code, field:value (first_name, last_name, specialization, city, state, zip) '
+        'or words to match in names, specialization and city.'
     )
+    # Past EstimatedCountPaginator.exact_below rows the counts are estimates,
+    # and the unfiltered total is not counted at all.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ('specialty', 'location')
+    raw_id_fields = ('specialty', 'location')
     list_filter = (
         NameListFilter,
         SpecializationListFilter,
@@ -114,6 +123,37 @@ class DoctorAdmin(admin.ModelAdmin):
         ZipCodeListFilter,
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        params = search_params(search_term)
+        if not params:
+            return queryset, False
+        try:
+            return queryset.apply_filters(params), False
+        except ValueError as error:
+            self.message_user(request, str(error), messages.WARNING)
+            return queryset.none(), False
+
+    def changelist_view(self, request, extra_context=None):
+        # Searches, the filter choices and the result page rendered below are
+        # all doctor reads; serve them from the replica.
+        if request.method not in SAFE_METHODS:
+            return super().changelist_view(request, extra_context)
+        with replica_reads():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, "render"):
+                response.render()
+        return response
+
+@admin.register(Specialty)
+class SpecialtyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code')
+    search_fields = ('name', 'code')
+
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ('city', 'state')
+    search_fields = ('city', 'state')
+
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = (
@@ -124,6 +164,44 @@ class AppointmentAdmin(admin.ModelAdmin):
         'appointment_id', 'patient_name', 'phone_number', 'email', 'doctor__first_name', 'doctor__last_name'
     )
     list_filter = (
-        'appointment_date', 'doctor__specialization', 'doctor__city'
+        'appointment_date', 'doctor__specialty', 'doctor__location__city'
     )
+    # The doctor column's __str__ reads the specialty too.
+    list_select_related = ('doctor__specialty',)
+    ordering = ('appointment_date', 'appointment_time')
     readonly_fields = ('appointment_id', 'created_at')
+
+@admin.register(DoctorSchedule)
+class DoctorScheduleAdmin(admin.ModelAdmin):
+    list_display = (
+        'doctor', 'weekday', 'start_time', 'end_time', 'slot_minutes', 'valid_from', 'valid_until'
+    )
+    list_filter = ('weekday',)
+    raw_id_fields = ('doctor',)
+
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'date', 'start_time', 'end_time', 'reason')
+    list_filter = ('date',)
+    raw_id_fields = ('doctor',)
+
+@admin.register(DoctorSyncRun)
+class DoctorSyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'started_at', 'source', 'rows_read', 'inserted', 'updated', 'deleted', 'unchanged', 'seconds'
+    )
+    readonly_fields = list_display
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'recipient', 'status', 'attempts', 'created_at', 'available_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('recipient',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ('requeue',)
+
+    @admin.action(description='Send again')
+    def requeue(self, request, queryset):
+        queryset.exclude(status=OutboxMessage.SENT).update(
+            status=OutboxMessage.PENDING, attempts=0, available_at=timezone.now()
+        )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FhirapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fhirapi'
+
+    def ready(self):
+        from . import signals  # noqa: F401
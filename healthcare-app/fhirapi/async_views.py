@@ -0,0 +1,97 @@
+"""
+Async versions of the doctor read endpoints, served under ``/api/async/``
+next to the DRF views, with the same params and response bodies.
+
+They run on the event loop under an ASGI server and reach the database
+through the async ORM (``afirst``, ``acount``, ``async for``) and the
+cache through its async API. Django still executes each query on a
+worker thread, but a request holds one only while a query runs, not for
+its whole lifetime. Proximity searches are handed to the sync view: they
+need a transaction for ``nearest_first_scans``, which the async ORM
+cannot open. Like the sync views, they read from the replica when one is
+configured (see routers).
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from .cache import async_cached
+from .fhir import element_columns, practitioner_json, requested_elements
+from .metrics import MeteredJSONRenderer, serializing
+from .models import Doctor
+from .pagination import DoctorKeysetPagination, DoctorPagination
+from .routers import replica_reads
+from .serializers import row_serializer, sparse_fields
+from .views import API_LINKS, DoctorDetailView, DoctorFilterView
+
+NEARBY_PARAMS = {"near_zip", "lat", "lon"}
+
+
+def json_response(data, status=200):
+    # DRF's renderer, so bodies are byte-identical to the sync views'.
+    return HttpResponse(MeteredJSONRenderer().render(data), content_type="application/json", status=status)
+
+
+def render_sync_view(view, request, **kwargs):
+    response = view(request, **kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+filter_view = DoctorFilterView.as_view()
+
+
+@require_GET
+async def api_root(request):
+    return json_response(API_LINKS)
+
+
+@require_GET
+async def doctor_filter(request):
+    if NEARBY_PARAMS & request.GET.keys():
+        return await sync_to_async(render_sync_view)(filter_view, request)
+    with replica_reads():
+        return await filtered_page(request)
+
+
+@async_cached("async-filter", DoctorFilterView.cache_params, DoctorFilterView.uncached_params)
+async def filtered_page(request):
+    try:
+        queryset = Doctor.objects.filter_from_params(request.GET)
+        fields = sparse_fields(request.GET)
+    except ValueError as error:
+        return json_response({"error": str(error)}, status=400)
+
+    request = Request(request)
+    if DoctorKeysetPagination.cursor_query_param in request.query_params:
+        paginator = DoctorKeysetPagination()
+    else:
+        paginator = DoctorPagination()
+    rows = queryset.select_fields(fields, cursor=isinstance(paginator, DoctorKeysetPagination))
+    try:
+        rows = await paginator.apaginate_queryset(rows, request)
+    except NotFound as error:
+        return json_response({"detail": error.detail}, status=404)
+    serialize = row_serializer(fields)
+    with serializing():
+        data = [serialize(row) for row in rows]
+    return json_response(paginator.get_paginated_response(data).data)
+
+
+@require_GET
+@async_cached("async-detail", DoctorDetailView.cache_params, version_kwarg="practitioner_id")
+async def doctor_detail(request, practitioner_id):
+    try:
+        elements = requested_elements(request.GET)
+    except ValueError as error:
+        return json_response({"error": str(error)}, status=400)
+    with replica_reads():
+        row = await (Doctor.objects.filter(practitioner_id=practitioner_id)
+                     .select_fields(element_columns(elements)).afirst())
+    if row is None:
+        return json_response({"error": "Doctor not found"}, status=404)
+    with serializing():
+        return json_response(practitioner_json(row, elements))
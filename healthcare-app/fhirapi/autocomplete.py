@@ -0,0 +1,237 @@
+"""
+In-process prefix index for typeahead on doctor names, specializations
+and cities; a lookup is a couple of bisects and never touches the database.
+
+Each field is one :class:`PrefixIndex`: its distinct values, upper-cased,
+sorted and packed back to back into one ``bytes`` with ``array`` offsets,
+so a value costs its UTF-8 length plus 12 bytes instead of a Python str per
+value. Names are indexed as "FIRST LAST" and "LAST FIRST", both pointing
+at the first form. Suggestions are ranked by number of doctors, then
+alphabetically. Ranking a wide prefix ("J") would mean walking most of the
+array, so the top MAX_RESULTS of every prefix matching more than SCAN_LIMIT
+entries is computed at build time, bottom-up from its children's.
+
+Every worker process builds its own indexes from ``Doctor.objects`` in a
+background thread as it starts, answering 503 until they are ready, and
+rebuilds them the same way when the cache data version changes (at most
+every MIN_REBUILD_SECONDS); the old ones keep answering until the new
+ones are swapped in.
+
+Memory, per process (``manage.py benchmark autocomplete``): 1.2M doctors
+shaped like the national CMS file (~790k distinct names, so 1.6M name
+keys, plus cities and 90 specializations) index into about 55 MB. The
+build sorts plain tuples first and peaks near 500 MB for under a minute
+on one core; lookups stay under 0.2 ms at p99.
+"""
+import bisect
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+
+from django.db import connections
+from django.db.models import Count
+
+from .cache import data_version, primary_if_recently_changed
+from .models import Doctor
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("name", "specialization", "city")
+MAX_RESULTS = 20
+DEFAULT_RESULTS = 10
+SCAN_LIMIT = 256
+MIN_REBUILD_SECONDS = 30
+
+
+def normalize(text):
+    return " ".join(str(text).upper().split())
+
+
+class PackedKeys:
+    """
+    Read-only sequence of the keys packed in ``blob``, for bisect.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return self.blob[self.offsets[position]:self.offsets[position + 1]]
+
+
+class PrefixIndex:
+    def __init__(self, entries):
+        """
+        ``entries`` are ``(key, label, doctors)``: the text to match, the
+        suggestion it stands for (itself an entry's key) and its weight.
+        """
+        entries = sorted((key.encode(), label.encode(), doctors) for key, label, doctors in entries)
+        position = {key: number for number, (key, label, _) in enumerate(entries) if key == label}
+        offsets = array("Q", [0])
+        for key, _, _ in entries:
+            offsets.append(offsets[-1] + len(key))
+        self.keys = PackedKeys(b"".join(key for key, _, _ in entries), offsets)
+        self.targets = array("I", (position[label] for _, label, _ in entries))
+        self.doctors = array("I", (doctors for _, _, doctors in entries))
+        self.top = {}
+        self._rank(b"", 0, len(entries))
+
+    def _best(self, candidates):
+        # Target positions order labels alphabetically, so they break ties.
+        return array("I", heapq.nsmallest(MAX_RESULTS, set(candidates),
+                                          key=lambda target: (-self.doctors[target], target)))
+
+    def _rank(self, prefix, lo, hi):
+        """
+        Top targets of the keys in ``lo:hi``, all starting with ``prefix``;
+        stored in ``self.top`` when the range is too wide to scan per query.
+        """
+        if hi - lo <= SCAN_LIMIT:
+            return self._best(self.targets[lo:hi])
+        candidates = []
+        depth = len(prefix)
+        position = lo
+        while position < hi and len(self.keys[position]) == depth:
+            candidates.append(self.targets[position])
+            position += 1
+        while position < hi:
+            child = self.keys[position][:depth + 1]
+            end = bisect.bisect_left(self.keys, child + b"\xff", position, hi)
+            candidates.extend(self._rank(child, position, end))
+            position = end
+        self.top[prefix] = best = self._best(candidates)
+        return best
+
+    def search(self, text, limit=DEFAULT_RESULTS):
+        """
+        ``(label, doctors)`` of the best ``limit`` suggestions for ``text``.
+        """
+        prefix = normalize(text).encode()
+        if prefix in self.top:
+            best = self.top[prefix]
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + b"\xff", lo, min(lo + SCAN_LIMIT, len(self.keys)))
+            best = self._best(self.targets[lo:hi])
+        return [(self.keys[target].decode(), self.doctors[target]) for target in best[:limit]]
+
+    def nbytes(self):
+        top = sys.getsizeof(self.top) + sum(
+            sys.getsizeof(prefix) + sys.getsizeof(best) for prefix, best in self.top.items())
+        return (sys.getsizeof(self.keys.blob) + sys.getsizeof(self.keys.offsets)
+                + sys.getsizeof(self.targets) + sys.getsizeof(self.doctors) + top)
+
+
+def name_entries(rows):
+    for first, last, doctors in rows:
+        label = normalize(f"{first} {last}")
+        if label:
+            yield label, label, doctors
+            rotated = normalize(f"{last} {first}")
+            if rotated != label:
+                yield rotated, label, doctors
+
+
+def value_entries(rows):
+    for value, doctors in rows:
+        label = normalize(value or "")
+        if label:
+            yield label, label, doctors
+
+
+def field_rows(field):
+    if field == "name":
+        return Doctor.objects.values_list("first_name", "last_name").annotate(doctors=Count("*")).order_by()
+    return Doctor.objects.with_names().values_list(field).annotate(doctors=Count("*")).order_by()
+
+
+class Indexes:
+    def __init__(self, version, fields):
+        self.version = version
+        self.fields = fields
+        self.built_at = time.monotonic()
+
+
+def build(version=None):
+    """
+    Index every field from the doctors table (on the replica, if any and
+    not just behind a change).
+    """
+    version = data_version() if version is None else version
+    started = time.perf_counter()
+    with primary_if_recently_changed(), replica_reads():
+        fields = {
+            "name": PrefixIndex(name_entries(field_rows("name"))),
+            **{field: PrefixIndex(value_entries(field_rows(field))) for field in FIELDS[1:]},
+        }
+    logger.info("Built autocomplete indexes for version %s in %.1fs", version, time.perf_counter() - started)
+    return Indexes(version, fields)
+
+
+_current = None
+_rebuilding = None
+_lock = threading.Lock()
+
+
+def _rebuild(version):
+    global _current
+    try:
+        _current = build(version)
+    except Exception:
+        logger.exception("Rebuilding the autocomplete indexes failed")
+    finally:
+        connections.close_all()
+
+
+def _start_rebuild(version):
+    global _rebuilding
+    if _rebuilding is None or not _rebuilding.is_alive():
+        _rebuilding = threading.Thread(target=_rebuild, args=(version,), daemon=True, name="autocomplete-rebuild")
+        _rebuilding.start()
+
+
+def warm():
+    """
+    Start building the indexes in the background; every worker calls this
+    as it loads the application (backend/wsgi.py, backend/asgi.py).
+    """
+    with _lock:
+        if _current is None:
+            _start_rebuild(data_version())
+
+
+def indexes():
+    """
+    The current indexes, or None until the first build is done. A later
+    data version starts a background rebuild while the old ones keep
+    serving.
+    """
+    current = _current
+    if current is None:
+        warm()
+        return None
+    version = data_version()
+    stale = current.version != version and time.monotonic() - current.built_at >= MIN_REBUILD_SECONDS
+    if stale and _lock.acquire(blocking=False):
+        try:
+            _start_rebuild(version)
+        finally:
+            _lock.release()
+    return current
+
+
+def suggest(field, text, limit=DEFAULT_RESULTS):
+    """
+    Suggestions for ``text``, or None while the indexes are being built.
+    """
+    current = indexes()
+    if current is None:
+        return None
+    return [{"value": value, "doctors": doctors} for value, doctors in current.fields[field].search(text, limit)]
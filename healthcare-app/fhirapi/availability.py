@@ -0,0 +1,133 @@
+"""
+Free appointment slots, computed set-wise in SQL.
+
+Every weekly schedule block is expanded over the requested dates with
+generate_series, and schedule exceptions and booked appointments are
+subtracted from its hours as ranges; the slots left whole are free. A month of
+slots for a page of doctors is one query, and "has a free slot" is the same
+query under EXISTS, so it composes with the other doctor filters and stops
+at the first free slot.
+
+Schedule times are wall-clock times in ``TIME_ZONE``.
+"""
+import datetime
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import MAX_AVAILABILITY_DAYS, Appointment, Doctor, DoctorSchedule, ScheduleException
+
+DEFAULT_DAYS = 7
+MAX_DOCTORS = 100
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def slots_sql(doctor_condition):
+    """
+    Free slots as (doctor_id, start) rows. Params, in order: first and last
+    date, twice, the params of ``doctor_condition`` (which filters the
+    schedule alias ``s``), and the timestamp before which slots are dropped.
+
+    Each schedule block's hours that day, minus that day's exceptions and
+    the instants its appointments start at, is a multirange of open time
+    (two index range scans per block). A slot on the block's grid is free
+    when it fits inside it. The appointments are also bounded by the dates
+    as given, so only the partitions of those months are planned.
+    """
+    return f"""
+        SELECT s.doctor_id, slot.start
+        FROM {quote(DoctorSchedule._meta.db_table)} s
+        JOIN (
+            SELECT day::date FROM generate_series(%s::timestamp, %s::timestamp, interval '1 day') AS day
+        ) AS d(day)
+          ON s.weekday = extract(isodow FROM d.day)::int - 1
+         AND d.day BETWEEN coalesce(s.valid_from, d.day) AND coalesce(s.valid_until, d.day)
+        CROSS JOIN LATERAL (
+            SELECT tsmultirange(tsrange(d.day + s.start_time, d.day + s.end_time))
+                   - coalesce(range_agg(tsrange(e.date + coalesce(e.start_time, time '00:00'),
+                                                e.date + coalesce(e.end_time, time '24:00'))), '{{}}')
+                   - coalesce((
+                       SELECT range_agg(tsrange(a.appointment_date + a.appointment_time,
+                                                a.appointment_date + a.appointment_time, '[]'))
+                       FROM {quote(Appointment._meta.db_table)} a
+                       WHERE a.doctor_id = s.doctor_id AND a.appointment_date = d.day
+                         AND a.appointment_date BETWEEN %s AND %s
+                         AND a.appointment_time >= s.start_time AND a.appointment_time < s.end_time
+                   ), '{{}}'),
+                   make_interval(mins => s.slot_minutes)
+            FROM {quote(ScheduleException._meta.db_table)} e
+            WHERE e.doctor_id = s.doctor_id AND e.date = d.day
+        ) AS b(open, length)
+        CROSS JOIN LATERAL generate_series(d.day + s.start_time, d.day + s.end_time - b.length, b.length) AS slot(start)
+        WHERE {doctor_condition}
+          AND slot.start >= %s
+          AND tsrange(slot.start, slot.start + b.length) <@ b.open
+    """
+
+
+def local_now():
+    # Slot starts are naive wall-clock timestamps.
+    return timezone.localtime().replace(tzinfo=None)
+
+
+def free_slots(doctor_ids, start, end, now=None):
+    """
+    Free slot start times per doctor from ``start`` to ``end`` (dates,
+    inclusive), leaving out slots before ``now``. Doctors without a schedule
+    map to an empty list.
+    """
+    slots = {doctor_id: [] for doctor_id in doctor_ids}
+    sql = slots_sql("s.doctor_id = ANY(%s)") + " ORDER BY s.doctor_id, slot.start"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start, end, start, end, list(slots), now or local_now()])
+        for doctor_id, slot in cursor.fetchall():
+            slots[doctor_id].append(slot)
+    return slots
+
+
+def has_free_slot(start, end, now=None):
+    """
+    Filter condition for doctors with at least one free slot from ``start``
+    to ``end``.
+    """
+    doctor = f"{quote(Doctor._meta.db_table)}.{quote(Doctor._meta.pk.column)}"
+    sql = f"EXISTS ({slots_sql(f's.doctor_id = {doctor}')})"
+    return RawSQL(sql, [start, end, start, end, now or local_now()], output_field=BooleanField())
+
+
+def parse_date(params, key, default):
+    if not params.get(key):
+        return default
+    try:
+        return datetime.date.fromisoformat(params[key])
+    except ValueError:
+        raise ValueError(f"'{key}' must be a date like 2025-01-31.")
+
+
+def date_range(params):
+    """
+    (start, end) from the ``start`` and ``end`` query params: today and the
+    following week by default, at most MAX_AVAILABILITY_DAYS days.
+    """
+    start = parse_date(params, "start", timezone.localdate())
+    end = parse_date(params, "end", start + datetime.timedelta(days=DEFAULT_DAYS - 1))
+    if end < start:
+        raise ValueError("'end' must not be before 'start'.")
+    if (end - start).days >= MAX_AVAILABILITY_DAYS:
+        raise ValueError(f"At most {MAX_AVAILABILITY_DAYS} days can be requested at once.")
+    return start, end
+
+
+def by_date(slots):
+    """
+    ``{"2025-01-31": ["09:00", "09:30"], ...}`` for a list of slot starts.
+    """
+    days = {}
+    for slot in slots:
+        days.setdefault(slot.date().isoformat(), []).append(slot.strftime("%H:%M"))
+    return days
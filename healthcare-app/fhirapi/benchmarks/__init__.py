@@ -0,0 +1,124 @@
+"""
+Benchmark scenarios, run through ``python manage.py benchmark <scenario>``.
+
+A scenario is a function registered with :func:`scenario`. It receives the
+parsed command options plus a ``write`` callable for progress output, and
+returns a dict of results. The command can save those as JSON and compare
+them with a saved baseline (see :func:`regressions`).
+"""
+import importlib
+import json
+import pkgutil
+import time
+
+SCENARIOS = {}
+# --rows presets: a dev database, a state-sized directory, the national file.
+ROW_PRESETS = {"10k": 10_000, "1m": 1_000_000, "5m": 5_000_000}
+# Result keys compared against a baseline: latencies must not grow, rates must not drop.
+LOWER_IS_BETTER = ("p50",)
+HIGHER_IS_BETTER = ("requests_per_second", "bookings_per_second", "per_second")
+
+
+def scenario(name, needs_db=True):
+    def register(func):
+        func.needs_db = needs_db
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def load_scenarios():
+    for module in pkgutil.iter_modules(__path__):
+        importlib.import_module(f"{__name__}.{module.name}")
+    return SCENARIOS
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = round(pct / 100 * (len(ordered) - 1))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        "n": len(samples_ms),
+        "p50": round(percentile(samples_ms, 50), 3),
+        "p99": round(percentile(samples_ms, 99), 3),
+        "mean": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        "max": round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+def measure(func, repeat=50, warmup=3):
+    """
+    Call ``func`` ``warmup + repeat`` times and summarize the timed calls in ms.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def format_summary(label, summary):
+    return f"{label:<44} p50={summary['p50']:>9.3f}ms  p99={summary['p99']:>9.3f}ms  n={summary['n']}"
+
+
+def row_count(value):
+    """
+    ``--rows`` argument: a preset name from ROW_PRESETS or a number.
+    """
+    return ROW_PRESETS.get(value.lower()) or int(value)
+
+
+def compared_values(results, path=()):
+    """
+    ``{(key, ..., name): (value, higher_is_better)}`` for every number in
+    ``results`` under a key named in LOWER_IS_BETTER or HIGHER_IS_BETTER.
+    """
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(compared_values(value, (*path, key)))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key in LOWER_IS_BETTER:
+                values[(*path, key)] = (value, False)
+            elif key in HIGHER_IS_BETTER:
+                values[(*path, key)] = (value, True)
+    return values
+
+
+def regressions(baseline, results, threshold):
+    """
+    ``(name, baseline, current, percent worse)`` for every value compared in
+    both runs that got more than ``threshold`` percent worse.
+    """
+    previous = compared_values(baseline)
+    worse = []
+    for path, (value, higher_is_better) in compared_values(results).items():
+        if path not in previous or not previous[path][0]:
+            continue
+        before = previous[path][0]
+        change = (before - value if higher_is_better else value - before) / before * 100
+        if change > threshold:
+            worse.append(("/".join(map(str, path)), before, value, round(change, 1)))
+    return worse
+
+
+def save_results(path, scenario_name, options, results):
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(
+            {"scenario": scenario_name, "rows": options["rows"], "repeat": options["repeat"],
+             "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "results": results},
+            output, indent=2, default=str,
+        )
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)["results"]
@@ -0,0 +1,112 @@
+"""
+Typeahead lookups against the in-process prefix index: every keystroke of
+a sample of names, specializations and cities, first on indexes built from
+the synthetic doctors, then on indexes shaped like the national CMS file
+(NATIONAL_DOCTORS doctors, ~1M distinct names), which is what sets the
+memory a worker needs.
+"""
+import random
+import time
+import tracemalloc
+
+from fhirapi import autocomplete
+
+from . import format_summary, scenario, summarize
+from .synthetic import ensure_doctors
+
+NATIONAL_DOCTORS = 1_200_000
+SYLLABLES = [
+    "AN", "BER", "CA", "DE", "EL", "FI", "GO", "HA", "IN", "JO", "KA", "LI", "MA", "NO", "OR", "PE",
+    "QUI", "RA", "SA", "TA", "U", "VA", "WIL", "XI", "YA", "ZE", "SON", "MAN", "TON", "LEY", "RO", "NE",
+]
+
+
+def pseudo_names(rng, count, syllables):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(*syllables))))
+    return sorted(names)
+
+
+def national_rows(rng, doctors):
+    """
+    Grouped rows for ``doctors`` doctors: first and last names drawn with a
+    long tail, like real ones, so most full names belong to one doctor.
+    """
+    firsts = pseudo_names(rng, 40_000, (2, 4))
+    lasts = pseudo_names(rng, 400_000, (2, 5))
+    specialties = [f"SPECIALTY {number}" for number in range(90)]
+    cities = pseudo_names(rng, 20_000, (2, 5))
+    names, by_specialty, by_city = {}, {}, {}
+    for _ in range(doctors):
+        name = (firsts[int(rng.paretovariate(1.2)) % len(firsts)], rng.choice(lasts))
+        names[name] = names.get(name, 0) + 1
+        specialty = specialties[int(rng.paretovariate(1.0)) % len(specialties)]
+        by_specialty[specialty] = by_specialty.get(specialty, 0) + 1
+        city = cities[int(rng.paretovariate(0.8)) % len(cities)]
+        by_city[city] = by_city.get(city, 0) + 1
+    return {
+        "name": [(first, last, count) for (first, last), count in names.items()],
+        "specialization": list(by_specialty.items()),
+        "city": list(by_city.items()),
+    }
+
+
+def build_national(rows):
+    return {
+        "name": autocomplete.PrefixIndex(autocomplete.name_entries(rows["name"])),
+        **{field: autocomplete.PrefixIndex(autocomplete.value_entries(rows[field]))
+           for field in autocomplete.FIELDS[1:]},
+    }
+
+
+def keystrokes(rng, index, samples):
+    """
+    Every prefix typed on the way to ``samples`` random values of ``index``.
+    """
+    typed = []
+    for _ in range(samples):
+        value = index.keys[rng.randrange(len(index.keys))].decode()
+        typed.extend(value[:length] for length in range(1, len(value) + 1))
+    return typed
+
+
+def time_lookups(fields, rng, samples, write, label):
+    results = {}
+    for field, index in fields.items():
+        timings = []
+        for text in keystrokes(rng, index, samples):
+            started = time.perf_counter()
+            index.search(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        summary = summarize(timings)
+        summary.update(entries=len(index.keys), top_prefixes=len(index.top), mb=round(index.nbytes() / 2**20, 1))
+        write(f"{format_summary(f'{label} {field}', summary)}  {summary['entries']} entries, {summary['mb']} MB")
+        results[field] = summary
+    return results
+
+
+@scenario("autocomplete")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    rng = random.Random(18)
+    samples = options["repeat"] * 10
+    started = time.perf_counter()
+    built = autocomplete.build()
+    write(f"{'built from doctors':<44} {time.perf_counter() - started:>8.3f}s")
+    results = {"doctors": time_lookups(built.fields, rng, samples, write, "doctors")}
+
+    rows = national_rows(rng, NATIONAL_DOCTORS)
+    write(f"{'national-shaped distinct names':<44} {len(rows['name']):>8}")
+    tracemalloc.start()
+    started = time.perf_counter()
+    fields = build_national(rows)
+    seconds = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    write(f"{'national-shaped build':<44} {seconds:>8.3f}s  "
+          f"retained {retained / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB")
+    results["national"] = time_lookups(fields, rng, samples, write, "national")
+    results["national"].update(build_seconds=round(seconds, 3), retained_mb=round(retained / 2**20, 1),
+                               peak_mb=round(peak / 2**20, 1))
+    return results
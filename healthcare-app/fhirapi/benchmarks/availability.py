@@ -0,0 +1,131 @@
+"""
+Free-slot lookups with 10,000 scheduled doctors over a 30-day window: the
+set-wise availability query for one doctor and for a page of doctors, the
+``available_within`` filter, and, for comparison, probing every slot with
+its own query the way clients found a free time before.
+"""
+import datetime
+
+from django.db import connection
+
+from fhirapi.availability import free_slots, quote, slots_sql
+from fhirapi.models import Appointment, Doctor, DoctorSchedule, ScheduleException
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+SCHEDULED_DOCTORS = 10_000
+WINDOW_DAYS = 30
+DAY_OFF_SHARE = 0.05
+BOOKED_SHARE = 0.3
+PAGE = 100
+
+
+def seed_calendars(start, end):
+    """
+    Weekday schedules (09-12 and 13-17, 30-minute slots) for the first
+    SCHEDULED_DOCTORS doctors, a day off for about 5% of doctor-days and
+    about 30% of the remaining slots booked.
+    """
+    doctors = quote(Doctor._meta.db_table)
+    schedules = quote(DoctorSchedule._meta.db_table)
+    exceptions = quote(ScheduleException._meta.db_table)
+    appointments = quote(Appointment._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(0)")
+        cursor.execute(f"TRUNCATE {schedules}, {exceptions}, {appointments}")
+        cursor.execute(
+            f"""
+            INSERT INTO {schedules} (doctor_id, weekday, start_time, end_time, slot_minutes)
+            SELECT d.practitioner_id, weekday, block.starts, block.ends, 30
+            FROM (SELECT practitioner_id FROM {doctors} ORDER BY practitioner_id LIMIT %s) d,
+                 generate_series(0, 4) AS weekday,
+                 (VALUES (time '09:00', time '12:00'), (time '13:00', time '17:00')) AS block(starts, ends)
+            """,
+            [SCHEDULED_DOCTORS],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {exceptions} (doctor_id, date, reason)
+            SELECT doctor_id, day::date, 'day off'
+            FROM (SELECT DISTINCT doctor_id FROM {schedules}) s,
+                 generate_series(%s::timestamp, %s::timestamp, interval '1 day') AS day
+            WHERE random() < %s
+            """,
+            [start, end, DAY_OFF_SHARE],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {appointments} (appointment_id, doctor_id, patient_name, phone_number, email, reason,
+                                        appointment_date, appointment_time, created_at)
+            SELECT gen_random_uuid(), doctor_id, 'BENCHMARK', '+14155550100', 'patient@example.com', '',
+                   start::date, start::time, now()
+            FROM ({slots_sql("TRUE")}) free
+            WHERE random() < %s
+            """,
+            [start, end, start, end, datetime.datetime.combine(start, datetime.time()), BOOKED_SHARE],
+        )
+        cursor.execute(f"ANALYZE {schedules}")
+        cursor.execute(f"ANALYZE {exceptions}")
+        cursor.execute(f"ANALYZE {appointments}")
+        cursor.execute(f"SELECT (SELECT count(*) FROM {schedules}), (SELECT count(*) FROM {exceptions}), "
+                       f"(SELECT count(*) FROM {appointments})")
+        return cursor.fetchone()
+
+
+def probe_each_slot(doctor_id, start, end):
+    """
+    One query per candidate slot, as clients retrying bookings effectively did.
+    """
+    free = []
+    schedules = list(DoctorSchedule.objects.filter(doctor_id=doctor_id))
+    day = start
+    while day <= end:
+        for schedule in schedules:
+            if schedule.weekday != day.weekday():
+                continue
+            slot = datetime.datetime.combine(day, schedule.start_time)
+            last = datetime.datetime.combine(day, schedule.end_time) - datetime.timedelta(minutes=schedule.slot_minutes)
+            while slot <= last:
+                taken = Appointment.objects.filter(
+                    doctor_id=doctor_id, appointment_date=day, appointment_time=slot.time()
+                ).exists()
+                day_off = ScheduleException.objects.filter(doctor_id=doctor_id, date=day).exists()
+                if not (taken or day_off):
+                    free.append(slot)
+                slot += datetime.timedelta(minutes=schedule.slot_minutes)
+        day += datetime.timedelta(days=1)
+    return free
+
+
+@scenario("availability")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    today = datetime.date.today()
+    start = today + datetime.timedelta(days=7 - today.weekday())
+    end = start + datetime.timedelta(days=WINDOW_DAYS - 1)
+    now = datetime.datetime.combine(start, datetime.time())
+    schedules, days_off, booked = seed_calendars(start, end)
+    write(f"{schedules:,} schedule blocks, {days_off:,} days off, {booked:,} appointments from {start} to {end}")
+
+    ids = list(DoctorSchedule.objects.order_by("doctor_id").values_list("doctor_id", flat=True).distinct()[:PAGE])
+    week_end = start + datetime.timedelta(days=6)
+    assert probe_each_slot(ids[0], start, end) == free_slots(ids[:1], start, end, now)[ids[0]]
+
+    cases = {
+        "1 doctor, 30 days": lambda: free_slots(ids[:1], start, end, now),
+        "1 doctor, 30 days, query per slot": lambda: probe_each_slot(ids[0], start, end),
+        f"{PAGE} doctors, 7 days": lambda: free_slots(ids, start, week_end, now),
+        f"{PAGE} doctors, 30 days": lambda: free_slots(ids, start, end, now),
+        "filter: free next week, first page": lambda: list(
+            Doctor.objects.available(start, week_end).order_by_name()[:13]),
+        "filter: free next week, cardiology, first page": lambda: list(
+            Doctor.objects.filter_from_params({"specialization": "CARDIOVASCULAR DISEASE (CARDIOLOGY)"})
+            .available(start, week_end)[:13]),
+    }
+    results = {"rows": options["rows"], "scheduled_doctors": SCHEDULED_DOCTORS, "window_days": WINDOW_DAYS}
+    for label, func in cases.items():
+        results[label] = measure(func, options["repeat"])
+        write(format_summary(label, results[label]))
+    return results
@@ -0,0 +1,65 @@
+"""
+Practitioners per second through the batch endpoint against the same ids
+fetched one detail request at a time, for a few batch sizes. Requests go
+through Django's test client with a dummy cache, so every one reads the
+database and encodes its resources; HTTP round trips would only widen the
+gap.
+"""
+import random
+import time
+
+from django.test import Client, override_settings
+
+from fhirapi.models import Doctor
+
+from . import scenario, summarize
+from .synthetic import ensure_doctors
+
+DUMMY_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+BATCH_SIZES = (10, 50, 100)
+URL = "/api/doctors/batch/"
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request['PATH_INFO']} answered {response.status_code}")
+
+
+@scenario("batch")
+@override_settings(ALLOWED_HOSTS=["testserver"], DEBUG=False, CACHES=DUMMY_CACHE)
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    rng = random.Random(0)
+    ids = list(Doctor.objects.order_by("?").values_list("practitioner_id", flat=True)[:max(BATCH_SIZES) * 20])
+    client = Client()
+
+    def singles(batch):
+        for practitioner_id in batch:
+            check(client.get(f"/api/doctor/{practitioner_id}/"))
+
+    ways = {
+        "single requests": singles,
+        "batch GET": lambda batch: check(client.get(URL, {"ids": ",".join(batch)})),
+        "batch POST": lambda batch: check(client.post(URL, {"ids": batch}, content_type="application/json")),
+    }
+    results = {}
+    for size in BATCH_SIZES:
+        results[f"{size} ids"] = row = {}
+        for name, fetch in ways.items():
+            fetch(rng.sample(ids, size))
+            samples = [timed(lambda: fetch(rng.sample(ids, size))) for _ in range(options["repeat"])]
+            summary = summarize(samples)
+            summary["per_second"] = round(size / (summary["mean"] / 1000), 1)
+            row[name] = summary
+        speedup = row["batch GET"]["per_second"] / row["single requests"]["per_second"]
+        write(f"{size:>4} ids  " + "  ".join(f"{name} {summary['per_second']:>9.1f}/s"
+                                             for name, summary in row.items()) + f"  batch x{speedup:.1f}")
+        row["speedup"] = round(speedup, 2)
+    return results
@@ -0,0 +1,134 @@
+"""
+Booking throughput under contention: many threads booking distinct slots,
+many threads fighting over a few hot slots, and retries sharing an
+Idempotency-Key. The old check-then-save path is run on the hot slots for
+comparison; its lost races surface as IntegrityErrors (500s).
+"""
+import datetime
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, connection, transaction
+
+from fhirapi.booking import book
+from fhirapi.models import Appointment, Doctor, IdempotencyKey, OutboxMessage
+from fhirapi.serializers import AppointmentSerializer
+
+from . import scenario
+from .synthetic import ensure_doctors
+
+THREADS = 16
+HOT_SLOTS = 4
+# A Monday well after any seeded appointment.
+DAY = datetime.date(2031, 1, 6)
+
+
+def payloads(doctor_ids, slots_per_doctor, copies=1):
+    """
+    Booking requests for the first ``slots_per_doctor`` 15-minute slots of
+    DAY for each doctor, each repeated ``copies`` times.
+    """
+    start = datetime.datetime.combine(DAY, datetime.time(8))
+    requests = []
+    for doctor_id in doctor_ids:
+        for number in range(slots_per_doctor):
+            slot = start + datetime.timedelta(minutes=15 * number)
+            requests += [{
+                "doctor": doctor_id, "patient_name": "LOAD TEST", "phone_number": "+14155550101",
+                "email": "load@example.com", "reason": "benchmark",
+                "appointment_date": DAY.isoformat(), "appointment_time": slot.strftime("%H:%M"),
+            }] * copies
+    return requests
+
+
+def book_one(payload, key=None):
+    serializer = AppointmentSerializer(data=payload)
+    serializer.is_valid(raise_exception=True)
+    return book(serializer, key)[0]
+
+
+def legacy_book_one(payload, key=None):
+    """
+    What the view did before: the serializer's unique-together query, then
+    an INSERT that loses the race with an IntegrityError.
+    """
+    serializer = AppointmentSerializer(data=payload)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    slot = {name: data[name] for name in ("doctor", "appointment_date", "appointment_time")}
+    if Appointment.objects.filter(**slot).exists():
+        return 400
+    try:
+        with transaction.atomic():
+            Appointment.objects.create(**data)
+    except IntegrityError:
+        return 500
+    return 201
+
+
+def hammer(requests, threads=THREADS, attempt=book_one, keys=None):
+    """
+    Send ``requests`` from ``threads`` threads released at once, each on its
+    own connection. ``keys`` gives each request's Idempotency-Key. Returns
+    the status counts and the elapsed seconds.
+    """
+    keys = keys or [None] * len(requests)
+    barrier = threading.Barrier(threads)
+
+    def worker(share):
+        try:
+            barrier.wait()
+            return [attempt(payload, key) for payload, key in share]
+        finally:
+            connection.close()
+
+    work = list(zip(requests, keys))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = pool.map(worker, [work[offset::threads] for offset in range(threads)])
+        statuses = Counter(status for share in results for status in share)
+    return statuses, time.perf_counter() - started
+
+
+def report(write, label, requests, statuses, seconds):
+    booked = statuses.get(201, 0)
+    write(f"{label:<44} {requests:>6} requests in {seconds:>6.2f}s = {requests / seconds:>7,.0f} req/s, "
+          f"{booked / seconds:>7,.0f} bookings/s  {dict(sorted(statuses.items()))}")
+    return {"requests": requests, "seconds": round(seconds, 3), "statuses": dict(statuses),
+            "bookings_per_second": round(booked / seconds)}
+
+
+@scenario("booking")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    doctors = list(Doctor.objects.order_by("pk").values_list("pk", flat=True)[:THREADS])
+    results = {}
+
+    def clear():
+        Appointment.objects.filter(appointment_date=DAY).delete()
+        OutboxMessage.objects.filter(recipient="load@example.com").delete()
+
+    def case(name, label, requests, attempt=book_one, keys=None, expect=None):
+        clear()
+        statuses, seconds = hammer(requests, attempt=attempt, keys=keys)
+        results[name] = report(write, label, len(requests), statuses, seconds)
+        booked = Appointment.objects.filter(appointment_date=DAY).count()
+        if expect is not None and booked != expect:
+            write(f"  !! {booked} appointments for {expect} slots")
+        results[name]["appointments"] = booked
+
+    distinct = payloads(doctors, 40)
+    case("distinct_slots", "distinct slots", distinct, expect=len(distinct))
+    hot = payloads(doctors[:1], HOT_SLOTS, copies=200)
+    case("hot_slots", f"{HOT_SLOTS} hot slots, 200 requests each", hot, expect=HOT_SLOTS)
+    case("hot_slots_legacy", f"{HOT_SLOTS} hot slots, check-then-save (old path)", hot, attempt=legacy_book_one)
+    retried = payloads(doctors, 10, copies=3)
+    keys = [key for key in (str(uuid.uuid4()) for _ in range(len(retried) // 3)) for _ in range(3)]
+    case("idempotent_retries", "3 concurrent copies per Idempotency-Key", retried, keys=keys,
+         expect=len(retried) // 3)
+    clear()
+    IdempotencyKey.objects.filter(key__in=keys).delete()
+    return results
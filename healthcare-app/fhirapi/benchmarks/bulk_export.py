@@ -0,0 +1,48 @@
+"""
+$export throughput in resources per second as chunk serialization fans out
+over more worker processes (stand-ins for Celery workers).
+"""
+import multiprocessing
+import tempfile
+import time
+
+from django.db import connections
+from django.test import override_settings
+
+from fhirapi import bulk_export
+from fhirapi.models import ExportChunk, ExportJob
+
+from . import scenario
+from .synthetic import ensure_doctors
+
+CHUNK_SIZE = 10000
+WORKER_COUNTS = [1, 2, 4]
+
+
+def export_chunk(chunk_id):
+    return bulk_export.export_chunk(ExportChunk.objects.select_related("job").get(pk=chunk_id))
+
+
+@scenario("bulk_export")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    results = {}
+    with tempfile.TemporaryDirectory() as root, override_settings(FHIR_EXPORT_ROOT=root):
+        for workers in WORKER_COUNTS:
+            job = ExportJob.objects.create(request_url="benchmark", chunk_size=CHUNK_SIZE)
+            bulk_export.plan_chunks(job)
+            chunk_ids = list(job.chunks.values_list("pk", flat=True))
+
+            # Forked workers must open their own connections.
+            connections.close_all()
+            started = time.perf_counter()
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                resources = sum(pool.map(export_chunk, chunk_ids))
+            elapsed = time.perf_counter() - started
+
+            results[workers] = {"resources": resources, "seconds": round(elapsed, 3),
+                                "resources_per_second": round(resources / elapsed, 1)}
+            write(f"{workers} worker(s): {resources} resources in {elapsed:.2f}s "
+                  f"= {resources / elapsed:,.0f} resources/s")
+            bulk_export.cancel_job(job)
+    return results
@@ -0,0 +1,71 @@
+"""
+CSV versus the Parquet dataset as the hand-off between preprocessing and
+the loader: file size, write time, time to read every row back, full load
+time, and an incremental re-load after one state's rows change.
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from fhirapi import parquet
+from fhirapi.loading import DOCTOR_COLUMNS, iter_csv, load_doctors, load_parquet
+from fhirapi.models import DoctorImportFile
+
+from . import scenario
+from .loader import empty_doctors
+from .synthetic import generate_doctors
+
+
+def size_mb(path):
+    path = Path(path)
+    files = path.glob("*.parquet") if path.is_dir() else [path]
+    return round(sum(f.stat().st_size for f in files) / 2**20, 1)
+
+
+def timed(func):
+    started = time.perf_counter()
+    value = func()
+    return value, round(time.perf_counter() - started, 3)
+
+
+def write_parquet(df, directory):
+    writer = parquet.DatasetWriter(directory)
+    writer.write(df)
+    writer.close()
+
+
+@scenario("parquet")
+def run(options, write):
+    df = pd.DataFrame(generate_doctors(options["rows"]), columns=DOCTOR_COLUMNS, dtype=str)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, dataset = Path(directory) / "doctors.csv", Path(directory) / "doctors"
+
+        _, csv_write = timed(lambda: df.to_csv(csv_path, index=False))
+        _, parquet_write = timed(lambda: write_parquet(df, dataset))
+        _, csv_read = timed(lambda: sum(1 for _ in iter_csv(csv_path)))
+        files = sorted(parquet.read_manifest(dataset))
+        _, parquet_read = timed(lambda: sum(1 for _ in parquet.iter_rows(dataset, files, DOCTOR_COLUMNS)))
+
+        empty_doctors()
+        _, csv_load = timed(lambda: load_doctors(iter_csv(csv_path)))
+        empty_doctors()
+        DoctorImportFile.objects.all().delete()
+        _, parquet_load = timed(lambda: load_parquet(dataset))
+
+        df.loc[df["state"] == "NM", "phone"] = "5050000000"
+        write_parquet(df, dataset)
+        (_, changed), incremental = timed(lambda: load_parquet(dataset))
+
+        results = {
+            "csv": {"mb": size_mb(csv_path), "write_s": csv_write, "read_s": csv_read, "load_s": csv_load},
+            "parquet": {"mb": size_mb(dataset), "write_s": parquet_write, "read_s": parquet_read,
+                        "load_s": parquet_load, "incremental_load_s": incremental, "changed_files": changed},
+        }
+    for name, result in results.items():
+        write(f"{name:<8} {result['mb']:>7} MB  write {result['write_s']:>7.2f}s  "
+              f"read {result['read_s']:>7.2f}s  load {result['load_s']:>7.2f}s")
+    write(f"parquet re-load after one state changed ({', '.join(changed)}): {incremental:.2f}s")
+    return results
@@ -0,0 +1,58 @@
+"""
+Per-request database cost of the connection settings: reconnecting on every
+request (CONN_MAX_AGE = 0, the old default), a persistent connection with
+health checks, and psycopg's pool. Each request is what Django does around
+a view: request_started, one doctor detail query, request_finished.
+"""
+import copy
+
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+from fhirapi.models import Doctor
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+CONFIGS = {
+    "reconnect per request": {"CONN_MAX_AGE": 0},
+    "persistent, health checks": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True},
+    "pool (psycopg_pool)": {"CONN_MAX_AGE": 0, "OPTIONS": {"pool": {"min_size": 1, "max_size": 4}}},
+}
+
+
+def add_alias(alias, overrides):
+    settings_dict = copy.deepcopy(connections["default"].settings_dict)
+    settings_dict.update(overrides)
+    connections.settings[alias] = settings_dict
+    return alias
+
+
+def request(alias, practitioner_id):
+    request_started.send(sender=None)
+    try:
+        Doctor.objects.using(alias).filter(practitioner_id=practitioner_id).values("first_name").first()
+    finally:
+        request_finished.send(sender=None)
+
+
+@scenario("connections")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    practitioner_id = Doctor.objects.values_list("practitioner_id", flat=True).first()
+    results = {}
+    for number, (label, overrides) in enumerate(CONFIGS.items()):
+        alias = add_alias(f"bench_connections_{number}", overrides)
+        try:
+            summary = measure(lambda: request(alias, practitioner_id), repeat=options["repeat"] * 20)
+        finally:
+            connections[alias].close()
+            connections[alias].close_pool()
+            del connections[alias]
+            del connections.settings[alias]
+        write(format_summary(label, summary))
+        results[label] = summary
+    baseline = results["reconnect per request"]["p50"]
+    for label, summary in results.items():
+        write(f"{label:<44} saves {baseline - summary['p50']:>7.3f}ms per request")
+    return results
@@ -0,0 +1,57 @@
+"""
+Peak Python heap while exporting the whole table: the streaming export
+endpoint versus DoctorListView's single serialized list.
+"""
+import time
+import tracemalloc
+
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory
+
+from fhirapi.views import DoctorListView, doctor_export
+
+from . import scenario
+from .synthetic import ensure_doctors
+
+LEGACY_MAX_ROWS = 200_000
+
+
+def profile(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bytes": size, "seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 2)}
+
+
+def streaming_export(export_format):
+    def run():
+        response = doctor_export(RequestFactory().get("/api/doctors/export/", {"format": export_format}))
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return run
+
+
+def list_view():
+    response = DoctorListView.as_view()(APIRequestFactory().get("/api/doctors/"))
+    response.render()
+    return len(response.content)
+
+
+@scenario("export")
+def run(options, write):
+    results = {}
+    for rows in sorted({10_000, 100_000, options["rows"]}):
+        ensure_doctors(rows)
+        measured = {
+            "ndjson": profile(streaming_export("ndjson")),
+            "json": profile(streaming_export("json")),
+        }
+        if rows <= LEGACY_MAX_ROWS:
+            measured["list_view"] = profile(list_view)
+        results[rows] = measured
+        for name, stats in measured.items():
+            write(f"{rows:>9} rows  {name:<10} peak={stats['peak_mb']:>8.2f}MB  "
+                  f"{stats['seconds']:>7.2f}s  {rows / stats['seconds']:>9.0f} rows/s")
+    return results
@@ -0,0 +1,64 @@
+"""
+Facet counts: the admin list filters' five SELECT DISTINCT scans versus
+reading their choices from ``doctor_facets``, the facet endpoint's
+precomputed counts versus grouping every doctor live, filtered counts
+summed from doctor_facet_cells (or, for name filters, still grouped live)
+versus grouped from the doctors, and what a refresh costs.
+"""
+from fhirapi import facets
+from fhirapi.models import Doctor, DoctorFacet, DoctorFacetCell
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+ADMIN_FIELDS = ("specialization", "state", "city", "zip_code")
+FILTERS = [
+    {"state": "ca"},
+    {"specialization": "cardio"},
+    {"specialization": "internal", "state": "ny"},
+    {"last_name": "patel"},
+]
+
+
+def legacy_admin_choices():
+    """
+    The old lookups(): DISTINCT ... ORDER BY ... LIMIT 100 per filter.
+    """
+    list(Doctor.objects.values_list("first_name", "last_name").distinct().order_by("first_name")[:100])
+    for field in ADMIN_FIELDS:
+        list(Doctor.objects.with_names().values_list(field, flat=True).distinct().order_by(field)[:100])
+
+
+def admin_choices():
+    for field in ("name", *ADMIN_FIELDS):
+        facets.choices(field)
+
+
+@scenario("facets")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    DoctorFacet.objects.all().delete()
+    DoctorFacetCell.objects.all().delete()
+    full = facets.refresh_facets()
+    write(f"{'full refresh':<44} {full.seconds:>8.3f}s  {full.inserted} cells and facet rows")
+    unchanged = facets.refresh_facets()
+    write(f"{'refresh, nothing changed':<44} {unchanged.seconds:>8.3f}s  {unchanged.changed} rows written")
+
+    repeat = options["repeat"]
+    cases = {
+        "admin filters, DISTINCT scans": legacy_admin_choices,
+        "admin filters, doctor_facets": admin_choices,
+        "facets, grouped live": lambda: facets.grouped(Doctor.objects.all()),
+        "facets, precomputed": facets.precomputed,
+    }
+    for params in FILTERS:
+        query = " ".join(f"{key}={value}" for key, value in params.items())
+        cases[f"{query}, grouped live"] = lambda params=params: facets.grouped(Doctor.objects.apply_filters(params))
+        cases[f"{query}, counts()"] = lambda params=params: facets.counts(params)
+
+    results = {"refresh_seconds": full.seconds, "unchanged_refresh_seconds": unchanged.seconds}
+    for label, func in cases.items():
+        summary = measure(func, repeat=repeat)
+        write(format_summary(label, summary))
+        results[label] = summary
+    return results
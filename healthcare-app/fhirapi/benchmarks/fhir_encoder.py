@@ -0,0 +1,102 @@
+"""
+Practitioner encoding: the original pydantic detail path (to_fhir() raising
+on 'specialty', then a hand-built fallback), pydantic validation of the same
+resource, and the dict encoder. Also measures the detail endpoint end to end.
+"""
+import time
+
+from fhir.resources.address import Address
+from fhir.resources.contactpoint import ContactPoint
+from fhir.resources.humanname import HumanName
+from fhir.resources.practitioner import Practitioner
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from fhirapi.fhir import practitioner_json
+from fhirapi.models import Doctor, Specialty
+from fhirapi.serializers import DOCTOR_FIELDS
+from fhirapi.views import DoctorDetailView
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors, generate_doctors
+
+
+def legacy_detail(doctor):
+    """
+    What DoctorDetailView did per request before the encoder existed.
+    """
+    try:
+        practitioner = Practitioner.construct()
+        practitioner.id = doctor.practitioner_id
+        practitioner.name = [HumanName(use="official", family=doctor.last_name, given=[doctor.first_name])]
+        practitioner.telecom = [ContactPoint(system="phone", value=doctor.phone)]
+        practitioner.address = [Address(line=[doctor.address], city=doctor.city, state=doctor.state,
+                                        postalCode=doctor.zip_code)]
+        practitioner.specialty = [{"coding": [{"system": "http://hl7.org/fhir/specialty",
+                                               "code": doctor.specialization}]}]
+        return practitioner.dict()
+    except Exception as e:
+        return {
+            "resourceType": "Practitioner",
+            "id": str(doctor.practitioner_id),
+            "name": [{"family": doctor.last_name or "", "given": [doctor.first_name]}],
+            "telecom": [{"system": "phone", "value": str(doctor.phone)},
+                        {"system": "email", "value": str(doctor.email)}],
+            "qualification": [{"code": {"coding": [{
+                "system": "http://terminology.hl7.org/CodeSystem/practitioner-role",
+                "code": str(doctor.specialization).upper().replace(" ", "_"),
+                "display": str(doctor.specialization),
+            }]}}],
+            "_note": "original to_fhir() failed: {}".format(str(e)),
+        }
+
+
+class LegacyDetailView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, practitioner_id):
+        return Response(legacy_detail(Doctor.objects.get(practitioner_id=practitioner_id)))
+
+
+def per_second(func, items):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return len(items) / (time.perf_counter() - started)
+
+
+@scenario("fhir_encoder")
+def run(options, write):
+    fields = [dict(zip(DOCTOR_FIELDS, values)) for values in generate_doctors(min(options["rows"], 20000))]
+    rows = [dict(row, specialty_code=Specialty.code_for(row["specialization"])) for row in fields]
+    doctors = [Doctor(**row) for row in fields]
+
+    results = {
+        "legacy_pydantic": per_second(legacy_detail, doctors),
+        "pydantic_validate": per_second(lambda row: Practitioner.model_validate(practitioner_json(row))
+                                        .model_dump(mode="json", exclude_none=True), rows),
+        "dict_encoder": per_second(practitioner_json, rows),
+    }
+    for name, rate in results.items():
+        write(f"{name:<20} {rate:>12,.0f} resources/s")
+
+    ensure_doctors(10000)
+    request = APIRequestFactory().get("/api/doctor/1000000042/")
+
+    def requester(view):
+        def detail_request():
+            view(request, practitioner_id="1000000042").render()
+        return detail_request
+
+    endpoints = (
+        ("detail_endpoint_legacy", LegacyDetailView.as_view()),
+        ("detail_endpoint", DoctorDetailView.as_view()),
+    )
+    for name, view in endpoints:
+        summary = measure(requester(view), options["repeat"])
+        results[name] = summary
+        write(format_summary(name, summary))
+        write(f"{name} ~{1000 / summary['mean']:,.0f} requests/s (single thread)")
+    return results
@@ -0,0 +1,119 @@
+"""
+Proximity search latency on the national-size table: first pages and deep
+cursor pages of ``near_zip`` / ``lat``+``lon`` queries.
+
+Results are read from the GiST index nearest first, so a page costs about
+as many rows as it returns plus every doctor tied with its last row; a deep
+cursor page also skips over the rows before it.
+Two layouts are measured. "clustered" jitters doctors around their city
+onto a 0.01 degree grid, a few to a few dozen doctors per point as with
+real ZIP centroids. "centroid" puts all of a city's ~20,000 synthetic
+doctors on one point: every page has to read the whole tie, which is the
+worst case for the (distance, id) order.
+"""
+from django.db import connection
+
+from fhirapi.geo import geocode_doctors
+from fhirapi.models import Doctor, ZipCentroid, nearest_first_scans
+from fhirapi.pagination import seek_filter
+
+from . import format_summary, measure, scenario
+from .synthetic import LOCATIONS, ensure_doctors
+
+PAGE_SIZE = 12
+DEPTHS = [0, 100]
+TARGET_P99_MS = 50
+CLUSTER_BATCH = 50000
+
+# Approximate ZIP centroids for the synthetic LOCATIONS.
+COORDINATES = {
+    "94107": (37.765, -122.396), "90012": (34.061, -118.239), "92101": (32.719, -117.163),
+    "95814": (38.580, -121.494), "98101": (47.611, -122.334), "97201": (45.508, -122.690),
+    "85004": (33.451, -112.069), "89101": (36.172, -115.122), "80202": (39.753, -104.999),
+    "84101": (40.756, -111.901), "75201": (32.790, -96.804), "77002": (29.757, -95.365),
+    "78701": (30.271, -97.743), "78205": (29.424, -98.486), "73102": (35.471, -97.519),
+    "64106": (39.105, -94.572), "63101": (38.631, -90.193), "55401": (44.984, -93.269),
+    "60601": (41.886, -87.623), "53202": (43.050, -87.898), "48226": (42.331, -83.047),
+    "43215": (39.967, -83.011), "44113": (41.482, -81.700), "46204": (39.772, -86.157),
+    "37203": (36.150, -86.790), "38103": (35.153, -90.053), "30303": (33.753, -84.390),
+    "33130": (25.767, -80.205), "32801": (28.540, -81.378), "33602": (27.954, -82.457),
+    "28202": (35.228, -80.843), "27601": (35.773, -78.634), "23219": (37.540, -77.435),
+    "21201": (39.295, -76.625), "20001": (38.910, -77.018), "19103": (39.953, -75.174),
+    "15222": (40.449, -79.990), "07102": (40.736, -74.176), "10001": (40.751, -73.997),
+    "11201": (40.694, -73.990), "14202": (42.887, -78.878), "02108": (42.358, -71.064),
+    "02903": (41.819, -71.410), "06103": (41.767, -72.676), "70112": (29.957, -90.077),
+    "35203": (33.520, -86.809), "40202": (38.254, -85.751), "68102": (41.262, -95.932),
+    "87102": (35.082, -106.648), "96813": (21.303, -157.858),
+}
+QUERIES = [
+    {"near_zip": "94107", "radius": "10"},
+    {"near_zip": "94107", "radius": "25", "specialization": "CARDIOVASCULAR DISEASE (CARDIOLOGY)"},
+    {"near_zip": "10001", "radius": "25"},
+    {"lat": "38.5", "lon": "-98.0", "radius": "100"},
+]
+
+
+def label_for(params):
+    return "&".join(f"{key}={value}" for key, value in params.items())
+
+
+def run_queries(layout, options, write):
+    results = {}
+    for params in QUERIES:
+        queryset = Doctor.objects.filter_from_params(params)
+        ordering = [str(term) for term in queryset.query.order_by]
+        for depth in DEPTHS:
+            offset = depth * PAGE_SIZE
+            fields = [term.lstrip("-") for term in ordering]
+            boundary = queryset.values_list(*fields)[offset - 1:offset].first() if offset else None
+            if offset and boundary is None:
+                break
+
+            def keyset_page():
+                seeked = queryset.filter(seek_filter(ordering, boundary)) if boundary else queryset
+                with nearest_first_scans():
+                    list(seeked[:PAGE_SIZE + 1])
+
+            label = f"{layout} {label_for(params)} page {depth}"
+            results[label] = measure(keyset_page, options["repeat"])
+            flag = "" if results[label]["p99"] <= TARGET_P99_MS else "  over target"
+            write(format_summary(label, results[label]) + flag)
+    return results
+
+
+@scenario("geo")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    assert {zip5 for _, _, zip5 in LOCATIONS} <= set(COORDINATES)
+    ZipCentroid.objects.all().delete()
+    ZipCentroid.objects.bulk_create(
+        ZipCentroid(zip_code=zip_code, latitude=lat, longitude=lon) for zip_code, (lat, lon) in COORDINATES.items()
+    )
+    write(f"geocoded {geocode_doctors(only_missing=False):,} doctors")
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE doctors")
+    results = {"rows": options["rows"], "target_p99_ms": TARGET_P99_MS}
+    results["zip_centroid"] = run_queries("centroid", options, write)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(0)")
+        # Synthetic ids are equal-length numbers, so string ranges are id ranges.
+        cursor.execute("SELECT min(practitioner_id), max(practitioner_id) FROM doctors")
+        low, high = (int(value) for value in cursor.fetchone())
+        for start in range(low, high + 1, CLUSTER_BATCH):
+            cursor.execute(
+                """
+                UPDATE doctors d
+                SET latitude = round((z.latitude + (random() + random() + random() - 1.5) * 0.2)::numeric, 2),
+                    longitude = round((z.longitude + (random() + random() + random() - 1.5) * 0.25)::numeric, 2)
+                FROM zip_centroids z
+                WHERE z.zip_code = left(d.zip_code, 5) AND d.practitioner_id BETWEEN %s AND %s
+                """,
+                [str(start), str(start + CLUSTER_BATCH - 1)],
+            )
+        cursor.execute("ANALYZE doctors")
+    results["clustered"] = run_queries("clustered", options, write)
+    # Leave the table geocoded the way the loader would.
+    geocode_doctors(only_missing=False)
+    return results
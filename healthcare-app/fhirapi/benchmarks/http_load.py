@@ -0,0 +1,194 @@
+"""
+HTTP load against real servers: the WSGI app under gunicorn (threaded
+workers) and the ASGI app under uvicorn, each serving both the DRF routes
+and the async ``/api/async/`` routes, with CONNECTIONS keep-alive
+connections open at once. Requests mix doctor detail pages and filter
+pages over enough distinct URLs that most miss the response cache. A
+third run books appointments, every request for a different slot.
+
+The load generator is an asyncio HTTP/1.1 client in this process, so on a
+small machine it competes with the servers for CPU; compare deployments
+against each other rather than reading the numbers as absolute capacity.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.db import connection
+
+from fhirapi.models import Appointment, Doctor, Location, OutboxMessage
+
+from . import format_summary, scenario, summarize
+from .booking import DAY, payloads
+from .synthetic import ensure_doctors
+
+CONNECTIONS = 500
+DURATION = 20
+WORKERS = 2
+THREADS = 16
+HOST = "127.0.0.1"
+REQUEST_TIMEOUT = 30
+BASE_DIR = Path(__file__).resolve().parents[2]
+DEPLOYMENTS = {
+    "wsgi": lambda port: [
+        sys.executable, "-m", "gunicorn", "backend.wsgi:application", "--bind", f"{HOST}:{port}",
+        "--workers", str(WORKERS), "--threads", str(THREADS), "--backlog", "2048", "--log-level", "warning",
+    ],
+    "asgi": lambda port: [
+        sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", HOST, "--port", str(port),
+        "--workers", str(WORKERS), "--backlog", "2048", "--log-level", "warning",
+    ],
+}
+ROUTES = {
+    "sync": ("/api/doctor/{}/", "/api/doctors/filter/?state={}&page={}"),
+    "async": ("/api/async/doctor/{}/", "/api/async/doctors/filter/?state={}&page={}"),
+}
+BOOKING_PATH = "/api/appointments/create/"
+BOOKED_DOCTORS = 2000
+SLOTS_PER_DOCTOR = 32
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+def start_server(deployment, port):
+    env = {**os.environ, "DATABASE_NAME": connection.settings_dict["NAME"]}
+    process = subprocess.Popen(DEPLOYMENTS[deployment](port), cwd=BASE_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{deployment} server did not start on port {port}")
+
+
+def request_paths(routes, ids, states, seed=0):
+    """
+    Endless ``(method, path, body)`` reads, half detail and half filter pages.
+    """
+    detail, listing = routes
+    rng = random.Random(seed)
+    while True:
+        if rng.random() < 0.5:
+            yield "GET", detail.format(rng.choice(ids)), b""
+        else:
+            yield "GET", listing.format(rng.choice(states), rng.randint(1, 20)), b""
+
+
+def booking_requests(ids):
+    """
+    ``(method, path, body)`` bookings of distinct slots, shared by every
+    client so no two ask for the same one.
+    """
+    for payload in payloads(ids[:BOOKED_DOCTORS], SLOTS_PER_DOCTOR):
+        yield "POST", BOOKING_PATH, json.dumps(payload).encode()
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def client(port, requests, deadline, latencies, outcomes):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(HOST, port)
+            method, path, body = next(requests)
+            head = f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\nAccept: application/json\r\n"
+            if body:
+                head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            started = time.perf_counter()
+            writer.write(head.encode() + b"\r\n" + body)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT)
+            latencies.append((time.perf_counter() - started) * 1000)
+            outcomes[status] = outcomes.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except StopIteration:
+            break
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError) as error:
+            outcomes[type(error).__name__] = outcomes.get(type(error).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, requests_for):
+    """
+    Run CONNECTIONS clients for DURATION seconds, client ``number`` sending
+    ``requests_for(number)``.
+    """
+    latencies, outcomes = [], {}
+    deadline = time.monotonic() + DURATION
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(port, requests_for(number), deadline, latencies, outcomes) for number in range(CONNECTIONS)
+    ))
+    return latencies, outcomes, time.perf_counter() - started
+
+
+def clear_bookings():
+    Appointment.objects.filter(appointment_date=DAY).delete()
+    OutboxMessage.objects.filter(recipient="load@example.com").delete()
+
+
+def report(write, results, name, label, run, ok_status):
+    latencies, outcomes, seconds = run
+    summary = summarize(latencies)
+    ok = outcomes.get(ok_status, 0)
+    write(f"{format_summary(label, summary)}  {ok / seconds:>7,.0f} req/s  {outcomes}")
+    results[name] = {**summary, "requests_per_second": round(ok / seconds), "outcomes": outcomes}
+
+
+@scenario("http_load")
+def run(options, write):
+    ensure_doctors(options["rows"])
+    ids = list(Doctor.objects.order_by("?").values_list("practitioner_id", flat=True)[:20000])
+    states = sorted(set(Location.objects.values_list("state", flat=True).distinct()))
+    results = {}
+    for deployment in DEPLOYMENTS:
+        port = free_port()
+        server = start_server(deployment, port)
+        try:
+            for route, paths in ROUTES.items():
+                run = asyncio.run(load(port, lambda number: request_paths(paths, ids, states, seed=number)))
+                report(write, results, f"{deployment}_{route}",
+                       f"{deployment}, {route} views, {CONNECTIONS} connections", run, 200)
+            clear_bookings()
+            bookings = booking_requests(ids)
+            run = asyncio.run(load(port, lambda number: bookings))
+            report(write, results, f"{deployment}_booking",
+                   f"{deployment}, bookings, {CONNECTIONS} connections", run, 201)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    clear_bookings()
+    return results
@@ -0,0 +1,98 @@
+"""
+Doctor refresh throughput: the original per-row ``update_or_create`` loop
+versus the COPY + delta-sync loader, on a fresh table, on a re-run where
+nothing changed, on a re-run where 1% of doctors changed, and with indexes
+dropped during the merge. WAL written per run is reported alongside.
+"""
+import time
+
+from django.db import connection
+
+from fhirapi.loading import DOCTOR_COLUMNS, copy_rows, create_source_table, iter_table, load_doctors
+from fhirapi.models import Doctor
+
+from . import scenario
+from .synthetic import generate_doctors
+
+SOURCE_TABLE = "benchmark_external_doctors"
+LEGACY_MAX_ROWS = 20_000
+
+
+def legacy_load(table):
+    """
+    The loop ``load_external_doctors_postgre`` used before the bulk loader.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(DOCTOR_COLUMNS)} FROM {table}")
+        rows = cursor.fetchall()
+    for row in rows:
+        Doctor.objects.update_or_create(practitioner_id=row[0], defaults=dict(zip(DOCTOR_COLUMNS[1:], row[1:])))
+    return len(rows)
+
+
+def prepare_source(rows):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {SOURCE_TABLE}")
+    create_source_table(SOURCE_TABLE)
+    copy_rows(generate_doctors(rows, seed=7), SOURCE_TABLE)
+
+
+def empty_doctors():
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {connection.ops.quote_name(Doctor._meta.db_table)} CASCADE")
+
+
+def report(write, label, rows, seconds, wal_bytes):
+    write(f"{label:<44} {rows:>9,} rows in {seconds:>8.2f}s = {rows / seconds:>10,.0f} rows/s  "
+          f"WAL {wal_bytes / 2**20:>8.1f} MB")
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds),
+            "wal_bytes": wal_bytes}
+
+
+def wal_position():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()")
+        return cursor.fetchone()[0]
+
+
+def timed(func):
+    with connection.cursor() as cursor:
+        start = wal_position()
+        started = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - started
+        cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", [start])
+        return rows, elapsed, int(cursor.fetchone()[0])
+
+
+@scenario("loader")
+def run(options, write):
+    results = {}
+    legacy_rows = min(options["rows"], LEGACY_MAX_ROWS)
+
+    prepare_source(legacy_rows)
+    empty_doctors()
+    results["legacy_fresh"] = report(write, "update_or_create loop, empty table", *timed(lambda: legacy_load(SOURCE_TABLE)))
+    results["legacy_rerun"] = report(write, "update_or_create loop, unchanged re-run", *timed(lambda: legacy_load(SOURCE_TABLE)))
+
+    prepare_source(options["rows"])
+    batch_size = 50000
+
+    def bulk(drop_indexes=False):
+        return lambda: load_doctors(
+            iter_table(SOURCE_TABLE, batch_size), batch_size, drop_indexes, delete_missing=True
+        ).copied
+
+    empty_doctors()
+    results["copy_fresh"] = report(write, "COPY + delta sync, empty table", *timed(bulk()))
+    results["copy_rerun"] = report(write, "COPY + delta sync, unchanged re-run", *timed(bulk()))
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {SOURCE_TABLE} SET phone = '5550000000' WHERE right(practitioner_id, 2) = '00'")
+    results["copy_one_percent"] = report(write, "COPY + delta sync, 1% changed", *timed(bulk()))
+    empty_doctors()
+    results["copy_fresh_drop_indexes"] = report(write, "COPY + delta sync --drop-indexes, empty table",
+                                                *timed(bulk(True)))
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {SOURCE_TABLE}")
+    return results
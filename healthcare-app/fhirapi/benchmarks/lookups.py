@@ -0,0 +1,70 @@
+"""
+Size of the doctors table and its indexes, with the specialty and location
+reference tables, and latency of the filters that go through them.
+"""
+from django.db import connection
+
+from fhirapi.models import Doctor
+
+from . import format_summary, measure, scenario
+from .search import label_for, page_runner
+from .synthetic import ensure_doctors
+
+TABLES = ("doctors", "specialties", "locations")
+QUERIES = [
+    {"specialization": "cardio"},
+    {"specialization": "INTERNAL MEDICINE"},
+    {"city": "francisco"},
+    {"state": "ca"},
+    {"specialization": "internal", "state": "ny"},
+    {"specialization": "family", "city": "boston"},
+]
+
+
+def relation_sizes():
+    """
+    Heap and per-index size in bytes of every table in TABLES that exists.
+    """
+    sizes = {}
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+            if not cursor.fetchone()[0]:
+                continue
+            cursor.execute(
+                """
+                SELECT pg_relation_size(%s::regclass), c.relname, pg_relation_size(i.indexrelid)
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = %s::regclass ORDER BY c.relname
+                """,
+                [table, table],
+            )
+            rows = cursor.fetchall()
+            sizes[table] = {"heap": rows[0][0] if rows else 0, "indexes": {name: size for _, name, size in rows}}
+    return sizes
+
+
+def megabytes(size):
+    return f"{size / 2**20:>9.1f} MB"
+
+
+@scenario("lookups")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    with connection.cursor() as cursor:
+        cursor.execute(f"VACUUM ANALYZE {', '.join(TABLES)}")
+
+    sizes = relation_sizes()
+    for table, size in sizes.items():
+        write(f"{table + ' heap':<44} {megabytes(size['heap'])}")
+        for name, index in size["indexes"].items():
+            write(f"  {name:<42} {megabytes(index)}")
+        write(f"{table + ' indexes':<44} {megabytes(sum(size['indexes'].values()))}")
+
+    results = {"rows": options["rows"], "sizes": sizes, "filters": {}}
+    for params in QUERIES:
+        summary = measure(page_runner(Doctor.objects.filter_from_params(params)), options["repeat"])
+        results["filters"][label_for(params)] = summary
+        write(format_summary(label_for(params), summary))
+    return results
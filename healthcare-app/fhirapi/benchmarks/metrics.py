@@ -0,0 +1,83 @@
+"""
+Overhead of the metrics middleware: the same requests through Django's
+test client with and without ``MetricsMiddleware``, interleaved so drift
+hits both alike. Served from the response cache, the cheapest requests
+there are, and with a dummy cache so every request reads the database.
+"""
+import gc
+import random
+import time
+
+from django.conf import settings
+from django.test import Client, override_settings
+
+from fhirapi.models import Doctor, Location
+
+from . import scenario, summarize
+from .synthetic import ensure_doctors
+
+MIDDLEWARE = "fhirapi.metrics.MetricsMiddleware"
+DUMMY_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+PATHS = 200
+ROUNDS_PER_REPEAT = 40
+
+
+def client_with(middleware):
+    client = Client()
+    # The handler builds its middleware chain on its first request.
+    with override_settings(MIDDLEWARE=middleware):
+        client.get("/api/")
+    return client
+
+
+def interleaved(clients, paths, rounds):
+    samples = {name: [] for name in clients}
+    # Collections land on whichever client happens to be running; keep them out.
+    gc.collect()
+    gc.disable()
+    try:
+        for number in range(rounds):
+            path = paths[number % len(paths)]
+            for name, client in (clients.items() if number % 2 else reversed(clients.items())):
+                started = time.perf_counter()
+                response = client.get(path, HTTP_ACCEPT="application/json")
+                samples[name].append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} answered {response.status_code}")
+    finally:
+        gc.enable()
+    return samples
+
+
+@scenario("metrics")
+@override_settings(ALLOWED_HOSTS=["testserver"], DEBUG=False)
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    rng = random.Random(0)
+    ids = list(Doctor.objects.order_by("?").values_list("practitioner_id", flat=True)[:PATHS])
+    states = sorted(set(Location.objects.exclude(state=None).values_list("state", flat=True)))
+    workloads = {
+        "detail": [f"/api/doctor/{pk}/" for pk in ids],
+        "filter": [f"/api/doctors/filter/?state={rng.choice(states)}&page={rng.randint(1, 5)}" for _ in ids],
+    }
+    clients = {
+        "with metrics": client_with(settings.MIDDLEWARE),
+        "without": client_with([name for name in settings.MIDDLEWARE if name != MIDDLEWARE]),
+    }
+    rounds = options["repeat"] * ROUNDS_PER_REPEAT
+
+    results = {}
+    for cached in (True, False):
+        for workload, paths in workloads.items():
+            label = f"{workload}, {'cached' if cached else 'uncached'}"
+            with override_settings(**({} if cached else {"CACHES": DUMMY_CACHE})):
+                interleaved(clients, paths, len(paths) * 2)
+                samples = interleaved(clients, paths, rounds)
+            summaries = {name: summarize(values) for name, values in samples.items()}
+            with_metrics, without = summaries["with metrics"], summaries["without"]
+            overhead = (with_metrics["mean"] - without["mean"]) / without["mean"] * 100
+            write(f"{label:<22} mean {without['mean']:>8.3f}ms -> {with_metrics['mean']:>8.3f}ms  "
+                  f"p50 {without['p50']:>8.3f}ms -> {with_metrics['p50']:>8.3f}ms  overhead {overhead:+.2f}%")
+            results[label] = {**summaries, "overhead_percent": round(overhead, 2)}
+    return results
@@ -0,0 +1,83 @@
+"""
+Microbenchmarks of the code under the doctor endpoints, each timed on its
+own: building and running filters (``apply_filters``), name ordering
+(``order_by_name``), Practitioner encoding (``Doctor.to_fhir``,
+``DoctorSerializer.to_fhir``, ``practitioner_json``), the DRF
+serializers over a page of doctors or a booking payload, and for each page
+size the filter view's page before and after the lean read path: model
+instances through DoctorSerializer against ``.values()`` rows through
+``row_serializer``, with every field and with ``?fields=first_name,city``.
+"""
+from fhirapi.fhir import PRACTITIONER_FIELDS, practitioner_json
+from fhirapi.models import Doctor
+from fhirapi.serializers import DOCTOR_FIELDS, AppointmentSerializer, DoctorSerializer, row_serializer
+
+from . import format_summary, measure, scenario
+from .booking import payloads
+from .search import label_for
+from .synthetic import ensure_doctors
+
+FILTERS = [
+    {"specialization": "cardio"},
+    {"state": "ca", "city": "francisco"},
+    {"last_name": "pat"},
+    {"zip_code": "941"},
+    {"q": "internal medicine boston"},
+]
+PAGE_SIZES = (12, 50, 100)
+SPARSE_FIELDS = ("first_name", "city")
+# Rows encoded per timed call in the to_fhir group.
+ENCODED = 100
+DEPTHS = (0, 100)
+
+
+@scenario("micro")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+    results = {"apply_filters": {}, "order_by_name": {}, "to_fhir": {}, "serializers": {}, "pages": {}}
+
+    def record(group, label, func):
+        results[group][label] = summary = measure(func, options["repeat"])
+        write(format_summary(f"{group}: {label}", summary))
+
+    for params in FILTERS:
+        record("apply_filters", f"build {label_for(params)}",
+               lambda: Doctor.objects.apply_filters(params).query.sql_with_params())
+        record("apply_filters", f"first page {label_for(params)}",
+               lambda: list(Doctor.objects.filter_from_params(params)[:PAGE_SIZES[0]]))
+
+    for sort in ("asc", "desc"):
+        for depth in DEPTHS:
+            offset = depth * PAGE_SIZES[0]
+            record("order_by_name", f"{sort} page {depth}",
+                   lambda: list(Doctor.objects.order_by_name(sort)[offset:offset + PAGE_SIZES[0]]))
+
+    doctors = list(Doctor.objects.select_related("specialty", "location").order_by("pk")[:ENCODED])
+    rows = list(Doctor.objects.with_names().order_by("pk").values(*PRACTITIONER_FIELDS)[:ENCODED])
+    record("to_fhir", f"Doctor.to_fhir x{ENCODED}", lambda: [doctor.to_fhir() for doctor in doctors])
+    record("to_fhir", f"DoctorSerializer.to_fhir x{ENCODED}",
+           lambda: [DoctorSerializer(doctor).to_fhir() for doctor in doctors])
+    record("to_fhir", f"practitioner_json x{ENCODED}", lambda: [practitioner_json(row) for row in rows])
+
+    for size in PAGE_SIZES:
+        page = doctors[:size]
+        record("serializers", f"DoctorSerializer page of {len(page)}",
+               lambda: DoctorSerializer(page, many=True).data)
+        for fields in (DOCTOR_FIELDS, SPARSE_FIELDS):
+            serialize = row_serializer(fields)
+            values = [{field: row[field] for field in fields} for row in rows[:size]]
+            record("serializers", f"row_serializer page of {len(values)}, {len(fields)} fields",
+                   lambda: [serialize(row) for row in values])
+
+    doctors_by_name = Doctor.objects.filter_from_params({})
+    for size in PAGE_SIZES:
+        record("pages", f"page of {size}, model instances + DoctorSerializer",
+               lambda: DoctorSerializer(doctors_by_name[:size], many=True).data)
+        for fields in (DOCTOR_FIELDS, SPARSE_FIELDS):
+            serialize = row_serializer(fields)
+            record("pages", f"page of {size}, .values() + row_serializer, {len(fields)} fields",
+                   lambda: [serialize(row) for row in doctors_by_name.select_fields(fields)[:size]])
+    booking = payloads([doctors[0].pk], 1)[0]
+    record("serializers", "AppointmentSerializer validate", lambda: AppointmentSerializer(data=booking).is_valid())
+    return results
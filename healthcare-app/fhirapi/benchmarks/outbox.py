@@ -0,0 +1,115 @@
+"""
+Confirmation email throughput against an in-process SMTP sink: the old
+task's one connection per message versus the outbox dispatcher's batches
+over one connection, with the sink answering at once and with a 20 ms
+greeting standing in for a remote relay's round trips and TLS. Queue lag
+is the longest a message waited between enqueueing and sending.
+"""
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from fhirapi import outbox
+from fhirapi.models import OutboxMessage
+
+from . import scenario
+
+MESSAGES = 1000
+GREETING_DELAYS = (0.0, 0.02)
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """
+    Accepts and discards mail; just enough SMTP for smtplib.
+    """
+    def handle(self):
+        time.sleep(self.server.greeting_delay)
+        self.wfile.write(b"220 sink\r\n")
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    self.server.received += 1
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            verb = line[:4].upper()
+            if verb == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif verb == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+
+def start_sink(greeting_delay):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPSink)
+    server.daemon_threads = True
+    server.greeting_delay = greeting_delay
+    server.received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def queue_messages(count):
+    OutboxMessage.objects.all().delete()
+    OutboxMessage.objects.bulk_create(
+        OutboxMessage(kind="appointment_confirmation", recipient=f"patient{number}@example.com", context={
+            "Doctor_name": "ANA FREE", "Appointment_date": "2031-01-06", "Appointment_time": "09:00:00",
+            "Appointment_id": f"00000000-0000-0000-0000-{number:012d}",
+        })
+        for number in range(count)
+    )
+
+
+def legacy_send(entry):
+    """
+    The old send_confirmation_email body: render, then send() on a new connection.
+    """
+    message = EmailMultiAlternatives(
+        "Appointment Confirmation", render_to_string("emails/appointment_confirmation.txt", entry.context),
+        None, [entry.recipient],
+    )
+    message.attach_alternative(render_to_string("emails/appointment_confirmation.html", entry.context), "text/html")
+    message.send()
+
+
+def report(write, label, sent, seconds, lag):
+    write(f"{label:<44} {sent:>6} messages in {seconds:>6.2f}s = {sent / seconds:>8,.0f} msg/s  lag {lag:>6.2f}s")
+    return {"messages": sent, "seconds": round(seconds, 3), "messages_per_second": round(sent / seconds),
+            "lag_seconds": round(lag, 3)}
+
+
+@scenario("outbox")
+def run(options, write):
+    results = {}
+    for delay in GREETING_DELAYS:
+        sink = start_sink(delay)
+        smtp = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend", EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=sink.server_address[1], EMAIL_USE_TLS=False, EMAIL_HOST_USER="", EMAIL_HOST_PASSWORD="",
+        )
+        suffix = f"{delay * 1000:.0f}ms greeting"
+        with smtp:
+            queue_messages(MESSAGES)
+            started = time.perf_counter()
+            for entry in OutboxMessage.objects.all():
+                legacy_send(entry)
+            seconds = time.perf_counter() - started
+            results[f"per_message_{suffix}"] = report(write, f"one connection per message, {suffix}",
+                                                      MESSAGES, seconds, seconds)
+
+            queue_messages(MESSAGES)
+            result = outbox.drain()
+            results[f"outbox_{suffix}"] = report(write, f"outbox, batches of {outbox.BATCH_SIZE}, {suffix}",
+                                                 result.sent, result.seconds, result.lag_seconds)
+        sink.shutdown()
+        sink.server_close()
+    OutboxMessage.objects.all().delete()
+    return results
@@ -0,0 +1,44 @@
+"""
+Cost of fetching one page at increasing depth: OFFSET + COUNT(*) versus a
+keyset seek, on the busiest specialization.
+"""
+from fhirapi.models import Doctor
+from fhirapi.pagination import seek_filter
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+PAGE_SIZE = 12
+DEPTHS = [0, 100, 1000, 10000]
+
+
+@scenario("pagination")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+
+    results = {"rows": options["rows"], "offset": {}, "keyset": {}}
+    for sort in ("asc", "desc"):
+        queryset = Doctor.objects.filter_from_params({"specialization": "INTERNAL MEDICINE", "sort": sort})
+        ordering = [str(term) for term in queryset.query.order_by]
+        fields = [term.lstrip("-") for term in ordering]
+        for depth in DEPTHS:
+            offset = depth * PAGE_SIZE
+            boundary = queryset.values_list(*fields)[offset - 1:offset].first() if offset else None
+            if offset and boundary is None:
+                break
+
+            def offset_page():
+                queryset.count()
+                list(queryset[offset:offset + PAGE_SIZE])
+
+            def keyset_page():
+                seeked = queryset.filter(seek_filter(ordering, boundary)) if boundary else queryset
+                list(seeked[:PAGE_SIZE + 1])
+
+            label = f"{sort} page {depth}"
+            results["offset"][label] = measure(offset_page, options["repeat"])
+            results["keyset"][label] = measure(keyset_page, options["repeat"])
+            write(format_summary(f"offset  {label}", results["offset"][label]))
+            write(format_summary(f"keyset  {label}", results["keyset"][label]))
+    return results
@@ -0,0 +1,217 @@
+"""
+Booking inserts and appointment lookups on the partitioned appointments
+table against the same rows in one plain table indexed the way the table
+was before partitioning (id, appointment_id, the slot and doctor_id).
+
+Here ``--rows`` counts appointments, not doctors (``--rows 50000000`` for
+the national-scale run). They are generated in SQL for DOCTORS doctors,
+spread over DAYS days ending MONTHS_AHEAD months from now, and kept
+between ``--keepdb`` runs along with the plain copy.
+"""
+import datetime
+import random
+import re
+
+from django.db import connection
+
+from fhirapi import partitions
+from fhirapi.models import Appointment, Doctor
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+DOCTORS = 20_000
+DAYS = 3 * 365
+MONTHS_AHEAD = 6
+BATCH = 1_000_000
+PLAIN_TABLE = "benchmark_appointments_plain"
+PLAIN_INDEXES = [
+    "ALTER TABLE {table} ADD PRIMARY KEY (id)",
+    "ALTER TABLE {table} ADD UNIQUE (appointment_id)",
+    "ALTER TABLE {table} ADD UNIQUE (doctor_id, appointment_date, appointment_time)",
+    "CREATE INDEX ON {table} (doctor_id)",
+]
+COLUMNS = ("appointment_id, doctor_id, patient_name, phone_number, email, reason, "
+           "appointment_date, appointment_time, created_at")
+# Booked by the insert cases, past the generated 08:00-16:00 slots; deleted after.
+INSERTED_NAME = "BENCHMARK INSERT"
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def row_count(cursor, table):
+    cursor.execute(f"SELECT count(*) FROM {quote(table)}")
+    return cursor.fetchone()[0]
+
+
+def seed_appointments(cursor, count, first_day, write):
+    """
+    ``count`` appointments. Appointment n goes to doctor n mod DOCTORS; that
+    doctor's k-th appointment lands on day k * 7919 mod DAYS (a stride
+    coprime with DAYS, so consecutive ones spread over the whole range) in
+    30-minute slot k div DAYS from 08:00, which keeps every slot distinct.
+    """
+    table = partitions.TABLE
+    cursor.execute(f"TRUNCATE {quote(table)}")
+    months = {partitions.add_months(first_day.replace(day=1), n) for n in range(DAYS // 28 + 2)}
+    existing = partitions.monthly_partitions(cursor)
+    for month in sorted(months - existing.keys()):
+        partitions.create_partition(cursor, month)
+    cursor.execute(f"SELECT array_agg(practitioner_id ORDER BY practitioner_id) FROM {quote(Doctor._meta.db_table)}")
+    doctors = cursor.fetchone()[0]
+    for start in range(0, count, BATCH):
+        cursor.execute(
+            f"""
+            INSERT INTO {quote(table)} ({COLUMNS})
+            SELECT gen_random_uuid(), (%s::text[])[n %% %s + 1], 'BENCHMARK', '+14155550100',
+                   'patient@example.com', '', %s::date + ((n / %s) * 7919 %% %s)::int,
+                   time '08:00' + (n / %s / %s) * interval '30 minutes', now()
+            FROM generate_series(%s::bigint, %s::bigint) AS n
+            """,
+            [doctors, len(doctors), first_day, len(doctors), DAYS, len(doctors), DAYS,
+             start, min(start + BATCH, count) - 1],
+        )
+        write(f"  {min(start + BATCH, count):,} appointments")
+    cursor.execute(f"ANALYZE {quote(table)}")
+
+
+def copy_to_plain_table(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {quote(PLAIN_TABLE)}")
+    cursor.execute(f"CREATE TABLE {quote(PLAIN_TABLE)} AS TABLE {quote(partitions.TABLE)}")
+    for statement in PLAIN_INDEXES:
+        cursor.execute(statement.format(table=quote(PLAIN_TABLE)))
+    cursor.execute(f"ALTER TABLE {quote(PLAIN_TABLE)} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) "
+                   f"FROM {quote(PLAIN_TABLE)}", [PLAIN_TABLE])
+    cursor.execute(f"ANALYZE {quote(PLAIN_TABLE)}")
+
+
+def relation_size(cursor, table):
+    """
+    Heap and index bytes of ``table`` and its partitions, if any.
+    """
+    cursor.execute(
+        """
+        SELECT sum(pg_relation_size(relid)), sum(pg_indexes_size(relid))
+        FROM (SELECT relid FROM pg_partition_tree(%s::regclass) UNION SELECT %s::regclass) tree
+        """,
+        [table, table],
+    )
+    return cursor.fetchone()
+
+
+def scanned_partitions(cursor, sql, params):
+    cursor.execute(f"EXPLAIN {sql}", params)
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+    return sorted(set(re.findall(rf"\bon ({re.escape(partitions.TABLE)}_\w+)", plan)))
+
+
+@scenario("partitions")
+def run(options, write):
+    if ensure_doctors(DOCTORS):
+        write(f"loaded {DOCTORS} synthetic doctors")
+    last_day = partitions.add_months(datetime.date.today().replace(day=1), MONTHS_AHEAD)
+    first_day = last_day - datetime.timedelta(days=DAYS)
+    count = options["rows"]
+    with connection.cursor() as cursor:
+        if row_count(cursor, partitions.TABLE) != count:
+            write(f"generating {count:,} appointments from {first_day}")
+            seed_appointments(cursor, count, first_day, write)
+            copy_to_plain_table(cursor)
+        elif PLAIN_TABLE not in connection.introspection.table_names(cursor):
+            copy_to_plain_table(cursor)
+        cursor.execute(
+            f"SELECT doctor_id, appointment_date, appointment_time, appointment_id FROM {quote(partitions.TABLE)} "
+            f"TABLESAMPLE SYSTEM (1) LIMIT 1000"
+        )
+        samples = cursor.fetchall()
+        months = len(partitions.monthly_partitions(cursor))
+
+        results = {"appointments": count, "partitions": months, "sizes": {}}
+        for label, table in (("partitioned", partitions.TABLE), ("plain", PLAIN_TABLE)):
+            heap, indexes = relation_size(cursor, table)
+            results["sizes"][label] = {"heap": heap, "indexes": indexes}
+            write(f"{label:<12} heap {heap / 2**20:>9.1f} MB  indexes {indexes / 2**20:>9.1f} MB")
+
+    rng = random.Random(0)
+    upcoming = datetime.date.today() + datetime.timedelta(days=14)
+    inserted = iter(range(10**9))
+
+    def book(table, taken):
+        doctor, day, time, _ = rng.choice(samples)
+        if not taken:
+            step = next(inserted)
+            day = upcoming + datetime.timedelta(days=step // 480)
+            time = datetime.time(16 + step % 480 // 60, step % 60)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {quote(table)} ({COLUMNS}) VALUES (gen_random_uuid(), %s, %s, '+14155550100',
+                       'patient@example.com', '', %s, %s, now())
+                ON CONFLICT (doctor_id, appointment_date, appointment_time) DO NOTHING RETURNING id
+                """,
+                [doctor, INSERTED_NAME, day, time],
+            )
+            return cursor.fetchall()
+
+    def query(sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def pick(build):
+        doctor, day, time, appointment_id = rng.choice(samples)
+        return build(doctor, day, appointment_id)
+
+    lookups = {
+        "doctor's day": (
+            "SELECT appointment_time FROM {table} WHERE doctor_id = %s AND appointment_date = %s",
+            lambda doctor, day, appointment_id: [doctor, day],
+        ),
+        "doctor's next 4 weeks": (
+            "SELECT appointment_date, appointment_time FROM {table} "
+            "WHERE doctor_id = %s AND appointment_date BETWEEN %s AND %s::date + 27",
+            lambda doctor, day, appointment_id: [doctor, day, day],
+        ),
+        "by appointment_id": (
+            "SELECT id FROM {table} WHERE appointment_id = %s",
+            lambda doctor, day, appointment_id: [appointment_id],
+        ),
+        "by appointment_id and date": (
+            "SELECT id FROM {table} WHERE appointment_id = %s AND appointment_date = %s",
+            lambda doctor, day, appointment_id: [appointment_id, day],
+        ),
+        "bookings on one day": (
+            "SELECT count(*) FROM {table} WHERE appointment_date = %s",
+            lambda doctor, day, appointment_id: [day],
+        ),
+    }
+    cases = {
+        "book a free slot": lambda table: book(table, taken=False),
+        "book a taken slot": lambda table: book(table, taken=True),
+    }
+    for label, (sql, params) in lookups.items():
+        cases[label] = lambda table, sql=sql, params=params: query(sql.format(table=quote(table)), pick(params))
+
+    try:
+        for label, case in cases.items():
+            results[label] = {}
+            for name, table in (("partitioned", partitions.TABLE), ("plain", PLAIN_TABLE)):
+                results[label][name] = measure(lambda: case(table), options["repeat"])
+                write(format_summary(f"{label} ({name})", results[label][name]))
+    finally:
+        with connection.cursor() as cursor:
+            for table in (partitions.TABLE, PLAIN_TABLE):
+                cursor.execute(f"DELETE FROM {quote(table)} WHERE patient_name = %s", [INSERTED_NAME])
+
+    with connection.cursor() as cursor:
+        doctor, day, _, appointment_id = samples[0]
+        results["plans"] = {}
+        for label, (sql, params) in lookups.items():
+            scanned = scanned_partitions(cursor, sql.format(table=quote(partitions.TABLE)),
+                                         params(doctor, day, appointment_id))
+            results["plans"][label] = len(scanned)
+            write(f"{label:<44} reads {len(scanned)} of {months + 1} partitions")
+    return results
@@ -0,0 +1,54 @@
+"""
+``preprocessing.py`` throughput and peak memory: the original whole-file
+pandas pipeline versus the chunked engine, each run as its own process on a
+synthetic CMS file of ``--rows`` practitioners.
+"""
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import scenario
+from .synthetic import write_cms_file
+
+SCRIPT = Path(settings.BASE_DIR) / "preprocessing.py"
+SUMMARY = re.compile(r"([\d,]+) rows in, ([\d,]+) doctors out .*peak RSS ([\d,]+) MB, largest worker ([\d,]+) MB")
+RUNS = [
+    ("legacy", []),
+    ("chunked, 1 worker", ["--workers", "1", "--format", "csv"]),
+    ("chunked, 2 workers", ["--workers", "2", "--format", "csv"]),
+    ("chunked, 1 worker, parquet", ["--workers", "1"]),
+]
+
+
+def number(text):
+    return int(text.replace(",", ""))
+
+
+@scenario("preprocessing", needs_db=False)
+def run(options, write):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        raw = Path(directory) / "raw.csv"
+        write_cms_file(raw, options["rows"])
+        write(f"raw file: {raw.stat().st_size / 2**20:,.0f} MB")
+        for label, args in RUNS:
+            engine = "legacy" if label == "legacy" else "chunked"
+            started = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, SCRIPT, raw, Path(directory) / f"output-{len(results)}", "--engine", engine, *args],
+                capture_output=True, text=True, check=True,
+            )
+            elapsed = time.perf_counter() - started
+            rows_in, rows_out, rss, worker_rss = map(number, SUMMARY.search(completed.stdout).groups())
+            results[label] = {
+                "rows": rows_in, "doctors": rows_out, "seconds": round(elapsed, 2),
+                "rows_per_second": round(rows_in / elapsed), "peak_rss_mb": rss, "worker_peak_rss_mb": worker_rss,
+            }
+            write(f"{label:<44} {rows_in / elapsed:>10,.0f} rows/s  peak RSS {rss:>6,} MB  "
+                  f"(largest worker {worker_rss:,} MB)")
+    return results
@@ -0,0 +1,88 @@
+"""
+Filter endpoint latency with the search indexes versus the original
+``__icontains`` lookups on an unindexed table.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+
+from fhirapi.models import Doctor
+
+from . import format_summary, measure, scenario
+from .synthetic import ensure_doctors
+
+QUERIES = [
+    {"first_name": "JOSHUA"},
+    {"last_name": "chow"},
+    {"first_name": "anit", "last_name": "okaf"},
+    {"specialization": "cardio"},
+    {"city": "francisco"},
+    {"state": "ca"},
+    {"zip_code": "9410"},
+    {"specialization": "internal", "state": "ny"},
+    {"q": "cardiology boston"},
+]
+
+SEARCH_INDEXES = [
+    "doctors_zip_code_prefix_idx",
+    "doctors_first_name_trgm_idx",
+    "doctors_last_name_trgm_idx",
+    "doctors_search_vector_idx",
+    "locations_state_upper_idx",
+    "locations_city_trgm_idx",
+]
+
+
+def legacy_queryset(params):
+    """
+    The pre-index ``apply_filters`` behaviour: every lookup is ``__icontains``.
+    """
+    filters = {}
+    if params.get("id"):
+        filters["practitioner_id__iexact"] = params["id"]
+    for field in ("specialization", "city", "state", "zip_code"):
+        if params.get(field):
+            filters[f"{field}__icontains"] = params[field]
+    qs = Doctor.objects.with_names().filter(**filters)
+    name_filter = Q()
+    if params.get("first_name"):
+        name_filter |= Q(first_name__icontains=params["first_name"])
+    if params.get("last_name"):
+        name_filter |= Q(last_name__icontains=params["last_name"])
+    return qs.filter(name_filter).order_by("first_name", "last_name")
+
+
+def page_runner(queryset):
+    def run():
+        list(queryset[:12])
+        queryset.count()
+    return run
+
+
+def label_for(params):
+    return "&".join(f"{key}={value}" for key, value in params.items())
+
+
+@scenario("search")
+def run(options, write):
+    if ensure_doctors(options["rows"]):
+        write(f"loaded {options['rows']} synthetic doctors")
+
+    results = {"rows": options["rows"], "indexed": {}, "legacy": {}}
+    for params in QUERIES:
+        summary = measure(page_runner(Doctor.objects.filter_from_params(params)), options["repeat"])
+        results["indexed"][label_for(params)] = summary
+        write(format_summary(f"indexed  {label_for(params)}", summary))
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for name in SEARCH_INDEXES:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+        for params in QUERIES:
+            if "q" in params:
+                continue
+            summary = measure(page_runner(legacy_queryset(params)), options["repeat"])
+            results["legacy"][label_for(params)] = summary
+            write(format_summary(f"legacy   {label_for(params)}", summary))
+        transaction.set_rollback(True)
+
+    return results
@@ -0,0 +1,135 @@
+"""
+Synthetic doctor rows shaped like the output of ``preprocessing.py`` (upper-case
+CMS names and specialties, 9-digit zip codes, ``ind_pac_id``-style ids), and
+raw CMS files to feed ``preprocessing.py``.
+"""
+import csv
+import random
+
+from django.db import connection
+
+from fhirapi.loading import DOCTOR_COLUMNS, STAGED_COLUMNS, copy_rows, resolve_rows
+from fhirapi.models import Doctor
+
+FIRST_NAMES = [
+    "JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH",
+    "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CHRISTOPHER", "KAREN",
+    "CHARLES", "LISA", "DANIEL", "NANCY", "MATTHEW", "BETTY", "ANTHONY", "SANDRA", "MARK", "MARGARET",
+    "DONALD", "ASHLEY", "STEVEN", "KIMBERLY", "ANDREW", "EMILY", "PAUL", "DONNA", "JOSHUA", "MICHELLE",
+    "KENNETH", "CAROL", "KEVIN", "AMANDA", "BRIAN", "MELISSA", "GEORGE", "DEBORAH", "TIMOTHY", "STEPHANIE",
+    "PRIYA", "WEI", "MOHAMMED", "ANITA", "RAJESH", "MEI", "CARLOS", "LUCIA", "AHMED", "FATIMA",
+]
+
+LAST_NAMES = [
+    "SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ",
+    "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR", "MOORE", "JACKSON", "MARTIN",
+    "LEE", "PEREZ", "THOMPSON", "WHITE", "HARRIS", "SANCHEZ", "CLARK", "RAMIREZ", "LEWIS", "ROBINSON",
+    "WALKER", "YOUNG", "ALLEN", "KING", "WRIGHT", "SCOTT", "TORRES", "NGUYEN", "HILL", "FLORES",
+    "GREEN", "ADAMS", "NELSON", "BAKER", "HALL", "RIVERA", "CAMPBELL", "MITCHELL", "CARTER", "ROBERTS",
+    "GOMEZ", "PHILLIPS", "EVANS", "TURNER", "DIAZ", "PARKER", "CRUZ", "EDWARDS", "COLLINS", "REYES",
+    "STEWART", "MORRIS", "MORALES", "MURPHY", "COOK", "ROGERS", "GUTIERREZ", "ORTIZ", "MORGAN", "COOPER",
+    "PETERSON", "BAILEY", "REED", "KELLY", "HOWARD", "RAMOS", "KIM", "COX", "WARD", "RICHARDSON",
+    "PATEL", "SHAH", "CHEN", "WANG", "SINGH", "KUMAR", "REDDY", "CHOWDHURY", "KHAN", "ALI",
+    "OKAFOR", "NWOSU", "SCHMIDT", "MUELLER", "ROSSI", "RUSSO", "COHEN", "LEVY", "OBRIEN", "MURRAY",
+]
+
+SPECIALTIES = [
+    "INTERNAL MEDICINE", "FAMILY PRACTICE", "NURSE PRACTITIONER", "PHYSICIAN ASSISTANT",
+    "CARDIOVASCULAR DISEASE (CARDIOLOGY)", "DIAGNOSTIC RADIOLOGY", "ANESTHESIOLOGY", "EMERGENCY MEDICINE",
+    "PHYSICAL THERAPIST IN PRIVATE PRACTICE", "ORTHOPEDIC SURGERY", "OBSTETRICS/GYNECOLOGY", "PSYCHIATRY",
+    "NEUROLOGY", "GASTROENTEROLOGY", "DERMATOLOGY", "OPHTHALMOLOGY", "GENERAL SURGERY", "PEDIATRIC MEDICINE",
+    "CHIROPRACTIC", "OPTOMETRY", "PODIATRY", "UROLOGY", "NEPHROLOGY", "PULMONARY DISEASE",
+    "HEMATOLOGY/ONCOLOGY", "CLINICAL PSYCHOLOGIST", "CERTIFIED REGISTERED NURSE ANESTHETIST (CRNA)",
+    "ENDOCRINOLOGY", "INFECTIOUS DISEASE", "OTOLARYNGOLOGY", "PATHOLOGY", "RADIATION ONCOLOGY",
+    "RHEUMATOLOGY", "PHYSICAL MEDICINE AND REHABILITATION", "LICENSED CLINICAL SOCIAL WORKER",
+    "GERIATRIC MEDICINE", "SPORTS MEDICINE", "PLASTIC AND RECONSTRUCTIVE SURGERY", "VASCULAR SURGERY",
+    "INTERVENTIONAL CARDIOLOGY",
+]
+
+LOCATIONS = [
+    ("SAN FRANCISCO", "CA", "94107"), ("LOS ANGELES", "CA", "90012"), ("SAN DIEGO", "CA", "92101"),
+    ("SACRAMENTO", "CA", "95814"), ("SEATTLE", "WA", "98101"), ("PORTLAND", "OR", "97201"),
+    ("PHOENIX", "AZ", "85004"), ("LAS VEGAS", "NV", "89101"), ("DENVER", "CO", "80202"),
+    ("SALT LAKE CITY", "UT", "84101"), ("DALLAS", "TX", "75201"), ("HOUSTON", "TX", "77002"),
+    ("AUSTIN", "TX", "78701"), ("SAN ANTONIO", "TX", "78205"), ("OKLAHOMA CITY", "OK", "73102"),
+    ("KANSAS CITY", "MO", "64106"), ("SAINT LOUIS", "MO", "63101"), ("MINNEAPOLIS", "MN", "55401"),
+    ("CHICAGO", "IL", "60601"), ("MILWAUKEE", "WI", "53202"), ("DETROIT", "MI", "48226"),
+    ("COLUMBUS", "OH", "43215"), ("CLEVELAND", "OH", "44113"), ("INDIANAPOLIS", "IN", "46204"),
+    ("NASHVILLE", "TN", "37203"), ("MEMPHIS", "TN", "38103"), ("ATLANTA", "GA", "30303"),
+    ("MIAMI", "FL", "33130"), ("ORLANDO", "FL", "32801"), ("TAMPA", "FL", "33602"),
+    ("CHARLOTTE", "NC", "28202"), ("RALEIGH", "NC", "27601"), ("RICHMOND", "VA", "23219"),
+    ("BALTIMORE", "MD", "21201"), ("WASHINGTON", "DC", "20001"), ("PHILADELPHIA", "PA", "19103"),
+    ("PITTSBURGH", "PA", "15222"), ("NEWARK", "NJ", "07102"), ("NEW YORK", "NY", "10001"),
+    ("BROOKLYN", "NY", "11201"), ("BUFFALO", "NY", "14202"), ("BOSTON", "MA", "02108"),
+    ("PROVIDENCE", "RI", "02903"), ("HARTFORD", "CT", "06103"), ("NEW ORLEANS", "LA", "70112"),
+    ("BIRMINGHAM", "AL", "35203"), ("LOUISVILLE", "KY", "40202"), ("OMAHA", "NE", "68102"),
+    ("ALBUQUERQUE", "NM", "87102"), ("HONOLULU", "HI", "96813"),
+]
+
+STREETS = [
+    "MAIN ST", "OAK AVE", "PARK BLVD", "MEDICAL CENTER DR", "HOSPITAL WAY", "ELM ST", "WASHINGTON AVE",
+    "LAKE SHORE DR", "MARKET ST", "BROADWAY", "CEDAR LN", "HIGHLAND AVE", "PINE ST", "MAPLE AVE",
+]
+
+EMAIL_DOMAINS = ["gmail.com", "yahoo.com", "docmail.com", "healthpro.org"]
+
+
+def generate_doctors(count, seed=0, start=0):
+    """
+    Yield ``count`` row tuples in :data:`DOCTOR_COLUMNS` order.
+    """
+    rng = random.Random(seed)
+    for i in range(start, start + count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        city, state, zip5 = rng.choice(LOCATIONS)
+        suite = f"SUITE {rng.randrange(100, 999)}" if rng.random() < 0.4 else ""
+        yield (
+            str(1000000000 + i),
+            first,
+            last,
+            rng.choice(SPECIALTIES),
+            str(rng.randrange(2000000000, 9999999999)),
+            f"{first[0]}{last}{rng.randrange(1000):03d}@{rng.choice(EMAIL_DOMAINS)}".lower(),
+            f"{rng.randrange(1, 9999)} {rng.choice(STREETS)}, {suite}",
+            city,
+            state,
+            f"{zip5}{rng.randrange(10000):04d}",
+        )
+
+
+def ensure_doctors(count, seed=0):
+    """
+    Make the doctors table hold exactly ``count`` synthetic rows.
+    """
+    if Doctor.objects.count() == count:
+        return False
+    table = connection.ops.quote_name(Doctor._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {table} CASCADE")
+    copy_rows(resolve_rows(generate_doctors(count, seed=seed), 50000), Doctor._meta.db_table, STAGED_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {table}")
+    return True
+
+
+def write_cms_file(path, count, seed=0, duplicate_rate=0.3, incomplete_rate=0.02):
+    """
+    Write a raw CMS National Downloadable File for ``count`` practitioners, in
+    the 31-column layout ``preprocessing.py`` reads. Like the real file, a
+    practitioner gets one row per practice address, and a few rows are
+    missing a required column.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(["NPI", "Ind_PAC_ID", "Ind_enrl_ID", "Provider Last Name", "Provider First Name"] + [""] * 26)
+        for pid, first, last, specialty, phone, _, address, city, state, zip_code in generate_doctors(count, seed):
+            line_1, _, line_2 = address.partition(", ")
+            for _ in range(1 + (rng.random() < duplicate_rate)):
+                row = [""] * 31
+                row[0], row[1], row[2] = pid[1:], pid, f"I{pid}"
+                row[3], row[4], row[11] = last, first, specialty
+                row[21], row[22], row[24], row[25], row[26] = line_1, line_2, city, state, zip_code
+                row[27] = "" if rng.random() < incomplete_rate else phone
+                writer.writerow(row)
@@ -0,0 +1,133 @@
+"""
+Appointment booking that stays correct under contention.
+
+The slot is claimed with ``INSERT ... ON CONFLICT DO NOTHING RETURNING``
+against the (doctor, date, time) unique constraint. Of any number of
+concurrent requests for one slot exactly one gets a row back; the others
+get none and answer 409, without a check-then-insert race or an
+IntegrityError aborting the transaction.
+
+An ``Idempotency-Key`` is claimed the same way, in the same transaction,
+and the response is stored on it. A retry sent while the first request is
+still running waits on the key's row lock, then replays the committed
+response instead of booking again.
+
+The confirmation email goes into the outbox in the same transaction.
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import Appointment, IdempotencyKey
+
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def fingerprint(data):
+    """
+    Stable hash of validated serializer data (related objects by pk).
+    """
+    canonical = {name: getattr(value, "pk", value) for name, value in data.items()}
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def claim_key(key, digest):
+    """
+    Claim ``key`` for this request, taking over an expired one. Returns
+    None when claimed, else the stored (status, body) to replay, or a 422
+    when the key was used for a different request.
+    """
+    table = quote(IdempotencyKey._meta.db_table)
+    now = timezone.now()
+    expired = now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (key, fingerprint, created_at) VALUES (%s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, created_at = EXCLUDED.created_at,
+                                            response_status = NULL, response_body = NULL
+            WHERE {table}.created_at < %s
+            RETURNING key
+            """,
+            [key, digest, now, expired],
+        )
+        if cursor.fetchone():
+            return None
+    stored = IdempotencyKey.objects.get(key=key)
+    if stored.fingerprint != digest:
+        return 422, {"error": "This Idempotency-Key was already used for a different request."}
+    return stored.response_status, stored.response_body
+
+
+def insert_appointment(data):
+    """
+    Insert an appointment unless its slot is taken. Returns the saved
+    appointment, or None on a conflict.
+    """
+    appointment = Appointment(**data)
+    fields = [field for field in Appointment._meta.concrete_fields if not field.primary_key]
+    values = [field.get_db_prep_save(field.pre_save(appointment, True), connection) for field in fields]
+    slot = [Appointment._meta.get_field(name).column for name in ("doctor", "appointment_date", "appointment_time")]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO {table} ({columns}) VALUES ({placeholders})
+            ON CONFLICT ({slot}) DO NOTHING
+            RETURNING {pk}
+            """.format(
+                table=quote(Appointment._meta.db_table),
+                columns=", ".join(quote(field.column) for field in fields),
+                placeholders=", ".join(["%s"] * len(fields)),
+                slot=", ".join(quote(column) for column in slot),
+                pk=quote(Appointment._meta.pk.column),
+            ),
+            values,
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    appointment.pk = row[0]
+    appointment._state.adding = False
+    appointment._state.db = connection.alias
+    return appointment
+
+
+def conflict_body(data):
+    return {
+        "error": "This slot is already booked.",
+        "doctor": data["doctor"].pk,
+        "appointment_date": data["appointment_date"].isoformat(),
+        "appointment_time": data["appointment_time"].isoformat(timespec="minutes"),
+    }
+
+
+def book(serializer, key=None):
+    """
+    Book the appointment in a valid ``serializer``. Returns (status, body,
+    appointment); the appointment is None unless this call created it.
+    """
+    data = serializer.validated_data
+    with transaction.atomic():
+        if key is not None:
+            replay = claim_key(key, fingerprint(data))
+            if replay is not None:
+                return *replay, None
+        appointment = insert_appointment(data)
+        if appointment is None:
+            response_status, body = 409, conflict_body(data)
+        else:
+            response_status, body = 201, dict(type(serializer)(appointment).data)
+            outbox.enqueue_confirmation(appointment)
+        if key is not None:
+            IdempotencyKey.objects.filter(key=key).update(response_status=response_status, response_body=body)
+    return response_status, body, appointment
@@ -0,0 +1,143 @@
+"""
+FHIR Bulk Data ``$export`` of Practitioner resources.
+
+A job is planned as primary-key ranges of ``chunk_size`` doctors. Every
+chunk is written to its own NDJSON file by a separate Celery task, so the
+serialization fans out across workers; a chunk is only marked done after
+its file has been atomically moved into place, which makes re-running a
+job (see ``resume_bulk_exports``) pick up exactly the unfinished ranges.
+"""
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .fhir import PRACTITIONER_FIELDS, practitioner_json
+from .models import Doctor, ExportChunk, ExportJob
+from .streaming import batched, encoder
+
+NDJSON_CONTENT_TYPE = "application/fhir+ndjson"
+OUTPUT_FORMATS = {NDJSON_CONTENT_TYPE, "application/ndjson", "ndjson"}
+ROW_BATCH = 2000
+
+
+def job_dir(job):
+    return Path(settings.FHIR_EXPORT_ROOT) / str(job.job_id)
+
+
+def file_name(chunk):
+    return f"Practitioner.{chunk.index:05d}.ndjson"
+
+
+def operation_outcome(diagnostics, severity="error", code="processing"):
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": severity, "code": code, "diagnostics": diagnostics}],
+    }
+
+
+def plan_chunks(job):
+    """
+    Walk the primary key index once and record every ``chunk_size``-th id as
+    a range boundary. The last range is open-ended.
+    """
+    ends, total = [], 0
+    pks = Doctor.objects.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=10000)
+    for total, pk in enumerate(pks, start=1):
+        if total % job.chunk_size == 0:
+            ends.append(pk)
+    if ends and total % job.chunk_size == 0:
+        ends[-1] = None
+    else:
+        ends.append(None)
+
+    chunks, start_after = [], None
+    for index, end_at in enumerate(ends):
+        chunks.append(ExportChunk(job=job, index=index, start_after=start_after, end_at=end_at))
+        start_after = end_at
+    ExportChunk.objects.bulk_create(chunks)
+    return len(chunks)
+
+
+def chunk_rows(chunk):
+    rows = Doctor.objects.order_by("pk").with_names().values(*PRACTITIONER_FIELDS)
+    if chunk.start_after is not None:
+        rows = rows.filter(pk__gt=chunk.start_after)
+    if chunk.end_at is not None:
+        rows = rows.filter(pk__lte=chunk.end_at)
+    return rows.iterator(chunk_size=ROW_BATCH)
+
+
+def export_chunk(chunk):
+    """
+    Write one chunk's Practitioner file and mark it done. Safe to call again
+    for a chunk that was interrupted or already finished.
+    """
+    if chunk.done:
+        return 0
+    directory = job_dir(chunk.job)
+    directory.mkdir(parents=True, exist_ok=True)
+    output_path = directory / file_name(chunk)
+    partial_path = f"{output_path}.{uuid.uuid4().hex}.part"
+
+    resources = 0
+    with open(partial_path, "w", encoding="utf-8") as output:
+        for rows in batched(chunk_rows(chunk), ROW_BATCH):
+            output.write("".join(encoder.encode(practitioner_json(row)) + "\n" for row in rows))
+            resources += len(rows)
+    os.replace(partial_path, output_path)
+
+    with transaction.atomic():
+        marked = ExportChunk.objects.filter(pk=chunk.pk, done=False).update(
+            done=True, resource_count=resources, completed_at=timezone.now()
+        )
+        if marked:
+            ExportJob.objects.filter(pk=chunk.job_id).update(resource_count=F("resource_count") + resources)
+    return resources
+
+
+def finish_job(job):
+    if job.chunks.filter(done=False).exists():
+        return False
+    job.status = ExportJob.COMPLETED
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    return True
+
+
+def cancel_job(job):
+    job.status = ExportJob.CANCELLED
+    job.save(update_fields=["status"])
+    shutil.rmtree(job_dir(job), ignore_errors=True)
+
+
+def manifest(job, file_url):
+    """
+    The completion manifest defined by the Bulk Data spec; ``file_url``
+    turns a file name into an absolute download URL.
+    """
+    output = [
+        {
+            "type": "Practitioner",
+            "url": file_url(file_name(chunk)),
+            "count": chunk.resource_count,
+        }
+        for chunk in job.chunks.all()
+        if chunk.resource_count
+    ]
+    return {
+        "transactionTime": job.transaction_time.isoformat(),
+        "request": job.request_url,
+        "requiresAccessToken": False,
+        "output": output,
+        "error": [],
+        "extension": {
+            "resourceCount": job.resource_count,
+            "resourcesPerSecond": job.resources_per_second(),
+        },
+    }
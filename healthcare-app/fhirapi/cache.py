@@ -0,0 +1,272 @@
+"""
+Versioned response cache for the doctor read endpoints.
+
+Every key embeds a version. List pages use the global doctor data version;
+a detail page uses its own doctor's version, so a change to one doctor
+(post_save/post_delete, or a delta sync run) re-renders that doctor's page
+and the list pages but leaves every other detail page cached. Entries
+written before a change are never read again; they simply age out.
+For ``DATABASE_REPLICA_PIN_SECONDS`` after a bump, misses read the
+primary: a lagging replica would otherwise store old rows under the new
+version. Responses carry a content ETag and honour If-None-Match with a
+304. Only JSON is stored: the browsable API's HTML embeds the requesting
+session's CSRF token and username, so it is always rendered afresh.
+"""
+import contextlib
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .models import CASE_INSENSITIVE_PARAMS, normalize_filter_params
+from .routers import pinned_to_primary
+
+VERSION_KEY = "doctors:version"
+CHANGED_AT_KEY = "doctors:changed-at"
+HITS_KEY = "doctors:cache:hits"
+MISSES_KEY = "doctors:cache:misses"
+DOCTOR_VERSION_KEY = "doctors:version:{}"
+DETAIL_EPOCH_KEY = "doctors:detail-epoch"
+# Past this many changed doctors, retire every detail page at once rather
+# than writing one version key per doctor.
+MAX_TRACKED_CHANGES = 10000
+
+
+def data_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost version key can never fall back to a
+        # number that older entries were stored under.
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def adata_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    data_version()
+    cache.set(CHANGED_AT_KEY, time.time(), timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return data_version()
+
+
+def primary_if_recently_changed():
+    """
+    Pin the block to the primary while the replica may still lag behind the
+    last version bump, so what is cached under the new version is current.
+    """
+    if cache.get(CHANGED_AT_KEY) is None:
+        return contextlib.nullcontext()
+    return pinned_to_primary()
+
+
+async def aprimary_if_recently_changed():
+    if await cache.aget(CHANGED_AT_KEY) is None:
+        return contextlib.nullcontext()
+    return pinned_to_primary()
+
+
+def doctor_version(practitioner_id):
+    """
+    Version of one doctor's detail page. A missing key is seeded with the
+    global version, which every change bumps, so it can't repeat a value
+    that a page of changed data was stored under.
+    """
+    key = DOCTOR_VERSION_KEY.format(practitioner_id)
+    versions = cache.get_many([DETAIL_EPOCH_KEY, key])
+    for missing in {DETAIL_EPOCH_KEY, key} - versions.keys():
+        cache.add(missing, data_version(), timeout=None)
+        versions[missing] = cache.get(missing)
+    return f"{versions[DETAIL_EPOCH_KEY]}.{versions[key]}"
+
+
+async def adoctor_version(practitioner_id):
+    key = DOCTOR_VERSION_KEY.format(practitioner_id)
+    versions = await cache.aget_many([DETAIL_EPOCH_KEY, key])
+    for missing in {DETAIL_EPOCH_KEY, key} - versions.keys():
+        await cache.aadd(missing, await adata_version(), timeout=None)
+        versions[missing] = await cache.aget(missing)
+    return f"{versions[DETAIL_EPOCH_KEY]}.{versions[key]}"
+
+
+def bump_doctor_versions(practitioner_ids):
+    """
+    Invalidate the list pages and the detail pages of ``practitioner_ids``
+    (of every doctor when it is None).
+    """
+    version = bump_data_version()
+    if practitioner_ids is None or len(practitioner_ids) > MAX_TRACKED_CHANGES:
+        cache.set(DETAIL_EPOCH_KEY, version, timeout=None)
+        return version
+    for start in range(0, len(practitioner_ids), 1000):
+        batch = practitioner_ids[start:start + 1000]
+        cache.set_many({DOCTOR_VERSION_KEY.format(pk): version for pk in batch}, timeout=None)
+    return version
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+async def _acount(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=None)
+
+
+def stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "version": data_version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
+
+
+def cache_key(prefix, request, view_kwargs, extra_params=(), version=None):
+    """
+    Key from the normalized filter params (case folded where the lookup
+    ignores case), the extra params the view reads, the URL kwargs and the
+    parts of the request that change the rendered body (host for absolute
+    links, Accept for the renderer).
+    """
+    params = normalize_filter_params(request.GET)
+    parts = [
+        (key, value.casefold() if key in CASE_INSENSITIVE_PARAMS else value)
+        for key, value in params.items()
+    ]
+    parts += [(key, request.GET[key]) for key in extra_params if key in request.GET]
+    parts += sorted((key, str(value)) for key, value in view_kwargs.items())
+    parts += [("host", request.get_host()), ("accept", request.META.get("HTTP_ACCEPT", ""))]
+    digest = hashlib.blake2b(repr(sorted(parts)).encode("utf-8"), digest_size=16).hexdigest()
+    return f"doctors:{prefix}:{version or data_version()}:{digest}"
+
+
+def not_modified(request, etag):
+    etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    return etag in etags or "*" in etags
+
+
+def cached_response(request, entry):
+    if not_modified(request, entry["etag"]):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    response["X-Cache"] = "HIT"
+    return response
+
+
+def cacheable(response):
+    """
+    A successful JSON response; nothing in it depends on who asked.
+    """
+    if response.status_code != 200:
+        return False
+    if hasattr(response, "render"):
+        response.render()
+    content_type = response.get("Content-Type", "")
+    return content_type.split(";")[0].strip() == "application/json"
+
+
+def cache_entry(response):
+    if hasattr(response, "render"):
+        response.render()
+    return {
+        "content": response.content,
+        "content_type": response["Content-Type"],
+        "etag": '"%s"' % hashlib.blake2b(response.content, digest_size=16).hexdigest(),
+    }
+
+
+def fresh_response(request, response, entry):
+    if not_modified(request, entry["etag"]):
+        response = HttpResponseNotModified()
+    response["ETag"] = entry["etag"]
+    response["X-Cache"] = "MISS"
+    return response
+
+
+class VersionedCacheMixin:
+    """
+    APIView mixin that serves GET responses from the versioned cache.
+    ``cache_prefix`` names the endpoint; ``cache_params`` lists the
+    non-filter query params the view reads (sorting, pagination). Views for a
+    single doctor set ``version_kwarg`` to the URL kwarg holding its id.
+    Requests using one of ``uncached_params`` skip the cache: their results
+    change without any doctor being written (e.g. a booking fills a slot).
+    """
+    cache_prefix = None
+    cache_params = ()
+    uncached_params = ()
+    version_kwarg = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET" or any(request.GET.get(key) for key in self.uncached_params):
+            return super().dispatch(request, *args, **kwargs)
+
+        version = doctor_version(kwargs[self.version_kwarg]) if self.version_kwarg else None
+        key = cache_key(self.cache_prefix, request, kwargs, self.cache_params, version)
+        entry = cache.get(key)
+        if entry is not None:
+            _count(HITS_KEY)
+            return cached_response(request, entry)
+
+        _count(MISSES_KEY)
+        with primary_if_recently_changed():
+            response = super().dispatch(request, *args, **kwargs)
+        if not cacheable(response):
+            return response
+        entry = cache_entry(response)
+        cache.set(key, entry, settings.DOCTOR_CACHE_TIMEOUT)
+        return fresh_response(request, response, entry)
+
+
+def async_cached(prefix, cache_params=(), uncached_params=(), version_kwarg=None):
+    """
+    :class:`VersionedCacheMixin` for async view functions, on the async
+    cache API. Takes the mixin's attributes as arguments.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or any(request.GET.get(key) for key in uncached_params):
+                return await view(request, *args, **kwargs)
+
+            version = await (adoctor_version(kwargs[version_kwarg]) if version_kwarg else adata_version())
+            key = cache_key(prefix, request, kwargs, cache_params, version)
+            entry = await cache.aget(key)
+            if entry is not None:
+                await _acount(HITS_KEY)
+                return cached_response(request, entry)
+
+            await _acount(MISSES_KEY)
+            with await aprimary_if_recently_changed():
+                response = await view(request, *args, **kwargs)
+            if not cacheable(response):
+                return response
+            entry = cache_entry(response)
+            await cache.aset(key, entry, settings.DOCTOR_CACHE_TIMEOUT)
+            return fresh_response(request, response, entry)
+        return wrapper
+    return decorator
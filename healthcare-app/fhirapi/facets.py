@@ -0,0 +1,250 @@
+"""
+Facet counts: how many doctors have each specialization, state, city and
+5-digit ZIP.
+
+Two tables are precomputed from ``doctors`` by :func:`refresh_facets`: by
+every load that changes doctors, by Celery beat every 15 minutes
+(``refresh-facets``) and by ``manage.py refresh_facets``.
+
+- ``doctor_facets`` holds the unfiltered counts; the facet endpoint and the
+  admin list filters (cached per data version) read a few rows per field
+  from it.
+- ``doctor_facet_cells`` counts doctors per (specialization, state, city,
+  ZIP) combination; counts under filters on those columns alone are summed
+  from its matching cells, found through trigram and B-tree indexes on
+  those text columns.
+
+The admin's name filter lists the first names in order straight off
+``doctors_name_order_idx`` instead; one row per distinct name would be
+most of the table again.
+
+Other filters (names, ``q``, proximity, availability) are grouped live from
+the filtered doctors. Either way every facet comes from one pass, with
+GROUPING SETS.
+"""
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+
+from .cache import bump_data_version, data_version
+from .models import (
+    Doctor, DoctorFacet, DoctorFacetCell, Location, Specialty, field_lookups, normalize_filter_params,
+)
+
+# Facets served by the API, also the columns of doctor_facet_cells.
+API_FIELDS = ("specialization", "state", "city", "zip_code")
+CELL_PARAMS = frozenset(API_FIELDS)
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+ADMIN_CHOICES = 100
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def grouping_sql(source, doctors="count(*)"):
+    """
+    ``(field, value, doctors)`` for every non-blank value of each API field
+    in the rows of ``source`` (a FROM item with those columns), plus the
+    ``total`` row. ``doctors`` is the aggregate that counts a group.
+    """
+    # GROUPING() sets the bit of each argument left out of the row's grouping
+    # set, the first argument being the most significant.
+    everything = (1 << len(API_FIELDS)) - 1
+    cases = " ".join(
+        f"WHEN {everything ^ (1 << (len(API_FIELDS) - 1 - position))} THEN '{field}'"
+        for position, field in enumerate(API_FIELDS)
+    )
+    names = ", ".join(API_FIELDS)
+    return f"""
+        SELECT field, value, doctors FROM (
+            SELECT CASE GROUPING({names}) {cases} ELSE '{DoctorFacet.TOTAL}' END AS field,
+                   coalesce({names}, '') AS value, {doctors} AS doctors
+            FROM {source}
+            GROUP BY GROUPING SETS ({", ".join(f"({field})" for field in API_FIELDS)}, ())
+        ) g
+        WHERE value <> '' OR field = '{DoctorFacet.TOTAL}'
+    """
+
+
+def as_facets(rows, limit):
+    """
+    ``{"total": n, "facets": {field: [{"value", "count"}, ...]}}`` from
+    ``(field, value, doctors)`` rows sorted by count, ``limit`` per field.
+    """
+    facets = {field: [] for field in API_FIELDS}
+    total = 0
+    for field, value, doctors in rows:
+        if field == DoctorFacet.TOTAL:
+            total = doctors
+        elif len(facets[field]) < limit:
+            facets[field].append({"value": value, "count": doctors})
+    return {"total": total, "facets": facets}
+
+
+def precomputed(limit=DEFAULT_LIMIT):
+    """
+    Facets of every doctor, from ``doctor_facets``.
+    """
+    # One range of doctor_facet_top_idx per field, ``limit`` rows each.
+    with connections[DoctorFacet.objects.db].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT f.field, t.value, t.doctors
+            FROM unnest(%s::text[]) f(field)
+            CROSS JOIN LATERAL (
+                SELECT value, doctors FROM {quote(DoctorFacet._meta.db_table)}
+                WHERE field = f.field ORDER BY doctors DESC, value LIMIT %s
+            ) t
+            ORDER BY f.field, t.doctors DESC, t.value
+            """,
+            [[DoctorFacet.TOTAL, *API_FIELDS], limit],
+        )
+        return as_facets(cursor.fetchall(), limit)
+
+
+def grouped(queryset, limit=DEFAULT_LIMIT, weight=None):
+    """
+    Facets of the rows of ``queryset``, each standing for one doctor or, with
+    ``weight``, for the number of doctors in that column.
+    """
+    values = (*API_FIELDS, weight) if weight else API_FIELDS
+    if queryset.model is Doctor:
+        queryset = queryset.with_names()
+    sql, params = queryset.order_by().values(*values).query.sql_with_params()
+    source = (
+        f"(SELECT specialization, state, city, left(zip_code, 5) AS zip_code"
+        f"{f', {weight}' if weight else ''} FROM ({sql}) AS f) d"
+    )
+    doctors = f"coalesce(sum({weight}), 0)::bigint" if weight else "count(*)"
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT field, value, doctors FROM (
+                SELECT *, row_number() OVER (PARTITION BY field ORDER BY doctors DESC, value) AS position
+                FROM ({grouping_sql(source, doctors)}) facets
+            ) ranked
+            WHERE position <= %s
+            ORDER BY field, position
+            """,
+            [*params, limit],
+        )
+        return as_facets(cursor.fetchall(), limit)
+
+
+def counts(params, limit=DEFAULT_LIMIT):
+    """
+    Facets of the doctors matching the filter ``params`` (as for
+    /doctors/filter/). Raises ValueError for params the filters reject.
+    """
+    normalized = normalize_filter_params(params)
+    if not normalized:
+        return precomputed(limit)
+    # Cells hold 5-digit ZIPs, so a longer ZIP prefix needs the doctors.
+    if normalized.keys() <= CELL_PARAMS and len(normalized.get("zip_code", "")) <= 5:
+        return grouped(DoctorFacetCell.objects.filter(**field_lookups(normalized)), limit, weight="doctors")
+    return grouped(Doctor.objects.apply_filters(params), limit)
+
+
+def choices(field, limit=ADMIN_CHOICES):
+    """
+    The first ``limit`` values of ``field`` (or full names, for "name") in
+    alphabetical order.
+    """
+    if field == "name":
+        names = Doctor.objects.order_by("first_name", "last_name").values_list("first_name", "last_name")
+        return [f"{first} {last}" for first, last in names.distinct()[:limit]]
+    return list(
+        DoctorFacet.objects.filter(field=field).order_by("value").values_list("value", flat=True)[:limit]
+    )
+
+
+def cached_choices(field, limit=ADMIN_CHOICES):
+    """
+    :func:`choices` from the cache, keyed by the data version, so they are
+    read again once doctors (or their facet counts) change.
+    """
+    key = f"doctors:choices:{data_version()}:{field}:{limit}"
+    return cache.get_or_set(key, lambda: choices(field, limit), settings.DOCTOR_CACHE_TIMEOUT)
+
+
+@dataclass
+class RefreshResult:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated + self.deleted
+
+
+def sync_table(cursor, table, source, keys, result):
+    """
+    Make ``table`` hold the rows of ``source`` (keys plus ``doctors``),
+    writing only rows that differ; adds the counts to ``result``.
+    """
+    table, columns = quote(table), ", ".join(keys)
+    matches = " AND ".join(f"n.{key} = t.{key}" for key in keys)
+    cursor.execute(f"DELETE FROM {table} t WHERE NOT EXISTS (SELECT 1 FROM ({source}) n WHERE {matches})")
+    result.deleted += cursor.rowcount
+    cursor.execute(
+        f"""
+        WITH written AS (
+            INSERT INTO {table} ({columns}, doctors)
+            SELECT {columns}, doctors FROM ({source}) n
+            ON CONFLICT ({columns}) DO UPDATE SET doctors = EXCLUDED.doctors
+            WHERE {table}.doctors <> EXCLUDED.doctors
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM written
+        """
+    )
+    inserted, updated = cursor.fetchone()
+    result.inserted += inserted
+    result.updated += updated
+
+
+def refresh_facets():
+    """
+    Recount cells and facets in one scan of ``doctors`` and write only the
+    counts that changed. Readers see the old counts until the transaction
+    commits; a change bumps the cache version so cached facet responses
+    are rebuilt.
+    """
+    scan = quote("doctor_facets_scan")
+    cells = f"SELECT {', '.join(API_FIELDS)}, doctors FROM {scan}"
+    result = RefreshResult()
+    started = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Dropped here rather than ON COMMIT: the loader refreshes inside its own transaction.
+        cursor.execute(f"DROP TABLE IF EXISTS {scan}")
+        # Grouped by id, then named: a few thousand rows to join, not every doctor.
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE {scan} AS
+            SELECT coalesce(s.name, '') AS specialization, coalesce(l.state, '') AS state,
+                   coalesce(l.city, '') AS city, d.zip_code, sum(d.doctors)::bigint AS doctors
+            FROM (
+                SELECT specialty_id, location_id, coalesce(left(zip_code, 5), '') AS zip_code, count(*) AS doctors
+                FROM {quote(Doctor._meta.db_table)}
+                GROUP BY 1, 2, 3
+            ) d
+            LEFT JOIN {quote(Specialty._meta.db_table)} s ON s.id = d.specialty_id
+            LEFT JOIN {quote(Location._meta.db_table)} l ON l.id = d.location_id
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+        sync_table(cursor, DoctorFacetCell._meta.db_table, cells, API_FIELDS, result)
+        facets = grouping_sql(f"({cells}) c", "coalesce(sum(doctors), 0)::bigint")
+        sync_table(cursor, DoctorFacet._meta.db_table, facets, ("field", "value"), result)
+        cursor.execute(f"DROP TABLE {scan}")
+        if result.changed:
+            transaction.on_commit(bump_data_version)
+    result.seconds = round(time.perf_counter() - started, 3)
+    return result
@@ -0,0 +1,152 @@
+"""
+Practitioner JSON for doctor rows.
+
+``practitioner_json`` builds the resource straight from a
+``Doctor.objects.with_names().values(*PRACTITIONER_FIELDS)`` row without constructing any
+pydantic models, and ``practitioner_bundle`` a searchset Bundle of many.
+Their output is checked against the ``fhir.resources`` schema in the test
+suite instead of on every request.
+
+``?_elements=name,telecom`` asks for a summary holding only those
+top-level elements; the row then only needs ``element_columns(elements)``.
+"""
+from functools import lru_cache
+
+from .serializers import DOCTOR_FIELDS, sparse_fields
+
+# The specialty's canonical code (Specialty.code) goes in the qualification coding.
+PRACTITIONER_FIELDS = DOCTOR_FIELDS + ("specialty_code",)
+QUALIFICATION_SYSTEM = "http://terminology.hl7.org/CodeSystem/practitioner-role"
+ADDRESS_PARTS = (("city", "city"), ("state", "state"), ("postalCode", "zip_code"))
+# The elements ``_elements`` may name and the columns each one is built from.
+# resourceType and id are always returned, so asking for id is allowed too.
+ELEMENT_COLUMNS = {
+    "id": (),
+    "name": ("first_name", "last_name"),
+    "telecom": ("phone", "email"),
+    "address": ("address", "city", "state", "zip_code"),
+    "qualification": ("specialization", "specialty_code"),
+}
+ELEMENTS = tuple(ELEMENT_COLUMNS)
+# Marks a resource with elements left out (FHIR search, "_elements").
+SUBSETTED = {"tag": [{"system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue", "code": "SUBSETTED"}]}
+
+
+def requested_elements(params):
+    """
+    The elements named in ``?_elements=``, ELEMENTS itself without it or
+    when nothing is left out; raises ValueError for an element Practitioner
+    resources here don't carry.
+    """
+    elements = sparse_fields(params, ELEMENTS, param="_elements")
+    return ELEMENTS if set(elements) >= set(ELEMENTS) - {"id"} else elements
+
+
+def element_columns(elements=ELEMENTS):
+    """
+    The row columns ``practitioner_json`` reads for ``elements``.
+    """
+    columns = ["practitioner_id"]
+    for element in elements:
+        columns.extend(ELEMENT_COLUMNS[element])
+    return tuple(columns)
+
+
+@lru_cache(maxsize=4096)
+def qualification(code, specialization):
+    """
+    The ``qualification`` element for a specialty. There are only a few
+    hundred distinct specialties, so each one is built once and shared;
+    callers must treat it as read-only.
+    """
+    return [{
+        "code": {
+            "coding": [{
+                "system": QUALIFICATION_SYSTEM,
+                "code": code,
+                "display": specialization,
+            }]
+        }
+    }]
+
+
+def practitioner_json(row, elements=ELEMENTS):
+    """
+    Practitioner resource for one row. Blank columns are omitted (FHIR
+    strings may not be empty) and specialization is carried as a
+    ``qualification`` coding, since Practitioner has no ``specialty``.
+    Given ``elements`` other than ELEMENTS, the rest are left out and the
+    resource is tagged SUBSETTED.
+    """
+    resource = {"resourceType": "Practitioner", "id": str(row["practitioner_id"])}
+    if elements is not ELEMENTS:
+        resource["meta"] = SUBSETTED
+
+    if "name" in elements:
+        name = {"use": "official"}
+        if row["last_name"]:
+            name["family"] = row["last_name"]
+        if row["first_name"]:
+            name["given"] = [row["first_name"]]
+        resource["name"] = [name]
+
+    if "telecom" in elements:
+        telecom = []
+        if row["phone"]:
+            telecom.append({"system": "phone", "value": row["phone"]})
+        if row["email"]:
+            telecom.append({"system": "email", "value": row["email"]})
+        if telecom:
+            resource["telecom"] = telecom
+
+    if "address" in elements:
+        address = {"line": [row["address"]]} if row["address"] else {}
+        for key, column in ADDRESS_PARTS:
+            if row[column]:
+                address[key] = row[column]
+        if address:
+            resource["address"] = [address]
+
+    if "qualification" in elements and row["specialization"]:
+        resource["qualification"] = qualification(row["specialty_code"], row["specialization"])
+    return resource
+
+
+def not_found_entry(practitioner_id):
+    return {
+        "resource": {
+            "resourceType": "OperationOutcome",
+            "issue": [{
+                "severity": "error",
+                "code": "not-found",
+                "diagnostics": f"Practitioner/{practitioner_id} not found",
+            }],
+        },
+        "search": {"mode": "outcome"},
+    }
+
+
+def practitioner_bundle(practitioner_ids, rows, full_url, elements=ELEMENTS):
+    """
+    searchset Bundle of the rows' Practitioners in the order of
+    ``practitioner_ids``. An id without a row gets an OperationOutcome entry
+    in its place; ``total`` counts the matches only. ``full_url(id)`` is the
+    address of one Practitioner.
+    """
+    found = {str(row["practitioner_id"]): row for row in rows}
+    entries = []
+    for practitioner_id in practitioner_ids:
+        row = found.get(practitioner_id)
+        if row is None:
+            entries.append(not_found_entry(practitioner_id))
+        else:
+            entries.append({
+                "fullUrl": full_url(practitioner_id),
+                "resource": practitioner_json(row, elements),
+                "search": {"mode": "match"},
+            })
+    return {"resourceType": "Bundle", "type": "searchset", "total": len(found), "entry": entries}
+
+
+def doctor_row(doctor):
+    return {field: getattr(doctor, field) for field in PRACTITIONER_FIELDS}
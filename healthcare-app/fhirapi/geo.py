@@ -0,0 +1,79 @@
+"""
+Offline geocoding: doctors get the interior point of their 5-digit ZIP code
+from the local ``zip_centroids`` table, so no geocoding service is called.
+"""
+import csv
+
+from django.db import connection, transaction
+
+from .loading import copy_rows, quote
+from .models import Doctor, ZipCentroid
+
+# Census Gazetteer ZCTA columns, and the plain CSV alternative.
+GAZETTEER_COLUMNS = ("GEOID", "INTPTLAT", "INTPTLONG")
+CSV_COLUMNS = ("zip_code", "latitude", "longitude")
+
+
+def iter_centroids(path):
+    """
+    (zip, lat, lon) rows from a Census Gazetteer ZCTA file (tab separated)
+    or a CSV with zip_code, latitude and longitude columns.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        first_line = source.readline()
+        delimiter = "\t" if "\t" in first_line else ","
+        header = [name.strip() for name in next(csv.reader([first_line], delimiter=delimiter))]
+        names = GAZETTEER_COLUMNS if GAZETTEER_COLUMNS[0] in header else CSV_COLUMNS
+        positions = [header.index(name) for name in names]
+        for row in csv.reader(source, delimiter=delimiter):
+            zip_code, lat, lon = (row[position].strip() for position in positions)
+            yield zip_code.zfill(5), float(lat), float(lon)
+
+
+def load_centroids(path):
+    """
+    Replace the ZIP centroid table with the contents of ``path``.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {quote(ZipCentroid._meta.db_table)}")
+        return copy_rows(iter_centroids(path), ZipCentroid._meta.db_table, CSV_COLUMNS)
+
+
+def geocode_sql(bounded, only_missing):
+    doctors, centroids = quote(Doctor._meta.db_table), quote(ZipCentroid._meta.db_table)
+    return f"""
+        UPDATE {doctors} d SET latitude = z.latitude, longitude = z.longitude
+        FROM {centroids} z
+        WHERE z.zip_code = left(d.zip_code, 5)
+          AND d.practitioner_id > %s {"AND d.practitioner_id <= %s" if bounded else ""}
+          {"AND d.latitude IS NULL" if only_missing else ""}
+          AND (d.latitude, d.longitude) IS DISTINCT FROM (z.latitude, z.longitude)
+    """
+
+
+def geocode_doctors(batch_size=50000, only_missing=True, progress=None):
+    """
+    Set-wise geocoding in primary-key ranges of ``batch_size`` doctors, each
+    committed on its own so an interrupted run keeps its progress. Returns
+    the number of doctors updated.
+    """
+    doctors = quote(Doctor._meta.db_table)
+    updated, start, scanned = 0, "", 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT practitioner_id FROM {doctors} WHERE practitioner_id > %s "
+                f"ORDER BY practitioner_id OFFSET %s LIMIT 1",
+                [start, batch_size - 1],
+            )
+            row = cursor.fetchone()
+            end = row[0] if row else None
+            cursor.execute(geocode_sql(end is not None, only_missing), [start] if end is None else [start, end])
+            updated += cursor.rowcount
+        scanned += batch_size
+        if progress:
+            progress(scanned, updated)
+        if end is None:
+            return updated
+        start = end
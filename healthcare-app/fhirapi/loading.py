@@ -0,0 +1,405 @@
+"""
+Bulk ingest of doctor rows.
+
+Rows are streamed (a server-side cursor for a source table, the csv module
+or pyarrow for files), their specialty and location names swapped for ids
+a batch at a time, into an UNLOGGED staging table with COPY, then merged
+into ``doctors`` by one ``INSERT ... ON CONFLICT (practitioner_id) DO UPDATE``.
+Doctors whose content hash matches the staged row are skipped, so re-running
+a refresh only writes (and invalidates the cache for) what actually changed.
+Everything runs in one transaction: a failed load leaves the table (and any
+dropped indexes) as they were.
+"""
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import parquet
+from .facets import refresh_facets
+from .cache import MAX_TRACKED_CHANGES
+from .models import Appointment, Doctor, DoctorImportFile, DoctorSyncRun, Location, Specialty, ZipCentroid
+
+# Columns of a source row: a table, CSV header or Parquet schema.
+DOCTOR_COLUMNS = (
+    "practitioner_id", "first_name", "last_name", "specialization", "phone",
+    "email", "address", "city", "state", "zip_code",
+)
+# The same row as staged, names resolved to reference ids.
+STAGED_COLUMNS = (
+    "practitioner_id", "first_name", "last_name", "specialty_id", "phone",
+    "email", "address", "location_id", "zip_code",
+)
+SPECIALIZATION, CITY, STATE = (DOCTOR_COLUMNS.index(name) for name in ("specialization", "city", "state"))
+# Filled by the merge from zip_centroids, not read from the source.
+GEO_COLUMNS = ("latitude", "longitude")
+STAGING_TABLE = "doctors_staging"
+COPY_NULL = r"\N"
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def copy_rows(rows, table, columns=DOCTOR_COLUMNS, batch_size=50000, progress=None):
+    """
+    Stream row tuples into ``table`` with COPY, ``batch_size`` rows per round
+    trip. ``None`` is sent as NULL; empty strings stay empty strings.
+    ``progress`` is called with the running total after every batch.
+    """
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        quote(table), ", ".join(quote(c) for c in columns), COPY_NULL
+    )
+    rows = iter(rows)
+    total = 0
+    with connection.cursor() as cursor:
+        while True:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            written = 0
+            for row in rows:
+                writer.writerow([COPY_NULL if value is None else value for value in row])
+                written += 1
+                if written == batch_size:
+                    break
+            if not written:
+                break
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+            total += written
+            if progress:
+                progress(total)
+            if written < batch_size:
+                break
+    return total
+
+
+def iter_table(table, batch_size):
+    """
+    Rows of ``table`` through a named (server-side) cursor, ``batch_size``
+    rows per FETCH. Must be consumed inside a transaction.
+    """
+    connection.ensure_connection()
+    cursor = connection.connection.cursor(name=f"{STAGING_TABLE}_source")
+    cursor.itersize = batch_size
+    try:
+        cursor.execute("SELECT {} FROM {}".format(", ".join(quote(c) for c in DOCTOR_COLUMNS), quote(table)))
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def create_source_table(table):
+    """
+    An empty table with the columns :func:`iter_table` reads.
+    """
+    columns = ", ".join(f"{quote(column)} varchar" for column in DOCTOR_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(table)} ({columns})")
+
+
+def resolve_rows(rows, batch_size):
+    """
+    ``rows`` in :data:`DOCTOR_COLUMNS` order as :data:`STAGED_COLUMNS` rows:
+    specializations and (city, state) pairs replaced by the ids of their
+    reference rows, adding the ones not seen before one batch at a time.
+    """
+    specialties = Specialty.objects.ids()
+    locations = Location.objects.ids()
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        for model, known, keys in (
+            (Specialty, specialties, {(row[SPECIALIZATION],) for row in batch}),
+            (Location, locations, {(row[CITY], row[STATE]) for row in batch}),
+        ):
+            new = [key for key in keys if key not in known and model.for_key(key) is not None]
+            if new:
+                model.objects.add(new)
+                known.update(model.objects.ids())
+        for row in batch:
+            yield (
+                *row[:SPECIALIZATION], specialties.get((row[SPECIALIZATION],)), *row[SPECIALIZATION + 1:CITY],
+                locations.get((row[CITY], row[STATE])), *row[STATE + 1:],
+            )
+
+
+def iter_csv(path):
+    """
+    Rows of a CSV with a header naming the doctor columns, as written by
+    ``preprocessing.py``. Extra columns are ignored.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        reader = csv.reader(source)
+        header = next(reader)
+        positions = [header.index(column) for column in DOCTOR_COLUMNS]
+        for row in reader:
+            yield tuple(row[position] for position in positions)
+
+
+def droppable_indexes(table):
+    """
+    Name and definition of every index on ``table`` that does not back a
+    constraint; the primary key has to stay for ON CONFLICT.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+            ORDER BY c.relname
+            """,
+            [table],
+        )
+        return cursor.fetchall()
+
+
+@dataclass
+class LoadResult:
+    copied: int = 0
+    distinct: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    # Ids of the inserted, updated and deleted doctors, or None when there
+    # were more than MAX_TRACKED_CHANGES of them.
+    changed_ids: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def unchanged(self):
+        return self.distinct - self.inserted - self.updated
+
+    @property
+    def touched(self):
+        return self.inserted + self.updated + self.deleted
+
+    @property
+    def seconds(self):
+        return sum(self.timings.values())
+
+    def rows_per_second(self):
+        return round(self.copied / self.seconds) if self.seconds else None
+
+
+def merge_sql(table):
+    """
+    Insert new doctors and update those whose ``content_hash`` differs from
+    the staged row; doctors whose hash matches are never written. Written
+    rows are geocoded to their ZIP centroid on the way in.
+    """
+    columns = STAGED_COLUMNS + GEO_COLUMNS
+    updated = [c for c in columns if c != "practitioner_id"]
+    return """
+        WITH latest AS (
+            SELECT DISTINCT ON (practitioner_id) * FROM {staging}
+            ORDER BY practitioner_id, load_seq DESC
+        ), merged AS (
+            INSERT INTO {table} ({columns})
+            SELECT {staged_columns}, z.latitude, z.longitude FROM latest s
+            LEFT JOIN {centroids} z ON z.zip_code = left(s.zip_code, 5)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} d
+                WHERE d.practitioner_id = s.practitioner_id AND d.content_hash = s.content_hash
+            )
+            ON CONFLICT (practitioner_id) DO UPDATE SET {assignments}
+            RETURNING practitioner_id, (xmax = 0) AS inserted
+        )
+        SELECT (SELECT count(*) FROM latest), count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted),
+               ARRAY(SELECT practitioner_id FROM merged LIMIT %s)
+        FROM merged
+    """.format(
+        table=quote(table),
+        staging=quote(STAGING_TABLE),
+        centroids=quote(ZipCentroid._meta.db_table),
+        columns=", ".join(quote(c) for c in columns),
+        staged_columns=", ".join(f"s.{quote(c)}" for c in STAGED_COLUMNS),
+        assignments=", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in updated),
+    )
+
+
+def gone_sql(table, states):
+    """
+    Doctors missing from staging, only in ``states`` when given.
+    """
+    scope = ""
+    if states is not None:
+        scope = f"AND d.location_id IN (SELECT id FROM {quote(Location._meta.db_table)} WHERE state = ANY(%s))"
+    return f"""
+        SELECT d.practitioner_id FROM {quote(table)} d
+        WHERE NOT EXISTS (SELECT 1 FROM {quote(STAGING_TABLE)} s WHERE s.practitioner_id = d.practitioner_id)
+        {scope}
+    """
+
+
+def booked_sql(table, states):
+    """
+    How many of the doctors :func:`gone_sql` would delete have appointments
+    on or after a date, how many such appointments there are, and a few of
+    those doctors' ids.
+    """
+    appointments = Appointment._meta
+    doctor = quote(appointments.get_field("doctor").column)
+    return f"""
+        WITH booked AS (
+            SELECT a.{doctor} AS practitioner_id, count(*) AS appointments
+            FROM {quote(appointments.db_table)} a JOIN ({gone_sql(table, states)}) gone
+              ON a.{doctor} = gone.practitioner_id
+            WHERE a.{quote(appointments.get_field("appointment_date").column)} >= %s
+            GROUP BY 1
+        )
+        SELECT count(*), coalesce(sum(appointments), 0),
+               ARRAY(SELECT practitioner_id FROM booked ORDER BY 1 LIMIT 10)
+        FROM booked
+    """
+
+
+def delete_sql(table, states):
+    """
+    Delete doctors missing from staging (only in ``states`` when given),
+    together with the rows referencing them (past appointments, schedules),
+    as the models' CASCADE would.
+    """
+    dependents = "".join(
+        f"""), dependent_{number} AS (
+            DELETE FROM {quote(relation.related_model._meta.db_table)} r
+            USING gone WHERE r.{quote(relation.field.column)} = gone.practitioner_id
+        """
+        for number, relation in enumerate(Doctor._meta.related_objects)
+    )
+    return f"""
+        WITH gone AS ({gone_sql(table, states)}
+        {dependents}), deleted AS (
+            DELETE FROM {quote(table)} d USING gone WHERE d.practitioner_id = gone.practitioner_id
+            RETURNING d.practitioner_id
+        )
+        SELECT count(*), ARRAY(SELECT practitioner_id FROM deleted LIMIT %s) FROM deleted
+    """
+
+
+def load_doctors(rows, batch_size=50000, drop_indexes=False, progress=None,
+                 delete_missing=False, states=None, source="rows"):
+    """
+    Delta-sync ``rows`` (tuples in :data:`DOCTOR_COLUMNS` order) into the
+    doctors table: COPY them into staging, then insert new doctors, update
+    the ones whose content hash changed and, with ``delete_missing``, delete
+    doctors absent from the extract (only those in ``states`` when given, for
+    partial extracts). Raises ValueError, loading nothing, when the extract
+    is empty or a doctor to delete still has upcoming appointments. When a practitioner appears more than once, the last
+    row wins, as it did with per-row ``update_or_create``. Every run is
+    recorded as a :class:`DoctorSyncRun`.
+    """
+    table = Doctor._meta.db_table
+    result = LoadResult()
+    limit = MAX_TRACKED_CHANGES + 1
+
+    def timed(step, func, *args):
+        started = time.perf_counter()
+        value = func(*args)
+        result.timings[step] = round(time.perf_counter() - started, 3)
+        return value
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {quote(STAGING_TABLE)}")
+        # LIKE ... INCLUDING GENERATED gives staging the same content_hash
+        # expression; the search vector isn't needed to diff.
+        cursor.execute(f"CREATE UNLOGGED TABLE {quote(STAGING_TABLE)} (LIKE {quote(table)} INCLUDING GENERATED)")
+        cursor.execute(f"ALTER TABLE {quote(STAGING_TABLE)} DROP COLUMN search_vector, ADD COLUMN load_seq bigserial")
+        result.copied = timed(
+            "copy", copy_rows, resolve_rows(rows, batch_size), STAGING_TABLE, STAGED_COLUMNS, batch_size, progress,
+        )
+        if delete_missing and not result.copied:
+            raise ValueError("Refusing to delete every doctor: the extract is empty.")
+
+        indexes = droppable_indexes(table) if drop_indexes else []
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {quote(name)}")
+        if indexes:
+            # Check the specialty and location keys as the merge runs rather
+            # than at commit: an index can't be rebuilt with checks pending.
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        def merge():
+            cursor.execute(merge_sql(table), [limit])
+            return cursor.fetchone()
+
+        result.distinct, result.inserted, result.updated, changed = timed("merge", merge)
+
+        if delete_missing:
+            scope = [list(states)] if states is not None else []
+            cursor.execute(booked_sql(table, states), scope + [timezone.localdate()])
+            doctors, appointments, booked = cursor.fetchone()
+            if doctors:
+                raise ValueError(
+                    f"Refusing to delete {doctors} doctors missing from the extract who have {appointments} "
+                    f"upcoming appointments (e.g. {', '.join(booked)}); cancel or move them first."
+                )
+
+            def delete():
+                cursor.execute(delete_sql(table, states), scope + [limit])
+                return cursor.fetchone()
+
+            result.deleted, deleted = timed("delete", delete)
+            changed += deleted
+
+        def rebuild():
+            for _, definition in indexes:
+                cursor.execute(definition)
+
+        if indexes:
+            timed("reindex", rebuild)
+        cursor.execute(f"DROP TABLE {quote(STAGING_TABLE)}")
+        if result.touched:
+            # The reference tables too: filters resolve names to ids through them.
+            tables = (table, Specialty._meta.db_table, Location._meta.db_table)
+            timed("analyze", cursor.execute, f"ANALYZE {', '.join(quote(name) for name in tables)}")
+            timed("facets", refresh_facets)
+
+        result.changed_ids = changed if result.touched <= MAX_TRACKED_CHANGES else None
+        DoctorSyncRun.objects.create(
+            source=source[:255], seconds=result.seconds, rows_read=result.copied, inserted=result.inserted,
+            updated=result.updated, deleted=result.deleted, unchanged=result.unchanged,
+        )
+    return result
+
+
+def changed_files(directory):
+    """
+    Files of a Parquet doctor dataset whose digest differs from the one
+    recorded at their last load, with their manifest entries.
+    """
+    files = parquet.read_manifest(directory)
+    loaded = dict(DoctorImportFile.objects.filter(name__in=files).values_list("name", "sha256"))
+    return {name: entry for name, entry in files.items() if loaded.get(name) != entry["sha256"]}
+
+
+def load_parquet(directory, batch_size=50000, drop_indexes=False, progress=None, full=False,
+                 delete_missing=False):
+    """
+    Load the files of a Parquet doctor dataset that changed since the last
+    load (every file with ``full``). Returns the load result and the names of
+    the files read. A partial load only deletes missing doctors in the states
+    it read; a state whose file disappeared is cleaned up by a full load.
+    """
+    files = parquet.read_manifest(directory) if full else changed_files(directory)
+    if not files:
+        return LoadResult(), []
+    names = sorted(files)
+    states = None
+    if delete_missing and not full:
+        states = parquet.read_doctors(directory, ["state"], names).column("state").unique().to_pylist()
+    with transaction.atomic():
+        result = load_doctors(
+            parquet.iter_rows(directory, names, DOCTOR_COLUMNS, batch_size), batch_size, drop_indexes, progress,
+            delete_missing=delete_missing, states=states, source=f"parquet:{directory}",
+        )
+        for name in names:
+            DoctorImportFile.objects.update_or_create(
+                name=name, defaults={"sha256": files[name]["sha256"], "rows": files[name]["rows"]}
+            )
+    return result, names
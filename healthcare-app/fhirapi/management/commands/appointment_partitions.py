@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from fhirapi import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly appointment partitions and archive the expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.APPOINTMENT_PARTITION_MONTHS_AHEAD,
+                            help='Months ahead of this one to create partitions for')
+        parser.add_argument('--keep-months', type=int, default=settings.APPOINTMENT_RETENTION_MONTHS,
+                            help='Past months to keep before archiving their partition')
+        parser.add_argument('--no-archive', action='store_true', help='Only create partitions')
+
+    def handle(self, *args, **options):
+        result = partitions.maintain(options['ahead'], options['keep_months'], archive=not options['no_archive'])
+        for name, rows in result.archived.items():
+            self.stdout.write(f"Archived {name}: {rows} appointments")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result.created)} partitions created ({result.moved} appointments moved out of the default "
+            f"partition), {len(result.archived)} archived."
+        ))
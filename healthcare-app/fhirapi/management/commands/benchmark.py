@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from fhirapi.benchmarks import ROW_PRESETS, load_results, load_scenarios, regressions, row_count, save_results
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(load_scenarios()))
+        parser.add_argument('--rows', type=row_count, default=1_000_000,
+                            help=f'Synthetic doctors to generate: a number or one of {", ".join(ROW_PRESETS)}')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed iterations per measurement')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--max-regression', type=float, default=10.0,
+                            help='Fail when a p50 latency or a throughput is this many percent worse than '
+                                 'the baseline (default 10)')
+
+    def handle(self, *args, **options):
+        func = load_scenarios()[options['scenario']]
+        baseline = load_results(options['baseline']) if options['baseline'] else None
+        if not func.needs_db:
+            results = func(options, self.stdout.write)
+        else:
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+            try:
+                results = func(options, self.stdout.write)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['output']:
+            save_results(options['output'], options['scenario'], options, results or {})
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            worse = regressions(baseline, results or {}, options['max_regression'])
+            for name, before, after, change in worse:
+                self.stdout.write(self.style.ERROR(f"{name}: {before} -> {after} ({change:+.1f}% worse)"))
+            if worse:
+                raise CommandError(
+                    f"{len(worse)} results regressed more than {options['max_regression']}% against "
+                    f"{options['baseline']}"
+                )
+            self.stdout.write(f"No regression past {options['max_regression']}% against {options['baseline']}")
+        self.stdout.write(self.style.SUCCESS(f"Benchmark '{options['scenario']}' finished."))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fhirapi import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send due outbox emails in batches, once or continuously with --watch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE,
+                            help='Messages sent per SMTP connection')
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='Keep polling, sleeping this long whenever the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            result = outbox.drain(options['batch_size'])
+            if result.sent or result.retried or result.dead:
+                self.stdout.write(
+                    f"sent {result.sent}, retrying {result.retried}, dead-lettered {result.dead} "
+                    f"in {result.seconds:.2f}s ({result.messages_per_second or 0:,.0f} msg/s), "
+                    f"lag {result.lag_seconds:.1f}s"
+                )
+            if options['watch'] is None:
+                stats = outbox.stats()
+                self.stdout.write(f"{stats['pending']} pending, {stats['dead']} dead, lag {stats['lag_seconds']}s")
+                return
+            time.sleep(options['watch'])
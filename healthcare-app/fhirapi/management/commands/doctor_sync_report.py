@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from fhirapi.models import DoctorSyncRun
+
+
+class Command(BaseCommand):
+    help = 'Show how many doctors the recent loader runs inserted, updated and deleted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Number of recent runs to show')
+
+    def handle(self, *args, **options):
+        runs = DoctorSyncRun.objects.all()[:options['runs']]
+        if not runs:
+            self.stdout.write('No loader runs recorded yet.')
+            return
+        self.stdout.write(
+            f"{'started':<17} {'read':>10} {'inserted':>9} {'updated':>9} {'deleted':>9} "
+            f"{'touched':>9} {'seconds':>8}  source"
+        )
+        for run in runs:
+            self.stdout.write(
+                f"{run.started_at:%Y-%m-%d %H:%M} {run.rows_read:>10,} {run.inserted:>9,} {run.updated:>9,} "
+                f"{run.deleted:>9,} {run.touched:>9,} {run.seconds:>8.1f}  {run.source}"
+            )
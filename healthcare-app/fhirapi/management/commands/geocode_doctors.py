@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fhirapi.cache import bump_data_version
+from fhirapi.geo import geocode_doctors
+
+
+class Command(BaseCommand):
+    help = 'Set doctor latitude/longitude from the local ZIP centroid table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Doctors per UPDATE')
+        parser.add_argument('--all', action='store_true', help='Re-geocode doctors that already have a location')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        started = time.perf_counter()
+
+        def progress(scanned, updated):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  scanned ~{scanned:,} doctors, {updated:,} geocoded ({scanned / elapsed:,.0f} rows/s)")
+
+        updated = geocode_doctors(options['batch_size'], only_missing=not options['all'], progress=progress)
+        if updated:
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Geocoded {updated} doctors in {time.perf_counter() - started:.1f}s."
+        ))
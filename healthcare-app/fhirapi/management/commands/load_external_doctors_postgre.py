@@ -1,33 +1,71 @@
-from django.core.management.base import BaseCommand
-from django.db import connection
-from fhirapi.models import Doctor
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fhirapi.cache import bump_doctor_versions
+from fhirapi.loading import iter_csv, iter_table, load_doctors, load_parquet
+
 
 class Command(BaseCommand):
-    help = 'Load doctor data from existing PostgreSQL table into Django model'
-
-    def handle(self, *args, **kwargs):
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT practitioner_id, first_name, last_name, specialization, phone, email,
-                       address, city, state, zip_code
-                FROM doctors
-            """)
-            rows = cursor.fetchall()
-
-            for row in rows:
-                Doctor.objects.update_or_create(
-                    practitioner_id=row[0],
-                    defaults={
-                        'first_name': row[1],
-                        'last_name': row[2],
-                        'specialization': row[3],
-                        'phone': row[4],
-                        'email': row[5],
-                        'address': row[6],
-                        'city': row[7],
-                        'state': row[8],
-                        'zip_code': row[9],
-                    }
-                )
-
-        self.stdout.write(self.style.SUCCESS(f"Imported {len(rows)} doctors from external table."))
+    help = 'Load doctor data from an external PostgreSQL table (or a preprocessed CSV or Parquet dataset) into the doctors table'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--source-table', default='doctors', help='Table to read doctors from')
+        source.add_argument('--csv', help='CSV written by preprocessing.py to read doctors from')
+        source.add_argument(
+            '--parquet', help='Parquet dataset directory written by preprocessing.py; only changed files are loaded',
+        )
+        parser.add_argument('--full', action='store_true', help='With --parquet, load every file even if unchanged')
+        parser.add_argument(
+            '--delete-missing', action='store_true',
+            help='Delete doctors that are missing from the extract; refused while any of them has upcoming '
+                 'appointments',
+        )
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows per FETCH and per COPY')
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help='Drop secondary indexes for the merge and rebuild them afterwards (faster for full refreshes)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        started = time.perf_counter()
+
+        def progress(copied):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  copied {copied:,} rows ({copied / elapsed:,.0f} rows/s)")
+
+        load_options = {'batch_size': options['batch_size'], 'drop_indexes': options['drop_indexes'],
+                        'progress': progress, 'delete_missing': options['delete_missing']}
+        if options['parquet']:
+            try:
+                result, files = load_parquet(options['parquet'], full=options['full'], **load_options)
+            except ValueError as error:
+                raise CommandError(str(error))
+            if not files:
+                self.stdout.write(self.style.SUCCESS('No dataset files changed since the last load.'))
+                return
+            self.stdout.write(f"Loaded {len(files)} changed file(s): {', '.join(files)}")
+        else:
+            if options['csv']:
+                rows, source = iter_csv(options['csv']), f"csv:{options['csv']}"
+            else:
+                rows, source = iter_table(options['source_table'], options['batch_size']), options['source_table']
+            try:
+                result = load_doctors(rows, source=source, **load_options)
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        if result.touched:
+            bump_doctor_versions(result.changed_ids)
+        steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in result.timings.items())
+        self.stdout.write(
+            f"{result.inserted:,} new, {result.updated:,} updated, {result.deleted:,} deleted, "
+            f"{result.unchanged:,} unchanged ({steps})"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.copied} doctors from external table "
+            f"in {result.seconds:.2f}s ({result.rows_per_second() or 0:,} rows/s)."
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from fhirapi.geo import load_centroids
+
+
+class Command(BaseCommand):
+    help = 'Load ZIP code centroids (Census Gazetteer ZCTA file or zip_code,latitude,longitude CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='e.g. 2020_Gaz_zcta_national.txt')
+
+    def handle(self, *args, **options):
+        count = load_centroids(options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {count} ZIP centroids. Run geocode_doctors to update doctor locations."
+        ))
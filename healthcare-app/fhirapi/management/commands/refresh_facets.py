@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from fhirapi.facets import refresh_facets
+
+
+class Command(BaseCommand):
+    help = 'Recount the precomputed doctor facets (specialization, state, city, ZIP)'
+
+    def handle(self, *args, **options):
+        result = refresh_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed facets in {result.seconds:.2f}s: {result.inserted} added, "
+            f"{result.updated} recounted, {result.deleted} removed."
+        ))
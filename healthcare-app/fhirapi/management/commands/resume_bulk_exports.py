@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from fhirapi.models import ExportJob
+from fhirapi.tasks import start_practitioner_export
+
+
+class Command(BaseCommand):
+    help = 'Re-queue unfinished FHIR $export jobs; only chunks without a finished file are redone'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_ids', nargs='*', help='Jobs to resume (default: every unfinished job)')
+
+    def handle(self, *args, **options):
+        jobs = ExportJob.objects.filter(status__in=[ExportJob.ACCEPTED, ExportJob.IN_PROGRESS])
+        if options['job_ids']:
+            jobs = jobs.filter(pk__in=options['job_ids'])
+
+        resumed = 0
+        for job in jobs:
+            pending = job.chunks.filter(done=False).count()
+            start_practitioner_export.delay(str(job.job_id))
+            self.stdout.write(f"{job.job_id}: {pending} chunk(s) pending, {job.resource_count} resources written")
+            resumed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Resumed {resumed} export job(s)."))
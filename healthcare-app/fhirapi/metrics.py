@@ -0,0 +1,304 @@
+"""
+Per-route request metrics: wall time, database queries and time,
+serialization time and response size, exported as Prometheus histograms
+on ``/metrics`` and summed up per response in a ``Server-Timing`` header.
+
+:class:`MetricsMiddleware` opens a :class:`RequestMetrics` for each request.
+Every database connection gets :func:`record_query` as an execute wrapper
+when it connects (see signals), so queries are counted on whichever thread
+runs them, including the worker threads behind the async views.
+Serializers and renderers time themselves with :func:`serializing`.
+
+The same SQL run ``METRICS_N_PLUS_ONE_THRESHOLD`` times or more in one
+request is logged as an N+1 pattern and counted per route: a related
+object resolved lazily per row, like ``AppointmentSerializer.doctor_name``
+over appointments fetched without ``select_related("doctor")``.
+
+Histograms live in the process, so each gunicorn or uvicorn worker serves
+its own. Streaming responses are measured up to their first byte; the
+queries and bytes of the body that follows are not counted.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+LABELS = ("method", "route")
+# Routes left out of the metrics: scrapes would otherwise measure themselves.
+UNMEASURED_ROUTES = {"metrics"}
+
+_current = ContextVar("request_metrics", default=None)
+# One lock for every metric, so a request's observations take it once.
+_lock = threading.Lock()
+
+
+def label_text(names, values):
+    escaped = (str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Histogram:
+    """
+    Cumulative histogram per label set, in the Prometheus text format.
+    """
+    def __init__(self, name, documentation, buckets, labels=LABELS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}
+
+    def observe(self, labels, value):
+        with _lock:
+            self.add(labels, value)
+
+    def add(self, labels, value):
+        # Callers hold _lock. The first bucket whose upper bound holds the
+        # value; past the last one is +Inf.
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def clear(self):
+        with _lock:
+            self._series.clear()
+
+    def samples(self, labels):
+        with _lock:
+            counts, total = self._series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            return list(counts), total
+
+    def exposition(self):
+        with _lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in series:
+            text = label_text(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{text}}} {total!r}")
+            lines.append(f"{self.name}_count{{{text}}} {cumulative}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=LABELS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def clear(self):
+        with _lock:
+            self._values.clear()
+
+    def value(self, labels):
+        with _lock:
+            return self._values.get(labels, 0)
+
+    def exposition(self):
+        with _lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{{{label_text(self.labels, labels)}}} {value}" for labels, value in values]
+        return "\n".join(lines)
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Wall time from the first middleware to the response.", SECONDS_BUCKETS,
+)
+DB_QUERIES = Histogram("http_request_db_queries", "Database queries run by the request.", QUERY_BUCKETS)
+DB_SECONDS = Histogram(
+    "http_request_db_duration_seconds", "Time spent executing database queries.", SECONDS_BUCKETS,
+)
+SERIALIZE_SECONDS = Histogram(
+    "http_request_serialization_seconds", "Time spent in serializers, encoders and renderers.", SECONDS_BUCKETS,
+)
+RESPONSE_BYTES = Histogram("http_response_size_bytes", "Size of non-streaming response bodies.", BYTES_BUCKETS)
+N_PLUS_ONE = Counter(
+    "http_request_n_plus_one_total", "Requests that repeated one query METRICS_N_PLUS_ONE_THRESHOLD times or more.",
+)
+METRICS = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, SERIALIZE_SECONDS, RESPONSE_BYTES, N_PLUS_ONE)
+
+
+def exposition():
+    return "\n".join(metric.exposition() for metric in METRICS) + "\n"
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
+
+
+class RequestMetrics:
+    """
+    Queries, database and serialization time of one request so far.
+    """
+    __slots__ = ("queries", "db_seconds", "serialize_seconds", "statements", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # SQL text (with placeholders) -> times run.
+        self.statements = {}
+        self.serializing = False
+
+    def repeated(self, threshold):
+        """
+        ``{sql: runs}`` of the statements run at least ``threshold`` times.
+        """
+        return {sql: runs for sql, runs in self.statements.items() if runs >= threshold}
+
+    def server_timing(self, seconds):
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f"serialize;dur={self.serialize_seconds * 1000:.1f}, total;dur={seconds * 1000:.1f}"
+        )
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def collecting():
+    """
+    Record the queries and serialization of the block in a new
+    :class:`RequestMetrics`, which it yields.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection; counts and times the
+    query into the current request's metrics, if any.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_seconds += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.statements[sql] = metrics.statements.get(sql, 0) + 1
+
+
+def instrument(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class serializing:
+    """
+    Count the block as serialization time of the current request. Nested
+    blocks (a renderer around a serializer) count once. A class rather than
+    a generator: it runs for every response.
+    """
+    __slots__ = ("metrics", "started")
+
+    def __enter__(self):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            self.metrics = None
+            return
+        self.metrics = metrics
+        metrics.serializing = True
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.serialize_seconds += time.perf_counter() - self.started
+            self.metrics.serializing = False
+
+
+class MeteredJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serializing():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def metrics_view(request):
+    return HttpResponse(exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """
+    Records each request into the histograms by method and URL route (the
+    pattern, so every doctor's detail page is one series) and sets its
+    ``Server-Timing`` header. Goes first in MIDDLEWARE to time the rest.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.METRICS_N_PLUS_ONE_THRESHOLD
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with collecting() as metrics:
+            response = self.get_response(request)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with collecting() as metrics:
+            response = await self.get_response(request)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    def record(self, request, response, metrics, seconds):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        if route in UNMEASURED_ROUTES:
+            return response
+        labels = (request.method, route)
+        size = None if response.streaming else len(response.content)
+        with _lock:
+            REQUEST_SECONDS.add(labels, seconds)
+            DB_QUERIES.add(labels, metrics.queries)
+            DB_SECONDS.add(labels, metrics.db_seconds)
+            SERIALIZE_SECONDS.add(labels, metrics.serialize_seconds)
+            if size is not None:
+                RESPONSE_BYTES.add(labels, size)
+        repeated = metrics.repeated(self.threshold)
+        if repeated:
+            N_PLUS_ONE.inc(labels)
+            for sql, runs in repeated.items():
+                logger.warning("N+1 queries: %s %s ran %d times: %s", request.method, route, runs, sql)
+        response["Server-Timing"] = metrics.server_timing(seconds)
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0007_doctor_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['first_name', 'last_name', 'practitioner_id'], name='doctors_name_order_idx'),
+        ),
+    ]
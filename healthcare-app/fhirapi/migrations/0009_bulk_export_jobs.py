@@ -0,0 +1,46 @@
+# Generated by Django 5.2.2 on 2026-10-18 04:24
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0008_doctor_name_order_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('accepted', 'Accepted'), ('in-progress', 'In progress'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='accepted', max_length=20)),
+                ('request_url', models.TextField()),
+                ('chunk_size', models.PositiveIntegerField(default=10000)),
+                ('resource_count', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('transaction_time', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('start_after', models.CharField(blank=True, max_length=50, null=True)),
+                ('end_at', models.CharField(blank=True, max_length=50, null=True)),
+                ('done', models.BooleanField(default=False)),
+                ('resource_count', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='fhirapi.exportjob')),
+            ],
+            options={
+                'ordering': ['index'],
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
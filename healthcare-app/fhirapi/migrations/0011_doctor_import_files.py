@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0009_bulk_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorImportFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 04:46
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0011_doctor_import_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('seconds', models.FloatField(default=0)),
+                ('rows_read', models.PositiveBigIntegerField(default=0)),
+                ('inserted', models.PositiveBigIntegerField(default=0)),
+                ('updated', models.PositiveBigIntegerField(default=0)),
+                ('deleted', models.PositiveBigIntegerField(default=0)),
+                ('unchanged', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='content_hash',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.MD5(django.db.models.functions.text.Concat(models.F('first_name'), models.Value('\x1f'), models.F('last_name'), models.Value('\x1f'), models.F('specialization'), models.Value('\x1f'), models.F('phone'), models.Value('\x1f'), models.F('email'), models.Value('\x1f'), models.F('address'), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce('city', models.Value('\\N')), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce('state', models.Value('\\N')), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce('zip_code', models.Value('\\N')), output_field=models.TextField())), output_field=models.CharField(max_length=32)),
+        ),
+    ]
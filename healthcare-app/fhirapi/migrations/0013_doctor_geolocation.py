@@ -0,0 +1,43 @@
+# Generated by Django 5.2.2 on 2026-10-18 05:38
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import fhirapi.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0012_doctor_delta_sync'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.CreateExtension('cube'),
+        django.contrib.postgres.operations.CreateExtension('earthdistance'),
+        migrations.CreateModel(
+            name='ZipCentroid',
+            fields=[
+                ('zip_code', models.CharField(max_length=5, primary_key=True, serialize=False)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'db_table': 'zip_centroids',
+            },
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=django.contrib.postgres.indexes.GistIndex(fhirapi.models.LLToEarth(models.F('latitude'), models.F('longitude')), name='doctors_location_gist_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.2 on 2026-10-18 05:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0013_doctor_geolocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30)),
+                ('valid_from', models.DateField(blank=True, null=True)),
+                ('valid_until', models.DateField(blank=True, null=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='fhirapi.doctor')),
+            ],
+            options={
+                'ordering': ['doctor', 'weekday', 'start_time'],
+                'indexes': [models.Index(fields=['doctor', 'weekday'], name='schedule_doctor_weekday_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('start_time__lt', models.F('end_time'))), name='schedule_starts_before_end'), models.CheckConstraint(condition=models.Q(('slot_minutes__gt', 0)), name='schedule_slot_minutes_positive')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='fhirapi.doctor')),
+            ],
+            options={
+                'ordering': ['doctor', 'date', 'start_time'],
+                'indexes': [models.Index(fields=['doctor', 'date'], name='schedule_exception_day_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('end_time__isnull', True), ('start_time__isnull', True)), ('start_time__lt', models.F('end_time')), _connector='OR'), name='schedule_exception_whole_day_or_range')],
+            },
+        ),
+    ]
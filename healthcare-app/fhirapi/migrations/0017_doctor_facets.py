@@ -0,0 +1,45 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:21
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0016_outbox_messages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('total', 'total'), ('specialization', 'specialization'), ('state', 'state'), ('city', 'city'), ('zip_code', 'zip_code')], max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('doctors', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'doctor_facets',
+                'indexes': [models.Index(fields=['field', '-doctors'], name='doctor_facet_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('field', 'value'), name='doctor_facet_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DoctorFacetCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('city', models.CharField(max_length=100)),
+                ('zip_code', models.CharField(max_length=5)),
+                ('doctors', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'doctor_facet_cells',
+                'indexes': [models.Index(django.db.models.functions.text.Upper('state'), name='facet_cell_state_upper_idx'), models.Index(fields=['zip_code'], name='facet_cell_zip_prefix_idx', opclasses=['varchar_pattern_ops']), django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('specialization'), name='gin_trgm_ops'), name='facet_cell_special_trgm_idx'), django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('city'), name='gin_trgm_ops'), name='facet_cell_city_trgm_idx')],
+                'constraints': [models.UniqueConstraint(fields=('specialization', 'state', 'city', 'zip_code'), name='doctor_facet_cell_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,184 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+SEARCH_VECTOR_TRIGGER = r"""
+CREATE FUNCTION doctors_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.first_name, '') || ' ' || coalesce(NEW.last_name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(
+            (SELECT name FROM specialties WHERE id = NEW.specialty_id), '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(
+            (SELECT city FROM locations WHERE id = NEW.location_id), '')), 'C');
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER doctors_search_vector
+    BEFORE INSERT OR UPDATE OF first_name, last_name, specialty_id, location_id ON doctors
+    FOR EACH ROW EXECUTE FUNCTION doctors_search_vector();
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER doctors_search_vector ON doctors;
+DROP FUNCTION doctors_search_vector();
+"""
+
+# One UPDATE sets both ids, and through the trigger the search vector, so
+# the table is rewritten once. NULL parts of a location are matched through
+# a marker so the join can hash.
+FILL_REFERENCES = r"""
+INSERT INTO specialties (code, name)
+SELECT replace(upper(specialization), ' ', '_'), specialization FROM doctors
+WHERE specialization <> '' GROUP BY specialization;
+
+INSERT INTO locations (city, state)
+SELECT city, state FROM doctors
+WHERE city IS NOT NULL OR state IS NOT NULL GROUP BY city, state;
+
+UPDATE doctors d SET specialty_id = n.specialty_id, location_id = n.location_id
+FROM (
+    SELECT d.practitioner_id, s.id AS specialty_id, l.id AS location_id
+    FROM doctors d
+    LEFT JOIN specialties s ON s.name = d.specialization
+    LEFT JOIN locations l ON coalesce(l.city, '\N') = coalesce(d.city, '\N')
+                         AND coalesce(l.state, '\N') = coalesce(d.state, '\N')
+) n
+WHERE n.practitioner_id = d.practitioner_id;
+
+ANALYZE specialties, locations;
+"""
+
+FILL_NAMES = """
+UPDATE doctors d SET specialization = coalesce(s.name, ''), city = l.city, state = l.state
+FROM doctors n
+LEFT JOIN specialties s ON s.id = n.specialty_id
+LEFT JOIN locations l ON l.id = n.location_id
+WHERE n.practitioner_id = d.practitioner_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0017_doctor_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Specialty',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(db_index=True, max_length=100)),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'specialties',
+                'db_table': 'specialties',
+            },
+        ),
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('state', models.CharField(blank=True, max_length=100, null=True)),
+            ],
+            options={
+                'db_table': 'locations',
+                'indexes': [models.Index(django.db.models.functions.text.Upper('state'), name='locations_state_upper_idx'), django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('city'), name='gin_trgm_ops'), name='locations_city_trgm_idx')],
+                'constraints': [models.UniqueConstraint(fields=('city', 'state'), name='location_unique', nulls_distinct=False)],
+            },
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='specialty',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='fhirapi.specialty'),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='doctors', to='fhirapi.location'),
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_search_vector_idx',
+        ),
+        migrations.RemoveField(
+            model_name='doctor',
+            name='search_vector',
+        ),
+        migrations.RemoveField(
+            model_name='doctor',
+            name='content_hash',
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+        migrations.RunSQL(FILL_REFERENCES, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='doctors_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialty', 'location'], name='doctors_specialty_location_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_city_32a444_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_state_e56250_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_special_6661e0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_state_upper_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_special_trgm_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctor',
+            name='doctors_city_trgm_idx',
+        ),
+        # Nullable while it goes so that, migrating back, it can be re-added
+        # to a full table and filled before NOT NULL is restored.
+        migrations.AlterField(
+            model_name='doctor',
+            name='specialization',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.RunSQL(migrations.RunSQL.noop, FILL_NAMES),
+        migrations.RemoveField(
+            model_name='doctor',
+            name='specialization',
+        ),
+        migrations.RemoveField(
+            model_name='doctor',
+            name='city',
+        ),
+        migrations.RemoveField(
+            model_name='doctor',
+            name='state',
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='content_hash',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.MD5(django.db.models.functions.text.Concat(models.F('first_name'), models.Value('\x1f'), models.F('last_name'), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce(django.db.models.functions.comparison.Cast('specialty', models.TextField()), models.Value('\\N'), output_field=models.TextField()), models.Value('\x1f'), models.F('phone'), models.Value('\x1f'), models.F('email'), models.Value('\x1f'), models.F('address'), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce(django.db.models.functions.comparison.Cast('location', models.TextField()), models.Value('\\N'), output_field=models.TextField()), models.Value('\x1f'), django.db.models.functions.comparison.Coalesce(django.db.models.functions.comparison.Cast('zip_code', models.TextField()), models.Value('\\N'), output_field=models.TextField()), output_field=models.TextField())), output_field=models.CharField(max_length=32)),
+        ),
+    ]
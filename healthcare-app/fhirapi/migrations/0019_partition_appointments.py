@@ -0,0 +1,150 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+# The old table keeps its index and sequence names until it is dropped, so
+# the new one names its constraints and gets its identity afterwards. A
+# unique constraint on a partitioned table must include appointment_date.
+PARTITION = r"""
+ALTER TABLE fhirapi_appointment RENAME TO fhirapi_appointment_unpartitioned;
+
+CREATE TABLE fhirapi_appointment (
+    id bigint NOT NULL,
+    appointment_id uuid NOT NULL,
+    patient_name varchar(100) NOT NULL,
+    phone_number varchar(15) NOT NULL,
+    email varchar(254) NOT NULL,
+    reason text NOT NULL,
+    appointment_date date NOT NULL,
+    appointment_time time NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    doctor_id varchar(50) NOT NULL
+        REFERENCES doctors (practitioner_id) DEFERRABLE INITIALLY DEFERRED,
+    CONSTRAINT appointment_pkey PRIMARY KEY (id, appointment_date),
+    CONSTRAINT appointment_slot_unique UNIQUE (doctor_id, appointment_date, appointment_time),
+    CONSTRAINT appointment_id_unique UNIQUE (appointment_id, appointment_date)
+) PARTITION BY RANGE (appointment_date);
+
+CREATE TABLE fhirapi_appointment_default PARTITION OF fhirapi_appointment DEFAULT;
+
+-- A partition for every month holding appointments and the next 12.
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT date_trunc('month', appointment_date)::date FROM fhirapi_appointment_unpartitioned
+        UNION
+        SELECT (date_trunc('month', current_date) + make_interval(months => n))::date FROM generate_series(0, 12) n
+        ORDER BY 1
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF fhirapi_appointment FOR VALUES FROM (%L) TO (%L)',
+            'fhirapi_appointment_p' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO fhirapi_appointment (
+    id, appointment_id, patient_name, phone_number, email, reason,
+    appointment_date, appointment_time, created_at, doctor_id
+)
+SELECT id, appointment_id, patient_name, phone_number, email, reason,
+       appointment_date, appointment_time, created_at, doctor_id
+FROM fhirapi_appointment_unpartitioned;
+
+-- ALTER TABLE refuses to run with the copied rows' foreign key checks pending.
+SET CONSTRAINTS ALL IMMEDIATE;
+DROP TABLE fhirapi_appointment_unpartitioned;
+
+ALTER TABLE fhirapi_appointment ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('fhirapi_appointment', 'id'), coalesce(max(id), 0) + 1, false)
+FROM fhirapi_appointment;
+ANALYZE fhirapi_appointment;
+"""
+
+# Back to one table with the names Django gave it, archived months aside.
+UNPARTITION = r"""
+ALTER TABLE fhirapi_appointment RENAME TO fhirapi_appointment_partitioned;
+
+CREATE TABLE fhirapi_appointment (
+    id bigint NOT NULL PRIMARY KEY,
+    appointment_id uuid NOT NULL CONSTRAINT fhirapi_appointment_appointment_id_key UNIQUE,
+    patient_name varchar(100) NOT NULL,
+    phone_number varchar(15) NOT NULL,
+    email varchar(254) NOT NULL,
+    reason text NOT NULL,
+    appointment_date date NOT NULL,
+    appointment_time time NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    doctor_id varchar(50) NOT NULL
+        CONSTRAINT fhirapi_appointment_doctor_id_c5fcf012_fk_doctors_p
+        REFERENCES doctors (practitioner_id) DEFERRABLE INITIALLY DEFERRED,
+    CONSTRAINT fhirapi_appointment_doctor_id_appointment_da_4f088ab2_uniq
+        UNIQUE (doctor_id, appointment_date, appointment_time)
+);
+CREATE INDEX fhirapi_appointment_doctor_id_c5fcf012 ON fhirapi_appointment (doctor_id);
+CREATE INDEX fhirapi_appointment_doctor_id_c5fcf012_like ON fhirapi_appointment (doctor_id varchar_pattern_ops);
+
+INSERT INTO fhirapi_appointment (
+    id, appointment_id, patient_name, phone_number, email, reason,
+    appointment_date, appointment_time, created_at, doctor_id
+)
+SELECT id, appointment_id, patient_name, phone_number, email, reason,
+       appointment_date, appointment_time, created_at, doctor_id
+FROM fhirapi_appointment_partitioned;
+
+-- ALTER TABLE refuses to run with the copied rows' foreign key checks pending.
+SET CONSTRAINTS ALL IMMEDIATE;
+DROP TABLE fhirapi_appointment_partitioned;
+
+ALTER TABLE fhirapi_appointment ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('fhirapi_appointment', 'id'), coalesce(max(id), 0) + 1, false)
+FROM fhirapi_appointment;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fhirapi', '0018_specialty_location'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION, UNPARTITION),
+            ],
+            state_operations=[
+                migrations.AlterModelOptions(
+                    name='appointment',
+                    options={},
+                ),
+                migrations.AlterField(
+                    model_name='appointment',
+                    name='appointment_id',
+                    field=models.UUIDField(default=uuid.uuid4, editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='appointment',
+                    name='doctor',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='appointments', to='fhirapi.doctor'),
+                ),
+                migrations.AlterUniqueTogether(
+                    name='appointment',
+                    unique_together=set(),
+                ),
+                migrations.AddConstraint(
+                    model_name='appointment',
+                    constraint=models.UniqueConstraint(fields=('doctor', 'appointment_date', 'appointment_time'), name='appointment_slot_unique'),
+                ),
+                migrations.AddConstraint(
+                    model_name='appointment',
+                    constraint=models.UniqueConstraint(fields=('appointment_id', 'appointment_date'), name='appointment_id_unique'),
+                ),
+            ],
+        ),
+    ]
@@ -1,10 +1,241 @@
+import datetime
+import json
+import math
 import uuid
-from django.db import models
-from django.db.models import Q
+from contextlib import contextmanager
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+from django.db.models import BooleanField, F, Field, FloatField, Func, Lookup, Q, TextField, Value
+from django.db.models.functions import ASin, Cast, Coalesce, Concat, Least, MD5, Upper
+from django.utils import timezone
 from fhir.resources.practitioner import Practitioner
-from fhir.resources.humanname import HumanName
-from fhir.resources.address import Address
-from fhir.resources.contactpoint import ContactPoint
+
+
+def name_ordering(sort: str = "asc"):
+    """
+    Field list for the public name sort, shared by every ordering helper.
+    The primary key breaks ties so the order is total, which keyset
+    pagination relies on.
+    """
+    fields = ("first_name", "last_name", "practitioner_id")
+    if str(sort).lower() == "desc":
+        return tuple(f"-{field}" for field in fields)
+    return fields
+
+
+FILTER_PARAMS = (
+    "id", "first_name", "last_name", "specialization", "city", "state", "zip_code", "q",
+    "near_zip", "lat", "lon", "radius", "available_within",
+)
+# Params matched case-insensitively by apply_filters.
+CASE_INSENSITIVE_PARAMS = frozenset({"first_name", "last_name", "specialization", "city", "state", "q"})
+
+
+def content_hash_expression(fields, nullable):
+    """
+    MD5 over ``fields`` (as text) joined by a unit separator. Nullable
+    fields map NULL to a marker so that NULL and '' hash differently.
+    """
+    parts = []
+    for name in fields:
+        parts.append(
+            Coalesce(Cast(name, TextField()), Value("\\N"), output_field=TextField()) if name in nullable else F(name)
+        )
+        parts.append(Value("\x1f"))
+    return MD5(Concat(*parts[:-1], output_field=TextField()))
+
+
+# earthdistance's earth(): the sphere ll_to_earth() places points on.
+EARTH_RADIUS_METERS = 6378168.0
+METERS_PER_MILE = 1609.344
+DEFAULT_RADIUS_MILES = 10.0
+MAX_RADIUS_MILES = 100.0
+MAX_AVAILABILITY_DAYS = 31
+
+
+class LLToEarth(Func):
+    """
+    ``ll_to_earth(latitude, longitude)``: the location as a 3-D point on the
+    earthdistance sphere. The GiST index on this expression answers both the
+    radius box and nearest-first (KNN) ordering without PostGIS.
+    """
+    function = "ll_to_earth"
+    output_field = Field()
+
+
+class EarthBox(Func):
+    """
+    ``earth_box(point, meters)``: a cube containing every point within
+    ``meters`` of ``point`` along the surface.
+    """
+    function = "earth_box"
+    output_field = Field()
+
+
+class CubeContainedIn(Func):
+    template = "(%(expressions)s)"
+    arg_joiner = " <@ "
+    output_field = BooleanField()
+
+
+class CubeDistance(Func):
+    """
+    Straight-line distance in meters between two cubes; for points on the
+    sphere it grows with the great-circle distance, so the index can order by it.
+    """
+    template = "(%(expressions)s)"
+    arg_joiner = " <-> "
+    output_field = FloatField()
+
+
+@models.CharField.register_lookup
+class Any(Lookup):
+    """
+    ``column = ANY(%s)`` with the values bound as one array, so a lookup of
+    any number of ids is the same statement (``__in`` spells out one
+    placeholder per value).
+    """
+    lookup_name = "any"
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return "%s", [[self.lhs.output_field.get_db_prep_value(item, connection) for item in value]]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} = ANY({rhs})", (*lhs_params, *rhs_params)
+
+
+def earth_location():
+    return LLToEarth(F("latitude"), F("longitude"))
+
+
+def chord_meters(miles):
+    """
+    Straight-line distance between two points ``miles`` apart along the surface.
+    """
+    return 2 * EARTH_RADIUS_METERS * math.sin(miles * METERS_PER_MILE / (2 * EARTH_RADIUS_METERS))
+
+
+def arc_miles(chord):
+    """
+    Great-circle distance in miles for a straight-line ``chord`` in meters.
+    """
+    angle = Least(chord / Value(2 * EARTH_RADIUS_METERS), Value(1.0))
+    return Value(2 * EARTH_RADIUS_METERS / METERS_PER_MILE) * ASin(angle)
+
+
+@contextmanager
+def nearest_first_scans(using="default"):
+    """
+    Plan proximity queries without bitmap scans. The planner estimates any
+    ``cube <@`` box at 0.1% of the table, so in a dense area it would rather
+    collect and sort every doctor in the radius than read the nearest ones
+    straight off the index and stop at the page size.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute("SET LOCAL enable_bitmapscan = off")
+        yield
+
+
+def parse_float(params, key, low, high):
+    try:
+        value = float(params[key])
+    except ValueError:
+        raise ValueError(f"'{key}' must be a number.")
+    if not (low <= value <= high) or math.isnan(value):
+        raise ValueError(f"'{key}' must be between {low:g} and {high:g}.")
+    return value
+
+
+def parse_int(params, key, low, high):
+    try:
+        value = int(params[key])
+    except ValueError:
+        raise ValueError(f"'{key}' must be a whole number.")
+    if not (low <= value <= high):
+        raise ValueError(f"'{key}' must be between {low} and {high}.")
+    return value
+
+
+def geo_params(params):
+    """
+    (lat, lon, radius) from ``near_zip`` or ``lat``/``lon`` and ``radius``,
+    or None when the request isn't a proximity search. Raises ValueError for
+    values that can't be used.
+    """
+    if "near_zip" in params:
+        centroid = ZipCentroid.objects.filter(zip_code=params["near_zip"][:5]).values_list(
+            "latitude", "longitude").first()
+        if centroid is None:
+            raise ValueError(f"Unknown ZIP code '{params['near_zip']}'.")
+        lat, lon = centroid
+    elif "lat" in params or "lon" in params:
+        if not ("lat" in params and "lon" in params):
+            raise ValueError("'lat' and 'lon' must be given together.")
+        lat = parse_float(params, "lat", -90, 90)
+        lon = parse_float(params, "lon", -180, 180)
+    else:
+        return None
+    radius = parse_float(params, "radius", 0.1, MAX_RADIUS_MILES) if "radius" in params else DEFAULT_RADIUS_MILES
+    return lat, lon, radius
+
+
+def normalize_filter_params(params):
+    """
+    The filter params apply_filters acts on: known keys only, surrounding
+    whitespace stripped, blank values dropped.
+    """
+    normalized = {}
+    for key in FILTER_PARAMS:
+        value = str(params.get(key) or "").strip()
+        if value:
+            normalized[key] = value
+    return normalized
+
+
+def field_lookups(params):
+    """
+    Lookups for the normalized specialization, city, state and zip_code
+    params against text columns of those names (doctor_facet_cells).
+    """
+    lookups = {}
+    if params.get("specialization"):
+        lookups["specialization__icontains"] = params["specialization"]
+    if params.get("city"):
+        lookups["city__icontains"] = params["city"]
+    if params.get("state"):
+        lookups["state__iexact"] = params["state"]
+    if params.get("zip_code"):
+        lookups["zip_code__startswith"] = params["zip_code"]
+    return lookups
+
+
+def reference_lookups(params):
+    """
+    Doctor lookups for the normalized specialization, city, state and
+    zip_code params. Names are matched in the specialty and location tables
+    (hundreds and tens of thousands of rows), and doctors are then picked by
+    those ids through the foreign key indexes; one query, so it works from
+    async views too.
+    """
+    lookups = {}
+    if params.get("specialization"):
+        specialties = Specialty.objects.filter(name__icontains=params["specialization"])
+        lookups["specialty__in"] = specialties.values("pk")
+    places = {}
+    if params.get("city"):
+        places["city__icontains"] = params["city"]
+    if params.get("state"):
+        places["state__iexact"] = params["state"]
+    if places:
+        lookups["location__in"] = Location.objects.filter(**places).values("pk")
+    if params.get("zip_code"):
+        lookups["zip_code__startswith"] = params["zip_code"]
+    return lookups
 
 
 class DoctorQuerySet(models.QuerySet):
@@ -12,28 +243,24 @@ class DoctorQuerySet(models.QuerySet):
         """
         Apply filtering based on expected query params.
         Accepts any dict-like (e.g., Django QueryDict).
+
+        Name substrings are served by the trigram GIN indexes on
+        UPPER(column); specialization, city and state resolve to specialty
+        and location ids (see reference_lookups); id/zip_code use equality
+        or prefix lookups so they hit B-tree indexes; ``q`` runs a ranked
+        full-text search against ``search_vector``; ``available_within``
+        keeps doctors with a free slot in the next that many days.
         """
         qs = self
+        params = normalize_filter_params(params)
 
-        doctor_id = params.get("id")
         first_name = params.get("first_name")
         last_name = params.get("last_name")
-        specialization = params.get("specialization")
-        city = params.get("city")
-        state = params.get("state")
-        zip_code = params.get("zip_code")
-
-        filters = {}
-        if doctor_id:
-            filters["practitioner_id__iexact"] = doctor_id
-        if specialization:
-            filters["specialization__icontains"] = specialization
-        if city:
-            filters["city__icontains"] = city
-        if state:
-            filters["state__icontains"] = state
-        if zip_code:
-            filters["zip_code__icontains"] = zip_code
+        text = params.get("q")
+
+        filters = reference_lookups(params)
+        if params.get("id"):
+            filters["practitioner_id"] = params["id"]
 
         if filters:
             qs = qs.filter(**filters)
@@ -46,46 +273,335 @@ class DoctorQuerySet(models.QuerySet):
                 name_filter |= Q(last_name__icontains=last_name)
             qs = qs.filter(name_filter)
 
+        if text:
+            qs = qs.search(text)
+
+        near = geo_params(params)
+        if near:
+            qs = qs.near(*near)
+
+        if "available_within" in params:
+            days = parse_int(params, "available_within", 1, MAX_AVAILABILITY_DAYS)
+            today = timezone.localdate()
+            qs = qs.available(today, today + datetime.timedelta(days=days - 1))
+
         return qs
 
-    def order_by_name(self, sort: str = "asc"):
+    def with_names(self, *columns):
+        """
+        Annotate the specialization, city and state names (and the specialty
+        code) under their API names, for ``values()`` and ``values_list()``.
+        Given ``columns``, only the names among them are annotated, so a
+        query needing none of them joins neither reference table.
+        """
+        names = {
+            "specialization": Coalesce(F("specialty__name"), Value("")),
+            "specialty_code": Coalesce(F("specialty__code"), Value("")),
+            "city": F("location__city"),
+            "state": F("location__state"),
+        }
+        if columns:
+            names = {name: value for name, value in names.items() if name in columns}
+        return self.annotate(**names)
+
+    def select_fields(self, fields, cursor=False):
+        """
+        ``values()`` of the API ``fields`` and nothing else. With ``cursor``
+        the ordering columns are selected too, since keyset pagination
+        builds its cursor from them.
+        """
+        columns = tuple(fields)
+        if cursor:
+            ordering = (str(term).lstrip("-") for term in self.query.order_by)
+            columns += tuple(column for column in dict.fromkeys(ordering) if column not in columns)
+        return self.with_names(*columns).values(*columns)
+
+    def near(self, lat, lon, radius):
+        """
+        Doctors within ``radius`` miles of (lat, lon), annotated with
+        ``proximity`` (the index's straight-line distance, which orders and
+        pages results) and ``distance`` in miles along the surface. The GiST
+        index answers the radius box and, ordered by proximity, streams the
+        nearest doctors first so a page stops after ``page_size`` rows.
+        """
+        origin = LLToEarth(Value(float(lat)), Value(float(lon)))
+        box = CubeContainedIn(earth_location(), EarthBox(origin, Value(radius * METERS_PER_MILE)))
+        return (
+            self.filter(box)
+            .annotate(proximity=CubeDistance(earth_location(), origin))
+            .filter(proximity__lte=chord_meters(radius))
+            .annotate(distance=arc_miles(F("proximity")))
+        )
+
+    def available(self, start, end):
+        """
+        Doctors with a free appointment slot between ``start`` and ``end``
+        (dates, inclusive); ``available_within=7`` is "free this week".
+        """
+        from .availability import has_free_slot
+
+        return self.filter(has_free_slot(start, end))
+
+    def order_by_distance(self, sort: str = "asc"):
+        """
+        Nearest first; the primary key breaks ties between doctors geocoded
+        to the same ZIP centroid.
+        """
         if str(sort).lower() == "desc":
-            return self.order_by("-first_name", "-last_name")
-        return self.order_by("first_name", "last_name")
+            return self.order_by("-proximity", "-practitioner_id")
+        return self.order_by("proximity", "practitioner_id")
+
+    def search(self, text):
+        """
+        Full-text match against the stored tsvector, annotated with ``rank``.
+        """
+        query = SearchQuery(text, config="simple", search_type="websearch")
+        # Cast to double precision so a rank echoed back in a cursor compares exactly.
+        rank = Cast(SearchRank(F("search_vector"), query), output_field=FloatField())
+        return self.filter(search_vector=query).annotate(rank=rank)
+
+    def order_by_name(self, sort: str = "asc"):
+        return self.order_by(*name_ordering(sort))
+
+    def order_by_rank(self, sort: str = "asc"):
+        """
+        Best full-text matches first; ties fall back to the name ordering.
+        """
+        return self.order_by("-rank", *name_ordering(sort))
+
+    def estimated_count(self):
+        """
+        Row count from the planner instead of a COUNT(*) scan.
+        An unfiltered queryset reads pg_class.reltuples; anything else uses
+        the row estimate of the top plan node; ``none()`` is 0.
+        """
+        try:
+            sql, params = self.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            if not self.query.where:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [self.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
 
 
 class DoctorManager(models.Manager.from_queryset(DoctorQuerySet)):
     def filter_from_params(self, params, default_sort: str = "asc"):
         """
-        Convenience one-liner used by views.
+        Convenience one-liner used by views. Joins the specialty and location
+        the name properties of serialized doctors read.
         """
         sort = params.get("sort", default_sort)
-        return self.get_queryset().apply_filters(params).order_by_name(sort)
+        qs = self.get_queryset().select_related("specialty", "location").apply_filters(params)
+        if "distance" in qs.query.annotations:
+            return qs.order_by_distance(sort)
+        if params.get("q"):
+            return qs.order_by_rank(sort)
+        return qs.order_by_name(sort)
+
+
+class ReferenceManager(models.Manager):
+    """
+    Rows of a reference table by their natural key, a tuple of the model's
+    ``KEY`` fields.
+    """
+    def ids(self, **filters):
+        """
+        ``{key: id}`` of the rows matching ``filters`` (all of them by default).
+        """
+        return {tuple(row[:-1]): row[-1] for row in self.filter(**filters).values_list(*self.model.KEY, "pk")}
+
+    def add(self, keys):
+        """
+        Insert the rows for ``keys`` that don't exist yet.
+        """
+        self.bulk_create([self.model.for_key(key) for key in keys], ignore_conflicts=True)
+
+    def resolve(self, key):
+        """
+        Id of the row for ``key``, inserted if new; None for a blank key.
+        """
+        key = tuple(key)
+        if self.model.for_key(key) is None:
+            return None
+        lookup = dict(zip(self.model.KEY, key))
+        ids = self.ids(**lookup)
+        if not ids:
+            self.add([key])
+            ids = self.ids(**lookup)
+        return ids[key]
+
+
+class Specialty(models.Model):
+    """
+    A specialty as the source files name it, with its canonical code (the
+    FHIR qualification coding).
+    """
+    KEY = ("name",)
+
+    id = models.SmallAutoField(primary_key=True)
+    code = models.CharField(max_length=100, db_index=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    objects = ReferenceManager()
+
+    class Meta:
+        db_table = "specialties"
+        verbose_name_plural = "specialties"
+
+    @staticmethod
+    def code_for(name):
+        return str(name).upper().replace(" ", "_")
+
+    @classmethod
+    def for_key(cls, key):
+        (name,) = key
+        return cls(code=cls.code_for(name), name=name) if name else None
+
+    def __str__(self):
+        return self.name
+
+
+class Location(models.Model):
+    """
+    A (city, state) pair. Either part may be NULL, which stays distinct
+    from blank.
+    """
+    KEY = ("city", "state")
+
+    id = models.AutoField(primary_key=True)
+    city = models.CharField(max_length=100, blank=True, null=True)
+    state = models.CharField(max_length=100, blank=True, null=True)
+
+    objects = ReferenceManager()
+
+    class Meta:
+        db_table = "locations"
+        constraints = [
+            models.UniqueConstraint(fields=["city", "state"], name="location_unique", nulls_distinct=False),
+        ]
+        indexes = [
+            models.Index(Upper("state"), name="locations_state_upper_idx"),
+            GinIndex(OpClass(Upper("city"), name="gin_trgm_ops"), name="locations_city_trgm_idx"),
+        ]
+
+    @classmethod
+    def for_key(cls, key):
+        city, state = key
+        return None if city is None and state is None else cls(city=city, state=state)
+
+    def __str__(self):
+        return ", ".join(part for part in (self.city, self.state) if part)
+
+
+# Doctor's name properties and the reference table columns behind them.
+NAME_PROPERTIES = {"specialization": "specialty", "city": "location", "state": "location"}
+
+
+def name_property(name):
+    """
+    ``Doctor.<name>``, read from the related specialty or location. Assigned
+    names (also as model or serializer kwargs) are kept until the doctor is
+    saved, when the signal handler resolves them to ids.
+    """
+    relation = NAME_PROPERTIES[name]
+    column = "name" if name == "specialization" else name
+
+    def get(doctor):
+        assigned = doctor.__dict__.get("_names", {})
+        if name in assigned:
+            return assigned[name]
+        related = getattr(doctor, relation)
+        if related is None:
+            return "" if name == "specialization" else None
+        return getattr(related, column)
+
+    def set(doctor, value):
+        doctor.__dict__.setdefault("_names", {})[name] = value
+
+    return property(get, set)
 
 
 class Doctor(models.Model):
     practitioner_id = models.CharField(max_length=50, primary_key=True)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
-    specialization = models.CharField(max_length=100)
+    specialty = models.ForeignKey(
+        Specialty, models.PROTECT, blank=True, null=True, related_name="doctors", db_index=False,
+    )
     phone = models.CharField(max_length=20)
     email = models.EmailField(max_length=255)
     address = models.CharField(max_length=255)
-    city = models.CharField(max_length=100, blank=True, null=True)
-    state = models.CharField(max_length=100, blank=True, null=True)
+    location = models.ForeignKey(Location, models.PROTECT, blank=True, null=True, related_name="doctors")
     zip_code = models.CharField(max_length=20, blank=True, null=True)
+    # Centroid of the doctor's 5-digit ZIP code (see geocode_doctors).
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    # Names weighted A, specialty B, city C; kept up to date by the
+    # doctors_search_vector trigger, since a generated column can't read the
+    # specialty and location tables.
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
+    # Fingerprint of the loaded columns; the delta sync compares it with the
+    # incoming extract instead of comparing every column.
+    content_hash = models.GeneratedField(
+        expression=content_hash_expression(
+            ("first_name", "last_name", "specialty", "phone", "email", "address", "location", "zip_code"),
+            nullable=("specialty", "location", "zip_code"),
+        ),
+        output_field=models.CharField(max_length=32),
+        db_persist=True,
+    )
 
     objects = DoctorManager()
 
+    specialization = name_property("specialization")
+    city = name_property("city")
+    state = name_property("state")
+
     class Meta:
         db_table = "doctors"
         indexes = [
-            models.Index(fields=["city"]),
-            models.Index(fields=["state"]),
-            models.Index(fields=["zip_code"]),
-            models.Index(fields=["specialization"]),
+            models.Index(fields=["first_name", "last_name", "practitioner_id"], name="doctors_name_order_idx"),
+            # Specialty alone, or specialty and location together.
+            models.Index(fields=["specialty", "location"], name="doctors_specialty_location_idx"),
+            models.Index(fields=["zip_code"], name="doctors_zip_code_prefix_idx", opclasses=["varchar_pattern_ops"]),
+            GinIndex(OpClass(Upper("first_name"), name="gin_trgm_ops"), name="doctors_first_name_trgm_idx"),
+            GinIndex(OpClass(Upper("last_name"), name="gin_trgm_ops"), name="doctors_last_name_trgm_idx"),
+            GinIndex(fields=["search_vector"], name="doctors_search_vector_idx"),
+            GistIndex(LLToEarth(F("latitude"), F("longitude")), name="doctors_location_gist_idx"),
         ]
 
+    @property
+    def specialty_code(self):
+        if "specialization" in self.__dict__.get("_names", {}) or self.specialty is None:
+            return Specialty.code_for(self.specialization) if self.specialization else ""
+        return self.specialty.code
+
+    def resolve_names(self):
+        """
+        Point ``specialty`` and ``location`` at the names assigned since the
+        last save, adding reference rows for new ones.
+        """
+        assigned = self.__dict__.get("_names")
+        if not assigned:
+            return
+        if "specialization" in assigned:
+            self.specialty_id = Specialty.objects.resolve([self.specialization])
+        if "city" in assigned or "state" in assigned:
+            self.location_id = Location.objects.resolve([self.city, self.state])
+        del self.__dict__["_names"]
+
     def validate_fields(self):
         errors = []
 
@@ -107,24 +623,93 @@ class Doctor(models.Model):
         if validation_errors:
             raise ValueError("Validation failed: " + ", ".join(validation_errors))
 
-        practitioner = Practitioner.construct()
-        practitioner.id = self.practitioner_id
-        practitioner.name = [HumanName(use="official", family=self.last_name, given=[self.first_name])]
-        practitioner.telecom = [ContactPoint(system="phone", value=self.phone)]
-        practitioner.address = [Address(line=[self.address], city=self.city, state=self.state, postalCode=self.zip_code)]
-        practitioner.specialty = [
-            {"coding": [{"system": "http://hl7.org/fhir/specialty", "code": self.specialization}]}
-        ]
+        from .fhir import doctor_row, practitioner_json
 
-        return practitioner
+        return Practitioner.model_validate(practitioner_json(doctor_row(self)))
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.specialization})"
 
 
+class ZipCentroid(models.Model):
+    """
+    Interior point of a ZIP code tabulation area, loaded from the Census
+    Gazetteer by ``load_zip_centroids``; used to geocode doctors offline.
+    """
+    zip_code = models.CharField(max_length=5, primary_key=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        db_table = "zip_centroids"
+
+    def __str__(self):
+        return f"{self.zip_code} ({self.latitude}, {self.longitude})"
+
+
+class DoctorFacet(models.Model):
+    """
+    Number of doctors per value of one facet (specialization, state, city,
+    5-digit ZIP), plus a ``total`` row. Rebuilt from ``doctors`` by
+    ``facets.refresh_facets``; serves unfiltered facet counts and the admin
+    list filters.
+    """
+    TOTAL = "total"
+    FIELDS = ("specialization", "state", "city", "zip_code")
+
+    field = models.CharField(max_length=20, choices=[(name, name) for name in (TOTAL, *FIELDS)])
+    value = models.CharField(max_length=255)
+    doctors = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = "doctor_facets"
+        constraints = [models.UniqueConstraint(fields=["field", "value"], name="doctor_facet_unique")]
+        indexes = [models.Index(fields=["field", "-doctors"], name="doctor_facet_top_idx")]
+
+    def __str__(self):
+        return f"{self.field}={self.value} ({self.doctors})"
+
+
+class DoctorFacetCell(models.Model):
+    """
+    Number of doctors per (specialization, state, city, 5-digit ZIP), blank
+    for NULL. Facet counts under filters on those columns alone are summed
+    from here rather than grouped from ``doctors``, through the same kind
+    of indexes the doctor filters use.
+    """
+    specialization = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    city = models.CharField(max_length=100)
+    zip_code = models.CharField(max_length=5)
+    doctors = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = "doctor_facet_cells"
+        constraints = [
+            models.UniqueConstraint(fields=["specialization", "state", "city", "zip_code"],
+                                    name="doctor_facet_cell_unique"),
+        ]
+        indexes = [
+            models.Index(Upper("state"), name="facet_cell_state_upper_idx"),
+            models.Index(fields=["zip_code"], name="facet_cell_zip_prefix_idx", opclasses=["varchar_pattern_ops"]),
+            GinIndex(OpClass(Upper("specialization"), name="gin_trgm_ops"), name="facet_cell_special_trgm_idx"),
+            GinIndex(OpClass(Upper("city"), name="gin_trgm_ops"), name="facet_cell_city_trgm_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.specialization}/{self.state}/{self.city}/{self.zip_code} ({self.doctors})"
+
+
 class Appointment(models.Model):
-    appointment_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    doctor = models.ForeignKey("Doctor", on_delete=models.CASCADE, related_name="appointments")
+    """
+    A booked slot. The table is range-partitioned by month on
+    ``appointment_date`` (see partitions), so each unique constraint
+    includes the date: slots are unique outright, and ``appointment_id``
+    (a random UUID) within its date.
+    """
+    appointment_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Indexed as the first column of appointment_slot_unique.
+    doctor = models.ForeignKey("Doctor", on_delete=models.CASCADE, related_name="appointments", db_index=False)
     patient_name = models.CharField(max_length=100)
     phone_number = models.CharField(max_length=15)
     email = models.EmailField()
@@ -134,8 +719,224 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ("doctor", "appointment_date", "appointment_time")
-        ordering = ["appointment_date", "appointment_time"]
+        constraints = [
+            models.UniqueConstraint(fields=["doctor", "appointment_date", "appointment_time"],
+                                    name="appointment_slot_unique"),
+            models.UniqueConstraint(fields=["appointment_id", "appointment_date"], name="appointment_id_unique"),
+        ]
 
     def __str__(self):
         return f"{self.patient_name} - {self.doctor} on {self.appointment_date} at {self.appointment_time}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    An ``Idempotency-Key`` sent with a booking and the response it got,
+    replayed to retries with the same key until it is older than
+    ``settings.IDEMPOTENCY_KEY_TTL``. ``fingerprint`` hashes the validated
+    request, so a key reused for a different booking is refused.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.response_status})"
+
+
+class OutboxMessage(models.Model):
+    """
+    An email written in the same transaction as the change it reports, so
+    it is sent if and only if that change commits. ``outbox.dispatch``
+    drains due messages in batches; a failed send is retried at
+    ``available_at`` with exponential backoff until ``attempts`` reaches
+    the limit, then the message is kept as DEAD for inspection.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (DEAD, "Dead"),
+    ]
+
+    kind = models.CharField(max_length=50)
+    recipient = models.EmailField()
+    context = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["available_at"], condition=Q(status="pending"), name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} ({self.status})"
+
+
+class DoctorSchedule(models.Model):
+    """
+    A weekly block of bookable time: every ``weekday`` (0 is Monday) from
+    ``start_time`` to ``end_time``, cut into slots of ``slot_minutes``, within
+    ``valid_from``..``valid_until`` when set. A day can have several blocks,
+    e.g. either side of lunch.
+    """
+    MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
+    WEEKDAY_CHOICES = [
+        (MONDAY, "Monday"),
+        (TUESDAY, "Tuesday"),
+        (WEDNESDAY, "Wednesday"),
+        (THURSDAY, "Thursday"),
+        (FRIDAY, "Friday"),
+        (SATURDAY, "Saturday"),
+        (SUNDAY, "Sunday"),
+    ]
+
+    doctor = models.ForeignKey("Doctor", on_delete=models.CASCADE, related_name="schedules")
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    valid_from = models.DateField(null=True, blank=True)
+    valid_until = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["doctor", "weekday", "start_time"]
+        indexes = [models.Index(fields=["doctor", "weekday"], name="schedule_doctor_weekday_idx")]
+        constraints = [
+            models.CheckConstraint(condition=Q(start_time__lt=F("end_time")), name="schedule_starts_before_end"),
+            models.CheckConstraint(condition=Q(slot_minutes__gt=0), name="schedule_slot_minutes_positive"),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id} {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+
+class ScheduleException(models.Model):
+    """
+    Time off: no slots on ``date`` that overlap ``start_time``..``end_time``,
+    or none at all that day when the times are empty.
+    """
+    doctor = models.ForeignKey("Doctor", on_delete=models.CASCADE, related_name="schedule_exceptions")
+    date = models.DateField()
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ["doctor", "date", "start_time"]
+        indexes = [models.Index(fields=["doctor", "date"], name="schedule_exception_day_idx")]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(start_time__isnull=True, end_time__isnull=True) | Q(start_time__lt=F("end_time")),
+                name="schedule_exception_whole_day_or_range",
+            ),
+        ]
+
+    def __str__(self):
+        hours = f" {self.start_time:%H:%M}-{self.end_time:%H:%M}" if self.start_time else ""
+        return f"{self.doctor_id} off {self.date}{hours}"
+
+
+class ExportJob(models.Model):
+    """
+    One FHIR Bulk Data ``$export`` request. The doctor table is split into
+    primary-key ranges (``ExportChunk``) that are serialized independently,
+    so a job interrupted partway resumes from its unfinished chunks.
+    """
+    ACCEPTED = "accepted"
+    IN_PROGRESS = "in-progress"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (ACCEPTED, "Accepted"),
+        (IN_PROGRESS, "In progress"),
+        (COMPLETED, "Completed"),
+        (FAILED, "Failed"),
+        (CANCELLED, "Cancelled"),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACCEPTED)
+    request_url = models.TextField()
+    chunk_size = models.PositiveIntegerField(default=10000)
+    resource_count = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    transaction_time = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def resources_per_second(self):
+        if not (self.started_at and self.finished_at):
+            return None
+        elapsed = (self.finished_at - self.started_at).total_seconds()
+        return round(self.resource_count / elapsed, 1) if elapsed > 0 else None
+
+    def __str__(self):
+        return f"$export {self.job_id} ({self.status})"
+
+
+class ExportChunk(models.Model):
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField()
+    # Doctors with start_after < practitioner_id <= end_at; open-ended when null.
+    start_after = models.CharField(max_length=50, null=True, blank=True)
+    end_at = models.CharField(max_length=50, null=True, blank=True)
+    done = models.BooleanField(default=False)
+    resource_count = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("job", "index")
+        ordering = ["index"]
+
+    def __str__(self):
+        return f"{self.job_id} chunk {self.index}"
+
+
+class DoctorImportFile(models.Model):
+    """
+    A file of a preprocessed doctor dataset as of its last successful load;
+    the loader skips files whose digest hasn't changed since.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    rows = models.PositiveIntegerField(default=0)
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.rows} rows)"
+
+
+class DoctorSyncRun(models.Model):
+    """
+    Changelog entry for one run of the doctor loader: what it read and how
+    many rows it actually inserted, updated and deleted.
+    """
+    source = models.CharField(max_length=255)
+    started_at = models.DateTimeField(auto_now_add=True)
+    seconds = models.FloatField(default=0)
+    rows_read = models.PositiveBigIntegerField(default=0)
+    inserted = models.PositiveBigIntegerField(default=0)
+    updated = models.PositiveBigIntegerField(default=0)
+    deleted = models.PositiveBigIntegerField(default=0)
+    unchanged = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    @property
+    def touched(self):
+        return self.inserted + self.updated + self.deleted
+
+    def __str__(self):
+        return f"{self.source} @ {self.started_at:%Y-%m-%d %H:%M} ({self.touched} rows touched)"
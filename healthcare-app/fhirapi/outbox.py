@@ -0,0 +1,181 @@
+"""
+Transactional outbox for outgoing email.
+
+Emails are ``OutboxMessage`` rows written by the transaction that makes
+them true, so a rolled-back booking never sends one and a committed booking
+always will, even when the broker or the worker is down at commit time.
+Requests never talk to the broker: the table is polled, by celery beat or
+by ``manage.py dispatch_outbox --watch``.
+
+``dispatch`` claims a batch of due messages with FOR UPDATE SKIP LOCKED
+(several workers drain disjoint batches), renders them and sends the batch
+over one SMTP connection. A message that fails is retried with exponential
+backoff and dead-lettered after MAX_ATTEMPTS. Losing the connection stops
+the batch without counting an attempt against the messages not yet tried.
+"""
+import datetime
+import logging
+import smtplib
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Min
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60 * 60
+
+# kind -> (subject, template name without the .txt/.html extension)
+TEMPLATES = {
+    "appointment_confirmation": ("Appointment Confirmation", "emails/appointment_confirmation"),
+}
+
+
+def enqueue(kind, recipient, context):
+    """
+    Queue an email. Call it inside the transaction that should decide
+    whether it is sent.
+    """
+    if kind not in TEMPLATES:
+        raise ValueError(f"Unknown email kind {kind!r}.")
+    return OutboxMessage.objects.create(kind=kind, recipient=recipient, context=context)
+
+
+def enqueue_confirmation(appointment):
+    doctor = appointment.doctor
+    return enqueue("appointment_confirmation", appointment.email, {
+        "Doctor_name": f"{doctor.first_name} {doctor.last_name}",
+        "Appointment_date": str(appointment.appointment_date),
+        "Appointment_time": str(appointment.appointment_time),
+        "Appointment_id": str(appointment.appointment_id),
+    })
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def build(entry, connection):
+    subject, template = TEMPLATES[entry.kind]
+    message = EmailMultiAlternatives(
+        subject, get_template(f"{template}.txt").render(entry.context), settings.DEFAULT_FROM_EMAIL,
+        [entry.recipient], connection=connection,
+    )
+    message.attach_alternative(get_template(f"{template}.html").render(entry.context), "text/html")
+    return message
+
+
+@dataclass
+class DispatchResult:
+    sent: int = 0
+    retried: int = 0
+    dead: int = 0
+    seconds: float = 0.0
+    # Longest wait between enqueueing and sending among the sent messages.
+    lag_seconds: float = 0.0
+
+    @property
+    def messages_per_second(self):
+        return round(self.sent / self.seconds, 1) if self.seconds else None
+
+    def add(self, other):
+        self.sent += other.sent
+        self.retried += other.retried
+        self.dead += other.dead
+        self.seconds += other.seconds
+        self.lag_seconds = max(self.lag_seconds, other.lag_seconds)
+
+    def as_dict(self):
+        return {**asdict(self), "messages_per_second": self.messages_per_second}
+
+
+def dispatch(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Send one batch of due messages over a single SMTP connection and
+    record the outcome of each. The rows stay locked until then, so a
+    crash mid-batch leaves them pending (delivery is at least once).
+    """
+    result = DispatchResult()
+    started = time.perf_counter()
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.PENDING, available_at__lte=timezone.now())
+            .order_by("available_at")[:batch_size]
+        )
+        if not batch:
+            return result
+
+        sent, failed = [], []
+        with get_connection() as connection:
+            for entry in batch:
+                try:
+                    connection.send_messages([build(entry, connection)])
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as error:
+                    logger.warning("SMTP connection lost after %d of %d messages: %s", len(sent), len(batch), error)
+                    break
+                except Exception as error:
+                    entry.last_error = f"{type(error).__name__}: {error}"
+                    failed.append(entry)
+                else:
+                    sent.append(entry)
+
+        now = timezone.now()
+        OutboxMessage.objects.filter(pk__in=[entry.pk for entry in sent]).update(
+            status=OutboxMessage.SENT, sent_at=now, attempts=F("attempts") + 1, last_error="",
+        )
+        for entry in failed:
+            entry.attempts += 1
+            if entry.attempts >= max_attempts:
+                entry.status = OutboxMessage.DEAD
+                result.dead += 1
+            else:
+                entry.available_at = now + backoff(entry.attempts)
+                result.retried += 1
+        OutboxMessage.objects.bulk_update(failed, ["attempts", "status", "available_at", "last_error"])
+
+    result.sent = len(sent)
+    result.seconds = time.perf_counter() - started
+    result.lag_seconds = max(((now - entry.created_at).total_seconds() for entry in sent), default=0.0)
+    logger.info(
+        "Outbox: sent %d, retrying %d, dead-lettered %d in %.2fs, lag %.1fs",
+        result.sent, result.retried, result.dead, result.seconds, result.lag_seconds,
+    )
+    return result
+
+
+def drain(batch_size=BATCH_SIZE, max_batches=100):
+    """
+    Dispatch batches until no full batch is due (or ``max_batches``).
+    """
+    total = DispatchResult()
+    for _ in range(max_batches):
+        result = dispatch(batch_size)
+        total.add(result)
+        if result.sent + result.retried + result.dead < batch_size:
+            break
+    return total
+
+
+def stats():
+    """
+    Queue depth and lag: the age of the oldest message that is due.
+    """
+    now = timezone.now()
+    pending = OutboxMessage.objects.filter(status=OutboxMessage.PENDING)
+    oldest_due = pending.filter(available_at__lte=now).aggregate(oldest=Min("created_at"))["oldest"]
+    return {
+        "pending": pending.count(),
+        "dead": OutboxMessage.objects.filter(status=OutboxMessage.DEAD).count(),
+        "lag_seconds": round((now - oldest_due).total_seconds(), 1) if oldest_due else 0.0,
+    }
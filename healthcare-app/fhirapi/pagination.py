@@ -0,0 +1,209 @@
+import base64
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DoctorPagination(PageNumberPagination):
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        ``paginate_queryset`` on the async ORM: the page number is checked
+        against a Paginator over ``range(count)``, then only that page's
+        rows are fetched.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(range(await queryset.acount()), page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bounds = self.page.object_list
+        return [row async for row in queryset[bounds.start:bounds.stop]]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django Paginator (for the admin changelist) that trusts the planner's
+    row estimate (DoctorQuerySet.estimated_count) from ``exact_below`` rows
+    up, instead of a COUNT(*) over the whole result. Smaller results are
+    counted exactly. Pages past the real end of an overestimate are empty.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.object_list.estimated_count()
+        if estimate < self.exact_below:
+            return self.object_list.count()
+        return estimate
+
+
+def seek_filter(ordering, position, reverse=False):
+    """
+    Rows strictly after ``position`` in ``ordering`` (strictly before when
+    ``reverse``), expanded to the usual lexicographic OR of prefixes.
+    A redundant bound on the leading column lets PostgreSQL start an index
+    range scan instead of filtering the whole index.
+    """
+    condition = Q()
+    equal_prefix = {}
+    for term, value in zip(ordering, position):
+        field = term.lstrip("-")
+        descending = term.startswith("-") != reverse
+        condition |= Q(**equal_prefix, **{f"{field}__{'lt' if descending else 'gt'}": value})
+        equal_prefix[field] = value
+
+    leading = ordering[0].lstrip("-")
+    descending = ordering[0].startswith("-") != reverse
+    return Q(**{f"{leading}__{'lte' if descending else 'gte'}": position[0]}) & condition
+
+
+def flip(term):
+    return term[1:] if term.startswith("-") else f"-{term}"
+
+
+class DoctorKeysetPagination(BasePagination):
+    """
+    Opt-in keyset pagination (``?cursor=``) for the doctor filter endpoint.
+
+    Instead of ``OFFSET n`` the cursor stores the ordering values of the page
+    boundary and the next query seeks past them, so deep pages cost the same
+    as the first one. The queryset's ordering must be total and non-null
+    (``name_ordering`` ends with the primary key for that reason).
+
+    No COUNT(*) runs unless asked: ``?count=exact`` counts, ``?count=estimate``
+    returns the planner's estimate.
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request)
+        self.count = self.get_count(queryset, request)
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request):
+        page = self.page_queryset(queryset, request)
+        self.count = await self.aget_count(queryset, request)
+        return self.set_page([row async for row in page])
+
+    def page_queryset(self, queryset, request):
+        """
+        The query for the requested page plus one row (to tell whether
+        there is another page).
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = [str(term) for term in queryset.query.order_by]
+        if not self.ordering:
+            raise ValueError("Keyset pagination needs an ordered queryset.")
+
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            queryset = queryset.order_by(*[flip(term) for term in self.ordering])
+        if self.position is not None:
+            queryset = queryset.filter(seek_filter(self.ordering, self.position, self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return queryset.estimated_count()
+        return None
+
+    async def aget_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return await queryset.acount()
+        if mode == 'estimate':
+            return await sync_to_async(queryset.estimated_count)()
+        return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            position = payload["p"]
+            reverse = bool(payload.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        position = [self.row_value(row, term.lstrip("-")) for term in self.ordering]
+        payload = json.dumps({"p": position, "r": int(reverse)}, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def row_value(row, field):
+        if isinstance(row, dict):
+            return row[field]
+        return getattr(row, field)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict()
+        if self.count is not None:
+            body['count'] = self.count
+            body['count_is_estimate'] = self.request.query_params.get(self.count_query_param) == 'estimate'
+        body['next'] = self.get_next_link()
+        body['previous'] = self.get_previous_link()
+        body['results'] = data
+        return Response(body)
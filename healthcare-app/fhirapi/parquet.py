@@ -0,0 +1,118 @@
+"""
+Parquet dataset of cleaned doctors, written by ``preprocessing.py`` and read
+by the loader and analytics jobs.
+
+A dataset is a directory with one zstd-compressed file per state and a
+``manifest.json`` recording each file's row count and SHA-256. The loader
+compares those digests with the ones it recorded on the last load, so a
+re-run only reads the states whose file changed. Files are read with
+memory mapping and only the requested columns are decoded.
+
+This module only needs pyarrow, so ``preprocessing.py`` can use it without
+setting up Django.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA_VERSION = 1
+MANIFEST = "manifest.json"
+
+# Mirrors the doctor API fields (DoctorSerializer): one string column per
+# field, nullable where the field is.
+DOCTOR_SCHEMA = pa.schema(
+    [
+        pa.field("practitioner_id", pa.string(), nullable=False),
+        pa.field("first_name", pa.string(), nullable=False),
+        pa.field("last_name", pa.string(), nullable=False),
+        pa.field("specialization", pa.string(), nullable=False),
+        pa.field("phone", pa.string(), nullable=False),
+        pa.field("email", pa.string(), nullable=False),
+        pa.field("address", pa.string(), nullable=False),
+        pa.field("city", pa.string()),
+        pa.field("state", pa.string()),
+        pa.field("zip_code", pa.string()),
+    ],
+    metadata={"doctor_schema_version": str(SCHEMA_VERSION)},
+)
+
+
+def partition_file(state):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", state or "_") + ".parquet"
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DatasetWriter:
+    """
+    Append pandas frames to per-state Parquet files; ``close`` writes the
+    manifest and removes files left over from an earlier run.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.writers = {}
+
+    def write(self, df):
+        for state, group in df.groupby("state", sort=False, dropna=False):
+            name = partition_file(state if isinstance(state, str) else None)
+            if name not in self.writers:
+                self.writers[name] = pq.ParquetWriter(self.directory / name, DOCTOR_SCHEMA, compression="zstd")
+            self.writers[name].write_table(pa.Table.from_pandas(group, schema=DOCTOR_SCHEMA, preserve_index=False))
+
+    def close(self):
+        files = {}
+        for name, writer in sorted(self.writers.items()):
+            writer.close()
+            files[name] = {
+                "rows": pq.ParquetFile(self.directory / name).metadata.num_rows,
+                "sha256": file_digest(self.directory / name),
+            }
+        for stale in self.directory.glob("*.parquet"):
+            if stale.name not in files:
+                stale.unlink()
+        partial = self.directory / f"{MANIFEST}.part"
+        partial.write_text(json.dumps({"schema_version": SCHEMA_VERSION, "files": files}, indent=1))
+        os.replace(partial, self.directory / MANIFEST)
+        return files
+
+
+def read_manifest(directory):
+    manifest = json.loads((Path(directory) / MANIFEST).read_text())
+    if manifest["schema_version"] != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported doctor dataset schema version {manifest['schema_version']}.")
+    return manifest["files"]
+
+
+def read_doctors(directory, columns=None, files=None):
+    """
+    The dataset (or just ``files`` of it) as one memory-mapped Arrow table
+    holding only ``columns``.
+    """
+    directory = Path(directory)
+    files = sorted(read_manifest(directory)) if files is None else files
+    tables = [pq.read_table(directory / name, columns=columns, memory_map=True) for name in files]
+    if not tables:
+        return DOCTOR_SCHEMA.empty_table().select(columns or DOCTOR_SCHEMA.names)
+    return pa.concat_tables(tables)
+
+
+def iter_rows(directory, files, columns, batch_size=50000):
+    """
+    Row tuples in ``columns`` order from ``files``, one record batch at a time.
+    """
+    for name in files:
+        parquet = pq.ParquetFile(Path(directory) / name, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=list(columns)):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
@@ -0,0 +1,164 @@
+"""
+Monthly range partitions of the appointments table on ``appointment_date``.
+
+Each month is a partition named ``<table>_pYYYY_MM``. The default
+partition catches dates no month covers yet, so a booking never fails for
+want of one. :func:`create_partitions` adds months ahead of time, moving
+any rows the default partition already holds for them, and
+:func:`archive_partitions` detaches the months past the retention period,
+writes each to a gzipped CSV file and drops it. Celery beat runs both
+daily (``tasks.maintain_appointment_partitions``); so does
+``manage.py appointment_partitions``.
+
+A query that bounds ``appointment_date`` with constants only reads the
+partitions in range (plan-time pruning), which is why the slot lookup in
+availability repeats the requested dates. Lookups by ``appointment_id``
+or ``doctor`` alone probe every partition's index.
+"""
+import datetime
+import gzip
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Appointment
+
+TABLE = Appointment._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+MONTH_NAME = re.compile(rf"^{re.escape(TABLE)}_p(\d{{4}})_(\d{{2}})$")
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def monthly_partitions(cursor):
+    """
+    ``{first day of the month: partition name}`` of the attached partitions.
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+        [TABLE],
+    )
+    months = {}
+    for (name,) in cursor.fetchall():
+        match = MONTH_NAME.match(name)
+        if match:
+            months[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def create_partition(cursor, month):
+    """
+    Add the partition for ``month`` and move into it the rows the default
+    partition holds for that month. Returns how many rows moved.
+    """
+    name, lower, upper = quote(partition_name(month)), month.isoformat(), add_months(month, 1).isoformat()
+    # ALTER TABLE refuses to run with deferred foreign key checks pending.
+    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+    cursor.execute(f"CREATE TABLE {name} (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {quote(DEFAULT_PARTITION)} WHERE appointment_date >= %s AND appointment_date < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+        """,
+        [lower, upper],
+    )
+    moved = cursor.rowcount
+    # Attaching builds the partition's share of every index and constraint.
+    cursor.execute(f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    return moved
+
+
+def copy_to_file(cursor, table, path):
+    """
+    Write ``table`` to ``path`` as gzipped CSV with a header row; returns
+    the number of rows. The file appears under its name only once complete.
+    """
+    partial = path.with_name(path.name + ".partial")
+    with gzip.open(partial, "wb") as output:
+        with cursor.copy(f"COPY {quote(table)} TO STDOUT WITH (FORMAT csv, HEADER)") as copy:
+            for data in copy:
+                output.write(data)
+    os.replace(partial, path)
+    cursor.execute(f"SELECT count(*) FROM {quote(table)}")
+    return cursor.fetchone()[0]
+
+
+@dataclass
+class MaintenanceResult:
+    created: list = field(default_factory=list)
+    moved: int = 0
+    # Partition name -> archived rows.
+    archived: dict = field(default_factory=dict)
+
+    def as_dict(self):
+        return {"created": self.created, "moved": self.moved, "archived": self.archived}
+
+
+def create_partitions(months_ahead=None, today=None, result=None):
+    """
+    Create the missing partitions from this month through ``months_ahead``
+    months ahead (``APPOINTMENT_PARTITION_MONTHS_AHEAD``), each in its own
+    transaction.
+    """
+    months_ahead = settings.APPOINTMENT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    this_month = (today or timezone.localdate()).replace(day=1)
+    result = result or MaintenanceResult()
+    with connection.cursor() as cursor:
+        existing = monthly_partitions(cursor)
+    for month in (add_months(this_month, count) for count in range(months_ahead + 1)):
+        if month in existing:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            result.moved += create_partition(cursor, month)
+        result.created.append(partition_name(month))
+    return result
+
+
+def archive_partitions(keep_months=None, today=None, root=None, result=None):
+    """
+    Archive the partitions of months ending more than ``keep_months``
+    months (``APPOINTMENT_RETENTION_MONTHS``) before this month: detach it,
+    write it to ``<root>/<partition>.csv.gz`` (``APPOINTMENT_ARCHIVE_ROOT``)
+    and drop it, in one transaction per partition.
+    """
+    keep_months = settings.APPOINTMENT_RETENTION_MONTHS if keep_months is None else keep_months
+    root = Path(root or settings.APPOINTMENT_ARCHIVE_ROOT)
+    cutoff = add_months((today or timezone.localdate()).replace(day=1), -keep_months)
+    result = result or MaintenanceResult()
+    with connection.cursor() as cursor:
+        expired = sorted((month, name) for month, name in monthly_partitions(cursor).items() if month < cutoff)
+    if expired:
+        root.mkdir(parents=True, exist_ok=True)
+    for _, name in expired:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+            result.archived[name] = copy_to_file(cursor, name, root / f"{name}.csv.gz")
+            cursor.execute(f"DROP TABLE {quote(name)}")
+    return result
+
+
+def maintain(months_ahead=None, keep_months=None, today=None, archive=True):
+    result = create_partitions(months_ahead, today)
+    if archive:
+        archive_partitions(keep_months, today, result=result)
+    return result
@@ -0,0 +1,125 @@
+"""
+Routing between the primary ("default") and a read replica.
+
+Reads go to ``settings.DATABASE_READ_REPLICA`` only inside
+:func:`replica_reads`, which the doctor search and detail views and the
+doctor admin changelist enter, and only for the models in REPLICA_MODELS.
+Everything else (booking, loaders, exports, Celery tasks) reads and writes
+the primary.
+
+Once a request writes, the rest of it reads from the primary, and
+:class:`ReplicaPinningMiddleware` keeps the client there for
+``DATABASE_REPLICA_PIN_SECONDS`` after any successful unsafe request, so
+it sees its own changes while the replica catches up.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_MODELS = {
+    "fhirapi.doctor", "fhirapi.specialty", "fhirapi.location", "fhirapi.doctorfacet", "fhirapi.doctorfacetcell",
+    "fhirapi.zipcentroid",
+}
+PIN_COOKIE = "pin_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_pinned = ContextVar("pinned_to_primary", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let doctor reads in this block go to the replica, unless pinned.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaReadsMixin:
+    """
+    Runs the view inside :func:`replica_reads` for safe methods, and for the
+    methods in ``read_only_methods``: a POST that only carries a query too
+    long for a URL reads like a GET and doesn't pin the client.
+    """
+    read_only_methods = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.read_only_methods:
+            with pinned_to_primary(PIN_COOKIE in request.COOKIES), replica_reads():
+                response = super().dispatch(request, *args, **kwargs)
+            response.read_only = True
+            return response
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = settings.DATABASE_READ_REPLICA
+        if replica and _replica_reads.get() and not _pinned.get() and model._meta.label_lower in REPLICA_MODELS:
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if _replica_reads.get():
+            _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins unsafe requests, and safe ones from clients holding PIN_COOKIE, to
+    the primary; sets the cookie on every successful unsafe request that
+    isn't marked ``read_only`` (see ReplicaReadsMixin).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 \
+                and not getattr(response, "read_only", False):
+            response.set_cookie(PIN_COOKIE, "1", max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pinned_to_primary(self.pinned(request)):
+            return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        with pinned_to_primary(self.pinned(request)):
+            return self.pin(request, await self.get_response(request))
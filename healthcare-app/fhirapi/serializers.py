@@ -1,26 +1,79 @@
+from functools import lru_cache
+
 from rest_framework import serializers
+from .metrics import serializing
 from .models import Doctor, Appointment  
-from fhir.resources.practitioner import Practitioner
-from fhir.resources.humanname import HumanName
-from fhir.resources.contactpoint import ContactPoint
-from fhir.resources.address import Address
 import re 
 
+# Public doctor columns, in API order. Internal columns (search_vector) stay out.
+DOCTOR_FIELDS = (
+    'practitioner_id', 'first_name', 'last_name', 'specialization', 'phone',
+    'email', 'address', 'city', 'state', 'zip_code',
+)
+# Proximity search results add the doctor's ZIP-centroid location and the
+# great-circle distance in miles from the search point.
+NEARBY_FIELDS = DOCTOR_FIELDS + ('latitude', 'longitude', 'distance')
+# Applied to a column on the way out; every other one is passed through as read.
+CONVERTERS = {'distance': lambda miles: round(miles, 2)}
+
+
+def sparse_fields(params, allowed=DOCTOR_FIELDS, param='fields'):
+    """
+    The columns named in ``?fields=`` (comma-separated) in ``allowed``
+    order, or all of ``allowed`` without the param. Raises ValueError for a
+    name outside ``allowed``.
+    """
+    if param not in params:
+        return allowed
+    requested = {name.strip() for name in params[param].split(',') if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown {param}: {', '.join(sorted(unknown))}. Choose from: {', '.join(allowed)}.")
+    if not requested:
+        raise ValueError(f"'{param}' must list at least one field.")
+    return tuple(name for name in allowed if name in requested)
+
+
+@lru_cache(maxsize=1024)
+def row_serializer(fields):
+    """
+    A plain function turning a ``.values()`` row into the API object with
+    ``fields`` in that order; for DOCTOR_FIELDS and NEARBY_FIELDS, the same
+    objects DoctorSerializer used to produce. It is compiled once per tuple
+    of fields into a single dict display, so a row costs one call, with no
+    field objects or per-column dispatch.
+    """
+    # Only names from sparse_fields' allowed tuples reach the source.
+    items = []
+    for name in fields:
+        value = f"row[{name!r}]"
+        if name in CONVERTERS:
+            value = f"CONVERTERS[{name!r}]({value})"
+        items.append(f"{name!r}: {value}")
+    return eval(f"lambda row: {{{', '.join(items)}}}", {"CONVERTERS": CONVERTERS})
+
+
+class MeteredListSerializer(serializers.ListSerializer):
+    # Timed per page rather than per row, to keep the timer off the hot loop.
+    def to_representation(self, data):
+        with serializing():
+            return super().to_representation(data)
+
 class DoctorSerializer(serializers.ModelSerializer):
+    # Names of the doctor's specialty and location; saving resolves them to ids.
+    specialization = serializers.CharField(max_length=100)
+    city = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    state = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+
     class Meta:
         model = Doctor
-        fields = '__all__'
+        fields = DOCTOR_FIELDS
+        list_serializer_class = MeteredListSerializer
 
     def to_fhir(self):
-        doctor = self.instance
-        practitioner = Practitioner.construct()
-
-        practitioner.name = [HumanName(use="official", family=doctor.last_name, given=[doctor.first_name])]
-        practitioner.telecom = [ContactPoint(system="phone", value=doctor.phone)]
-        practitioner.address = [Address(line=[doctor.address])]
-        practitioner.specialty = [{"coding": [{"system": "http://hl7.org/fhir/specialty", "code": doctor.specialization}]}]
+        from .fhir import doctor_row, practitioner_json
 
-        return practitioner
+        return practitioner_json(doctor_row(self.instance))
 
 class AppointmentSerializer(serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='doctor.first_name', read_only=True)
@@ -32,6 +85,10 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'patient_name', 'phone_number', 'email', 'reason',
             'appointment_date', 'appointment_time'
         ]
+        list_serializer_class = MeteredListSerializer
+        # No unique-together check: booking.book claims the slot atomically
+        # and answers 409, where the check would race and answer 400.
+        validators = []
 
     def validate_phone_number(self, value):
         import re
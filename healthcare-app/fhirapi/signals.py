@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import metrics
+from .cache import bump_doctor_versions
+from .models import Doctor, ZipCentroid
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    # Bump after commit: a reader that caches between the write and the commit
+    # still sees (and stores) the old rows under the old version.
+    transaction.on_commit(lambda: bump_doctor_versions([instance.pk]))
+
+
+@receiver(pre_save, sender=Doctor)
+def resolve_doctor_names(sender, instance, **kwargs):
+    # specialization, city and state assigned by name become specialty and
+    # location ids; bulk loads resolve them per batch instead.
+    instance.resolve_names()
+
+
+@receiver(pre_save, sender=Doctor)
+def geocode_doctor(sender, instance, **kwargs):
+    # Doctors created one at a time get their ZIP centroid here; bulk loads
+    # geocode in the merge and geocode_doctors backfills the rest.
+    if instance.zip_code and instance.latitude is None:
+        centroid = ZipCentroid.objects.filter(zip_code=instance.zip_code[:5]).values_list(
+            "latitude", "longitude").first()
+        if centroid:
+            instance.latitude, instance.longitude = centroid
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Per connection rather than per request: connections are per thread, and
+    # the async views run their queries on worker threads.
+    metrics.instrument(connection)
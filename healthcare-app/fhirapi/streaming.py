@@ -0,0 +1,36 @@
+"""
+Incremental JSON encoders for exports that must not hold the full result in
+memory. Rows are encoded in batches so the response is written in a few
+large chunks rather than one tiny chunk per row.
+"""
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+encoder = DjangoJSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def iter_ndjson(rows, batch_size=1000):
+    """
+    One JSON document per line (application/x-ndjson).
+    """
+    for batch in batched(rows, batch_size):
+        yield "".join(encoder.encode(row) + "\n" for row in batch)
+
+
+def iter_json_array(rows, batch_size=1000):
+    """
+    A single JSON array, emitted element by element.
+    """
+    yield "["
+    separator = ""
+    for batch in batched(rows, batch_size):
+        yield separator + ",".join(encoder.encode(row) for row in batch)
+        separator = ","
+    yield "]"
@@ -1,24 +1,104 @@
-from celery import shared_task
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+import datetime
+import logging
+
+from celery import chord, shared_task
+from django.db import DatabaseError
 from django.conf import settings
+from django.utils import timezone
+
+from . import bulk_export, facets, outbox, partitions
+from .models import ExportChunk, ExportJob, IdempotencyKey
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def send_confirmation_email(patient_email, doctor_name, appointment_date, appointment_time, appointment_id):
-    subject = "Appointment Confirmation"
-    from_email = settings.DEFAULT_FROM_EMAIL
-    to = [patient_email]
-
-    context = {
+    """
+    Kept for tasks queued before the outbox: queues the email there.
+    Bookings write the outbox row themselves (``outbox.enqueue_confirmation``).
+    """
+    outbox.enqueue("appointment_confirmation", patient_email, {
         "Doctor_name": doctor_name,
         "Appointment_date": appointment_date,
         "Appointment_time": appointment_time,
         "Appointment_id": appointment_id,
-    }
+    })
+
+
+@shared_task
+def dispatch_outbox():
+    """
+    Send due outbox emails; run by celery beat.
+    """
+    return outbox.drain().as_dict()
+
+
+@shared_task
+def refresh_facets():
+    """
+    Recount the precomputed doctor facets; run by celery beat to pick up
+    changes made outside the bulk loader.
+    """
+    return facets.refresh_facets().changed
+
 
-    text_content = render_to_string('emails/appointment_confirmation.txt', context)
-    html_content = render_to_string('emails/appointment_confirmation.html', context)
+@shared_task
+def maintain_appointment_partitions():
+    """
+    Create upcoming monthly appointment partitions and archive expired
+    ones; run daily by celery beat.
+    """
+    return partitions.maintain().as_dict()
 
-    msg = EmailMultiAlternatives(subject, text_content, from_email, to)
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+
+@shared_task
+def purge_idempotency_keys():
+    """
+    Delete booking idempotency keys past ``IDEMPOTENCY_KEY_TTL``; run
+    periodically by celery beat (``CELERY_BEAT_SCHEDULE``).
+    """
+    expired = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expired).delete()
+    return deleted
+
+
+@shared_task
+def start_practitioner_export(job_id):
+    """
+    Plan a $export job (first run only) and fan its unfinished chunks out
+    to the workers. Re-running it resumes an interrupted job.
+    """
+    job = ExportJob.objects.get(pk=job_id)
+    if job.status in (ExportJob.COMPLETED, ExportJob.CANCELLED):
+        return
+    if not job.chunks.exists():
+        bulk_export.plan_chunks(job)
+    job.status = ExportJob.IN_PROGRESS
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+    pending = list(job.chunks.filter(done=False).values_list("pk", flat=True))
+    if not pending:
+        finish_practitioner_export(job_id)
+        return
+    chord(export_practitioner_chunk.s(pk) for pk in pending)(finish_practitioner_export.si(job_id))
+
+
+@shared_task(acks_late=True, autoretry_for=(DatabaseError, OSError), retry_backoff=True, max_retries=3)
+def export_practitioner_chunk(chunk_id):
+    chunk = ExportChunk.objects.select_related("job").get(pk=chunk_id)
+    if chunk.job.status == ExportJob.CANCELLED:
+        return 0
+    return bulk_export.export_chunk(chunk)
+
+
+@shared_task
+def finish_practitioner_export(job_id):
+    job = ExportJob.objects.get(pk=job_id)
+    if job.status == ExportJob.CANCELLED:
+        return
+    if bulk_export.finish_job(job):
+        logger.info(
+            "$export %s finished: %s resources, %s resources/s",
+            job_id, job.resource_count, job.resources_per_second(),
+        )
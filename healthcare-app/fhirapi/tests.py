@@ -1,3 +1,1583 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import smtplib
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+import preprocessing
+from backend.celery import app as celery_app
+
+from fhir.resources.bundle import Bundle
+from fhir.resources.practitioner import Practitioner
+from geopy.distance import great_circle
+
+from . import autocomplete, cache as response_cache, facets, metrics, outbox, partitions
+from .admin import search_params
+from .benchmarks import regressions, row_count
+from .benchmarks.booking import hammer, payloads
+from .benchmarks.loader import legacy_load
+from .benchmarks.synthetic import write_cms_file
+from .fhir import PRACTITIONER_FIELDS, doctor_row, practitioner_json
+from .loading import (
+    DOCTOR_COLUMNS, copy_rows, create_source_table, droppable_indexes, iter_csv, iter_table, load_doctors, load_parquet,
+)
+from .availability import free_slots, slots_sql
+from .geo import geocode_doctors, load_centroids
+from .models import (
+    Appointment, Doctor, DoctorFacet, DoctorImportFile, DoctorSchedule, DoctorSyncRun, ExportChunk, ExportJob, IdempotencyKey,
+    Location, OutboxMessage, ScheduleException, Specialty, ZipCentroid,
+)
+from .pagination import EstimatedCountPaginator
+from .parquet import DOCTOR_SCHEMA, read_doctors
+from .routers import PIN_COOKIE, replica_reads
+from .serializers import DOCTOR_FIELDS, AppointmentSerializer, DoctorSerializer
+from .tasks import export_practitioner_chunk, start_practitioner_export
+
+
+def doctor_values(**overrides):
+    row = {
+        "practitioner_id": "1234567890", "first_name": "ANITA", "last_name": "SHAH",
+        "specialization": "INTERNAL MEDICINE", "phone": "4155550100", "email": "ashah@docmail.com",
+        "address": "1 MAIN ST, SUITE 200", "city": "SAN FRANCISCO", "state": "CA", "zip_code": "941071234",
+    }
+    row.update(overrides)
+    return row
+
+
+def make_doctor(practitioner_id, first_name, last_name, **extra):
+    fields = {
+        "specialization": "INTERNAL MEDICINE",
+        "phone": "4155550100",
+        "email": f"{first_name[:1]}{last_name}@docmail.com".lower(),
+        "address": "1 MAIN ST, ",
+        "city": "SAN FRANCISCO",
+        "state": "CA",
+        "zip_code": "941071234",
+    }
+    fields.update(extra)
+    return Doctor.objects.create(
+        practitioner_id=practitioner_id, first_name=first_name, last_name=last_name, **fields
+    )
+
+
+class ApiTestCase(TestCase):
+    """
+    Starts every test with an empty response cache: TestCase never commits,
+    so the on_commit version bumps that would normally invalidate it don't run.
+    """
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class DoctorSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("1001", "ANITA", "SHAH", specialization="CARDIOVASCULAR DISEASE (CARDIOLOGY)")
+        make_doctor("1002", "JOHN", "SMITH", city="BOSTON", state="MA", zip_code="021081111")
+        make_doctor("1003", "MARY", "JOHNSON", specialization="DERMATOLOGY", city="NEW YORK", state="NY",
+                    zip_code="100019999")
+
+    def ids(self, params):
+        return [d.practitioner_id for d in Doctor.objects.filter_from_params(params)]
+
+    def test_substring_lookups_are_case_insensitive(self):
+        self.assertEqual(self.ids({"last_name": "mit"}), ["1002"])
+        self.assertEqual(self.ids({"specialization": "cardio"}), ["1001"])
+        self.assertEqual(self.ids({"city": "york"}), ["1003"])
+
+    def test_state_is_an_exact_match(self):
+        self.assertEqual(self.ids({"state": "ma"}), ["1002"])
+        self.assertEqual(self.ids({"state": "m"}), [])
+
+    def test_zip_code_is_a_prefix_match(self):
+        self.assertEqual(self.ids({"zip_code": "0210"}), ["1002"])
+        self.assertEqual(self.ids({"zip_code": "1111"}), [])
+
+    def test_full_text_search_is_ranked(self):
+        make_doctor("1004", "BOSTON", "JONES", city="CHICAGO", state="IL")
+        # Name matches carry more weight than city matches.
+        self.assertEqual(self.ids({"q": "boston"}), ["1004", "1002"])
+        self.assertEqual(self.ids({"q": "dermatology johnson"}), ["1003"])
+
+    def test_name_filters_become_reference_id_lookups(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.ids({"specialization": "DERMA", "state": "ny"}), ["1003"])
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]["sql"]
+        self.assertIn('"doctors"."specialty_id" IN (SELECT', sql)
+        self.assertIn('"doctors"."location_id" IN (SELECT', sql)
+
+    def test_search_vector_follows_specialty_and_city_changes(self):
+        doctor = Doctor.objects.get(pk="1002")
+        doctor.specialization, doctor.city = "NEUROLOGY", "SALEM"
+        doctor.save()
+        self.assertEqual(self.ids({"q": "neurology salem"}), ["1002"])
+        self.assertEqual(self.ids({"q": "boston"}), [])
+
+
+class ReferenceTableTests(ApiTestCase):
+    def test_doctors_share_specialty_and_location_rows(self):
+        make_doctor("1101", "ANA", "LEE")
+        make_doctor("1102", "BEN", "KIM", city=None, state=None)
+        response = self.client.post("/api/create/", {
+            **doctor_values(practitioner_id="1103"), "specialization": "Sports Medicine", "city": "",
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()["city"], "")
+
+        self.assertEqual(sorted(Specialty.objects.values_list("code", "name")),
+                         [("INTERNAL_MEDICINE", "INTERNAL MEDICINE"), ("SPORTS_MEDICINE", "Sports Medicine")])
+        self.assertEqual(sorted(Location.objects.ids()), [("", "CA"), ("SAN FRANCISCO", "CA")])
+        self.assertIsNone(Doctor.objects.get(pk="1102").location)
+
+    def test_detail_codes_come_from_the_specialty_table(self):
+        make_doctor("1104", "ANA", "LEE")
+        Specialty.objects.filter(name="INTERNAL MEDICINE").update(code="207R00000X")
+        coding = self.client.get("/api/doctor/1104/").json()["qualification"][0]["code"]["coding"][0]
+        self.assertEqual((coding["code"], coding["display"]), ("207R00000X", "INTERNAL MEDICINE"))
+
+    def test_loads_add_new_names_once(self):
+        rows = [tuple(doctor_values(practitioner_id=f"11{i:02d}", city=city, specialization=specialty).values())
+                for i, (city, specialty) in enumerate([("OAKLAND", "NEUROLOGY"), ("OAKLAND", "NEUROLOGY"),
+                                                        (None, "")])]
+        load_doctors(rows, batch_size=2)
+        self.assertEqual(Specialty.objects.get(name="NEUROLOGY").doctors.count(), 2)
+        self.assertEqual(Location.objects.get(city="OAKLAND").doctors.count(), 2)
+        self.assertEqual(Doctor.objects.get(pk="1102").specialization, "")
+        self.assertEqual(Doctor.objects.get(pk="1102").location, Location.objects.get(city=None, state="CA"))
+
+
+class ReferenceMigrationTests(TransactionTestCase):
+    def test_names_move_to_reference_tables_and_back(self):
+        executor = MigrationExecutor(connection)
+        latest = executor.loader.graph.leaf_nodes("fhirapi")
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(latest))
+        executor.migrate([("fhirapi", "0017_doctor_facets")])
+        columns = "practitioner_id, first_name, last_name, specialization, phone, email, address, city, state"
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO doctors ({columns}) VALUES
+                ('1201', 'ANA', 'LEE', 'CARDIOLOGY', '4155550100', '', '1 MAIN ST', 'SALEM', 'OR'),
+                ('1202', 'BEN', 'KIM', 'CARDIOLOGY', '4155550100', '', '1 MAIN ST', NULL, 'OR'),
+                ('1203', 'CAL', 'ORR', '', '4155550100', '', '1 MAIN ST', NULL, NULL)
+            """)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([("fhirapi", "0018_specialty_location")])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT d.practitioner_id, s.code, l.city, l.state, d.search_vector::text
+                FROM doctors d LEFT JOIN specialties s ON s.id = d.specialty_id
+                LEFT JOIN locations l ON l.id = d.location_id ORDER BY 1
+            """)
+            self.assertEqual(cursor.fetchall(), [
+                ("1201", "CARDIOLOGY", "SALEM", "OR", "'ana':1A 'cardiology':3B 'lee':2A 'salem':4C"),
+                ("1202", "CARDIOLOGY", None, "OR", "'ben':1A 'cardiology':3B 'kim':2A"),
+                ("1203", None, None, None, "'cal':1A 'orr':2A"),
+            ])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([("fhirapi", "0017_doctor_facets")])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT practitioner_id, specialization, city, state FROM doctors ORDER BY 1")
+            self.assertEqual(cursor.fetchall(), [
+                ("1201", "CARDIOLOGY", "SALEM", "OR"), ("1202", "CARDIOLOGY", None, "OR"), ("1203", "", None, None),
+            ])
+
+
+class DoctorKeysetPaginationTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated (first, last) pairs so pages break inside runs of equal names.
+        names = itertools.cycle([("ANA", "LEE"), ("ANA", "KIM"), ("BEN", "LEE"), ("ZOE", "ALI")])
+        for i in range(37):
+            first, last = next(names)
+            make_doctor(f"{5000 - i * 7}", first, last, state="CA" if i % 3 else "NY")
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def offset_ids(self, params):
+        ids, page = [], 1
+        while True:
+            body = self.client.get("/api/doctors/filter/", {**params, "page": page, "page_size": 5}).json()
+            ids += [row["practitioner_id"] for row in body["results"]]
+            if not body["next"]:
+                return ids
+            page += 1
+
+    def walk_cursor(self, params):
+        pages, url = [], "/api/doctors/filter/"
+        query = {**params, "cursor": "", "page_size": 5}
+        while url:
+            body = self.client.get(url, query).json()
+            query = None
+            pages.append(body)
+            url = body["next"]
+        return pages
+
+    def test_cursor_pages_match_offset_pages(self):
+        for params in ({}, {"sort": "desc"}, {"state": "ca"}, {"state": "ca", "sort": "desc"}, {"q": "lee"}):
+            with self.subTest(params=params):
+                pages = self.walk_cursor(params)
+                cursor_ids = [row["practitioner_id"] for page in pages for row in page["results"]]
+                self.assertEqual(cursor_ids, self.offset_ids(params))
+
+    def test_previous_links_walk_back_over_the_same_pages(self):
+        pages = self.walk_cursor({"sort": "desc"})
+        self.assertIsNone(pages[0]["previous"])
+        body, seen = pages[-1], []
+        while body["previous"]:
+            body = self.client.get(body["previous"]).json()
+            seen.append([row["practitioner_id"] for row in body["results"]])
+        expected = [[row["practitioner_id"] for row in page["results"]] for page in pages[:-1]]
+        self.assertEqual(seen, expected[::-1])
+
+    def test_count_is_opt_in(self):
+        body = self.client.get("/api/doctors/filter/", {"cursor": ""}).json()
+        self.assertNotIn("count", body)
+        body = self.client.get("/api/doctors/filter/", {"cursor": "", "count": "exact", "state": "ny"}).json()
+        self.assertEqual(body["count"], 13)
+        self.assertFalse(body["count_is_estimate"])
+        body = self.client.get("/api/doctors/filter/", {"cursor": "", "count": "estimate"}).json()
+        self.assertTrue(body["count_is_estimate"])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get("/api/doctors/filter/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+class DoctorExportTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("2001", "ANA", "LEE")
+        make_doctor("2002", "BEN", "KIM", state="NY")
+        make_doctor("2003", "CARL", "DIAZ", city=None, state=None, zip_code=None)
+
+    def stream(self, params):
+        response = self.client.get("/api/doctors/export/", params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson_is_one_row_per_line(self):
+        response, body = self.stream({})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["practitioner_id"] for row in rows], ["2001", "2002", "2003"])
+        self.assertIsNone(rows[2]["city"])
+        self.assertNotIn("search_vector", rows[0])
+
+    def test_json_array_honours_filters(self):
+        response, body = self.stream({"format": "json", "state": "ca", "sort": "desc"})
+        self.assertEqual([row["practitioner_id"] for row in json.loads(body)], ["2001"])
+        _, body = self.stream({"format": "json", "state": "tx"})
+        self.assertEqual(json.loads(body), [])
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get("/api/doctors/export/", {"format": "xml"}).status_code, 400)
+
+    def test_doctor_list_streams_the_serializer_output(self):
+        response = self.client.get("/api/doctors/")
+        self.assertTrue(response.streaming)
+        rows = sorted(json.loads(b"".join(response.streaming_content)), key=lambda row: row["practitioner_id"])
+        self.assertEqual(rows, DoctorSerializer(Doctor.objects.order_by("pk"), many=True).data)
+
+
+class EagerCeleryMixin:
+    def setUp(self):
+        super().setUp()
+        previous = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", previous)
+
+
+class BulkExportTests(EagerCeleryMixin, ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            make_doctor(f"30{i:02d}", "ANA", f"DOC{i}")
+        make_doctor("3099", "NOPHONE", "DOC", phone="", address="")
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings_override = override_settings(FHIR_EXPORT_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "application/fhir+ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_kick_off_poll_and_download(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get("/api/$export", HTTP_PREFER="respond-async")
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.get(response["Content-Location"])
+        self.assertEqual(response.status_code, 200)
+        manifest = response.json()
+        self.assertEqual(manifest["extension"]["resourceCount"], 8)
+        self.assertEqual(manifest["error"], [])
+        resources = [r for entry in manifest["output"] for r in self.download(entry["url"])]
+        self.assertEqual(sorted(r["id"] for r in resources), sorted(Doctor.objects.values_list("pk", flat=True)))
+        self.assertTrue(all(r["resourceType"] == "Practitioner" for r in resources))
+
+    def test_kick_off_requires_respond_async(self):
+        self.assertEqual(self.client.get("/api/$export").status_code, 400)
+        response = self.client.get("/api/$export", {"_type": "Patient"}, HTTP_PREFER="respond-async")
+        self.assertEqual(response.status_code, 400)
+
+    def test_interrupted_job_resumes_from_unfinished_chunks(self):
+        job = ExportJob.objects.create(request_url="http://testserver/api/$export", chunk_size=3)
+        with mock.patch("fhirapi.tasks.chord"):
+            # The job is planned and dispatched, but no worker ever runs the chunks.
+            start_practitioner_export(str(job.job_id))
+        self.assertEqual(job.chunks.count(), 3)
+
+        first = job.chunks.get(index=0)
+        export_practitioner_chunk(first.pk)
+        written = ExportChunk.objects.get(pk=first.pk).completed_at
+
+        start_practitioner_export(str(job.job_id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.COMPLETED)
+        self.assertEqual(job.resource_count, 8)
+        self.assertEqual(ExportChunk.objects.get(pk=first.pk).completed_at, written)
+        status = self.client.get(f"/api/bulkstatus/{job.job_id}/").json()
+        self.assertEqual([entry["count"] for entry in status["output"]], [3, 3, 2])
+
+    def test_delete_cancels(self):
+        job = ExportJob.objects.create(request_url="http://testserver/api/$export")
+        self.assertEqual(self.client.delete(f"/api/bulkstatus/{job.job_id}/").status_code, 202)
+        self.assertEqual(self.client.get(f"/api/bulkstatus/{job.job_id}/").status_code, 404)
+
+
+def practitioner_values(**overrides):
+    row = doctor_values(**overrides)
+    row["specialty_code"] = Specialty.code_for(row["specialization"]) if row["specialization"] else ""
+    return row
+
+
+class PractitionerEncoderTests(ApiTestCase):
+    ROWS = [
+        practitioner_values(),
+        practitioner_values(city=None, state=None, zip_code=None),
+        practitioner_values(phone="", email="", address=""),
+        practitioner_values(first_name="", specialization="", address="  1 MAIN ST  "),
+    ]
+
+    def test_output_matches_the_fhir_resources_schema(self):
+        for row in self.ROWS:
+            with self.subTest(row=row):
+                resource = practitioner_json(row)
+                validated = Practitioner.model_validate(resource)
+                self.assertEqual(validated.model_dump(mode="json", exclude_none=True), resource)
+                self.assertNotIn("specialty", resource)
+
+    def test_specialization_becomes_a_qualification_coding(self):
+        coding = practitioner_json(practitioner_values())["qualification"][0]["code"]["coding"][0]
+        self.assertEqual(coding["code"], "INTERNAL_MEDICINE")
+        self.assertEqual(coding["display"], "INTERNAL MEDICINE")
+
+    def test_model_serializer_and_detail_view_share_the_encoder(self):
+        doctor = make_doctor("4001", "ANA", "LEE")
+        row = {field: getattr(doctor, field) for field in PRACTITIONER_FIELDS}
+        self.assertEqual(DoctorSerializer(doctor).to_fhir(), practitioner_json(row))
+        self.assertIsInstance(doctor.to_fhir(), Practitioner)
+        response = self.client.get("/api/doctor/4001/")
+        self.assertEqual(response.json(), practitioner_json(row))
+        self.assertEqual(self.client.get("/api/doctor/4002/").status_code, 404)
+
+
+class BatchLookupTests(ApiTestCase):
+    URL = "/api/doctors/batch/"
+
+    @classmethod
+    def setUpTestData(cls):
+        for practitioner_id in ("4101", "4102", "0004103"):
+            make_doctor(practitioner_id, "ANA", "LEE")
+
+    def test_bundle_keeps_the_requested_order_with_not_found_entries(self):
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(self.URL, {"ids": "4102, 9999,0004103,4102"}).json()
+        self.assertEqual(len(queries), 1)
+        self.assertIn("= ANY(", queries[0]["sql"])
+        self.assertEqual(Bundle.model_validate(body).model_dump(mode="json", exclude_none=True), body)
+        self.assertEqual((body["type"], body["total"]), ("searchset", 2))
+        match, missing, padded = body["entry"]
+        self.assertEqual(match["resource"], practitioner_json(doctor_row(Doctor.objects.get(pk="4102"))))
+        self.assertEqual((match["fullUrl"], match["search"]["mode"]), ("http://testserver/api/doctor/4102/", "match"))
+        self.assertEqual(missing["search"]["mode"], "outcome")
+        self.assertEqual(missing["resource"]["issue"][0]["code"], "not-found")
+        self.assertEqual(padded["resource"]["id"], "0004103")
+
+    def test_ids_from_a_post_body_or_repeated_params(self):
+        response = self.client.post(self.URL, {"ids": [4101, "0004103"]}, content_type="application/json")
+        self.assertEqual([entry["resource"]["id"] for entry in response.json()["entry"]], ["4101", "0004103"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        body = self.client.get(f"{self.URL}?ids=4101&ids=4102").json()
+        self.assertEqual(body["total"], 2)
+
+    def test_invalid_requests(self):
+        for response in [
+            self.client.get(self.URL),
+            self.client.get(self.URL, {"ids": " , "}),
+            self.client.get(self.URL, {"ids": ",".join(map(str, range(101)))}),
+            self.client.post(self.URL, {"ids": "4101"}, content_type="application/json"),
+            self.client.post(self.URL, {"ids": [["4101"]]}, content_type="application/json"),
+        ]:
+            self.assertEqual(response.status_code, 400)
+
+    def test_detail_accepts_non_numeric_ids(self):
+        make_doctor("A-17", "ANA", "LEE")
+        self.assertEqual(self.client.get("/api/doctor/A-17/").json()["id"], "A-17")
+        self.assertEqual(self.client.get("/api/doctor/0004103/").json()["id"], "0004103")
+
+
+class ResponseCacheTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("6001", "ANA", "LEE")
+        make_doctor("6002", "BEN", "KIM", state="NY")
+
+    def test_repeated_requests_are_served_from_cache(self):
+        first = self.client.get("/api/doctors/filter/", {"state": "ca"})
+        second = self.client.get("/api/doctors/filter/", {"state": " CA "})
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.client.get("/api/doctors/filter/", {"state": "ny"})["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/cache/stats/").json()["hits"], 1)
+
+    def test_browsable_api_pages_are_never_cached(self):
+        self.client.force_login(User.objects.create_user("alice", password="pw"))
+        for _ in range(2):
+            response = self.client.get("/api/doctor/6001/", HTTP_ACCEPT="text/html")
+            self.assertContains(response, "alice")
+            self.assertNotIn("X-Cache", response)
+        self.client.logout()
+        response = self.client.get("/api/doctor/6001/", HTTP_ACCEPT="text/html")
+        self.assertNotContains(response, "alice")
+        self.assertEqual(self.client.get("/api/doctor/6001/")["X-Cache"], "MISS")
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get("/api/doctor/6001/")["ETag"]
+        response = self.client.get("/api/doctor/6001/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get("/api/doctor/6001/", HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_saving_a_doctor_invalidates_cached_pages(self):
+        self.client.get("/api/doctor/6001/")
+        self.client.get("/api/doctor/6002/")
+        version = response_cache.data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Doctor.objects.filter(pk="6001").update(first_name="ANNA")
+            Doctor.objects.get(pk="6001").save()
+        self.assertEqual(response_cache.data_version(), version + 1)
+        self.assertEqual(self.client.get("/api/doctor/6002/")["X-Cache"], "HIT")
+        response = self.client.get("/api/doctor/6001/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["name"][0]["given"], ["ANNA"])
+
+    def test_a_large_change_retires_every_detail_page(self):
+        self.client.get("/api/doctor/6002/")
+        with mock.patch.object(response_cache, "MAX_TRACKED_CHANGES", 1):
+            response_cache.bump_doctor_versions(["6001", "6003"])
+        self.assertEqual(self.client.get("/api/doctor/6002/")["X-Cache"], "MISS")
+
+    def test_delta_sync_only_invalidates_changed_doctors(self):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, path)
+        rows = list(Doctor.objects.order_by("pk").with_names().values_list(*DOCTOR_COLUMNS))
+        rows[0] = rows[0][:7] + ("OAKLAND",) + rows[0][8:]
+        with os.fdopen(handle, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(DOCTOR_COLUMNS)
+            writer.writerows(rows)
+
+        for url in ("/api/doctor/6001/", "/api/doctor/6002/", "/api/doctors/filter/?state=ca"):
+            self.client.get(url)
+        call_command("load_external_doctors_postgre", csv=path, stdout=io.StringIO())
+        self.assertEqual(self.client.get("/api/doctor/6001/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/doctor/6002/")["X-Cache"], "HIT")
+        self.assertEqual(self.client.get("/api/doctors/filter/?state=ca")["X-Cache"], "MISS")
+
+        version = response_cache.data_version()
+        call_command("load_external_doctors_postgre", csv=path, stdout=io.StringIO())
+        self.assertEqual(response_cache.data_version(), version)
+        self.assertEqual(self.client.get("/api/doctor/6001/")["X-Cache"], "HIT")
+
+    def test_errors_are_not_cached(self):
+        self.client.get("/api/doctor/9999/")
+        self.assertEqual(self.client.get("/api/doctor/9999/").status_code, 404)
+        self.assertEqual(response_cache.stats()["hits"], 0)
+
+
+class BulkLoaderTests(TestCase):
+    source = "test_external_doctors"
+
+    def setUp(self):
+        make_doctor("7001", "ANA", "LEE")
+        make_doctor("7002", "BEN", "KIM")
+        make_doctor("7003", "CAL", "ORR")
+        existing = Doctor.objects.with_names().values_list(*DOCTOR_COLUMNS)
+        self.rows = [
+            existing.get(pk="7001"),
+            existing.get(pk="7002")[:7] + ("OAKLAND", "CA", "946121234"),
+            tuple(doctor_values(practitioner_id="7004", first_name="DEV", last_name="RAO", zip_code=None).values()),
+            tuple(doctor_values(practitioner_id="7005", first_name="EVE", last_name="WU").values()),
+            tuple(doctor_values(practitioner_id="7005", first_name="EVA", last_name="WU").values()),
+        ]
+        create_source_table(self.source)
+        copy_rows(self.rows, self.source)
+
+    def snapshot(self):
+        return list(Doctor.objects.order_by("pk").with_names().values_list(*DOCTOR_COLUMNS))
+
+    def test_merge_matches_the_update_or_create_loop(self):
+        with transaction.atomic():
+            legacy_load(self.source)
+            expected = self.snapshot()
+            transaction.set_rollback(True)
+
+        result = load_doctors(iter_table(self.source, batch_size=2), batch_size=2)
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(Doctor.objects.get(pk="7005").first_name, "EVA")
+        self.assertIsNone(Doctor.objects.get(pk="7004").zip_code)
+        self.assertEqual((result.copied, result.inserted, result.updated, result.unchanged), (5, 2, 1, 1))
+
+    def book(self, doctor_id, date):
+        return Appointment.objects.create(
+            doctor_id=doctor_id, patient_name="PAT", phone_number="4155550101", email="pat@example.com",
+            reason="checkup", appointment_date=date, appointment_time="09:00",
+        )
+
+    def test_delta_sync_deletes_missing_doctors_and_records_the_run(self):
+        self.book("7003", "2020-01-02")
+        DoctorSchedule.objects.create(doctor_id="7003", weekday=0, start_time="09:00", end_time="12:00")
+        result = load_doctors(iter_table(self.source, batch_size=100), delete_missing=True, source=self.source)
+
+        self.assertFalse(Doctor.objects.filter(pk="7003").exists())
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(DoctorSchedule.objects.exists())
+        self.assertEqual(sorted(result.changed_ids), ["7002", "7003", "7004", "7005"])
+        run = DoctorSyncRun.objects.get()
+        self.assertEqual((run.source, run.inserted, run.updated, run.deleted, run.touched), (self.source, 2, 1, 1, 4))
+
+        result = load_doctors(iter_table(self.source, batch_size=100), delete_missing=True)
+        self.assertEqual((result.touched, result.unchanged, result.changed_ids), (0, 4, []))
+
+    def test_deletes_can_be_scoped_to_states(self):
+        make_doctor("7010", "GUS", "POE", state="NY")
+        load_doctors(iter_table(self.source, batch_size=100), delete_missing=True, states=["NY"])
+        self.assertFalse(Doctor.objects.filter(pk="7010").exists())
+        self.assertTrue(Doctor.objects.filter(pk="7003").exists())
+
+    def test_content_hash_tells_null_from_blank(self):
+        doctor = Doctor.objects.get(pk="7001")
+        hashes = {doctor.content_hash}
+        for city in ("", None):
+            Doctor.objects.filter(pk="7001").update(location_id=Location.objects.resolve([city, "CA"]))
+            hashes.add(Doctor.objects.get(pk="7001").content_hash)
+        self.assertEqual(len(hashes), 3)
+
+    def test_doctors_with_upcoming_appointments_are_never_deleted(self):
+        self.book("7003", timezone.localdate())
+        with self.assertRaisesMessage(ValueError, "1 doctors missing from the extract who have 1 upcoming"):
+            load_doctors(iter_table(self.source, batch_size=100), delete_missing=True)
+        self.assertEqual(Doctor.objects.count(), 3)
+        self.assertEqual(Appointment.objects.count(), 1)
+        # Without --delete-missing the load goes ahead and keeps the doctor.
+        call_command("load_external_doctors_postgre", source_table=self.source, stdout=io.StringIO())
+        self.assertTrue(Doctor.objects.filter(pk="7003").exists())
+        with self.assertRaises(CommandError):
+            call_command("load_external_doctors_postgre", source_table=self.source, delete_missing=True,
+                         stdout=io.StringIO())
+
+    def test_an_empty_extract_never_deletes(self):
+        with self.assertRaises(ValueError):
+            load_doctors([], delete_missing=True)
+        self.assertEqual(Doctor.objects.count(), 3)
+
+    def test_dropped_indexes_are_rebuilt(self):
+        before = droppable_indexes("doctors")
+        load_doctors(iter_table(self.source, batch_size=100), drop_indexes=True)
+        self.assertEqual(droppable_indexes("doctors"), before)
+        self.assertEqual(Doctor.objects.count(), 5)
+
+    def test_csv_source_keeps_empty_strings(self):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, "w") as output:
+            output.write(",".join(DOCTOR_COLUMNS) + "\n")
+            output.write("7006,FAY,NG,DERMATOLOGY,5551234567,,1 MAIN ST,,CA,94107\n")
+        load_doctors(iter_csv(path))
+        doctor = Doctor.objects.get(pk="7006")
+        self.assertEqual((doctor.email, doctor.city), ("", ""))
+
+    def test_command_reports_throughput(self):
+        out = io.StringIO()
+        call_command("load_external_doctors_postgre", source_table=self.source, batch_size=2, stdout=out)
+        self.assertIn("rows/s", out.getvalue())
+        self.assertIn("Imported 5 doctors", out.getvalue())
+
+
+class BenchmarkRegressionTests(TestCase):
+    def test_latencies_and_rates_past_the_threshold_fail(self):
+        baseline = {
+            "detail": {"p50": 10.0, "p99": 40.0, "requests_per_second": 200},
+            "filter": {"page 1": {"p50": 20.0}},
+            "rows": 1000,
+        }
+        results = {
+            "detail": {"p50": 10.5, "p99": 90.0, "requests_per_second": 150},
+            "filter": {"page 1": {"p50": 30.0}},
+            "rows": 5000,
+            "new": {"p50": 1.0},
+        }
+        self.assertEqual(regressions(baseline, results, 10), [
+            ("detail/requests_per_second", 200, 150, 25.0),
+            ("filter/page 1/p50", 20.0, 30.0, 50.0),
+        ])
+        self.assertEqual(regressions(baseline, results, 60), [])
+
+    def test_row_presets(self):
+        self.assertEqual([row_count(value) for value in ("10k", "1M", "5m", "2500")],
+                         [10_000, 1_000_000, 5_000_000, 2500])
+
+
+class PreprocessingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.raw = os.path.join(directory, "raw.csv")
+        self.output = os.path.join(directory, "doctors.csv")
+        write_cms_file(self.raw, 500, duplicate_rate=0.5, incomplete_rate=0.1)
+
+    def test_chunked_output_is_deduplicated_and_loadable(self):
+        rows_read, rows_written = preprocessing.run_chunked(self.raw, self.output, chunksize=64, workers=1, output_format="csv")
+        rows = list(iter_csv(self.output))
+        ids = [row[0] for row in rows]
+
+        self.assertEqual(len(rows), rows_written)
+        self.assertGreater(rows_read, rows_written)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(all(len(row[9]) == 9 and row[4].isdigit() for row in rows))
+
+        first_run = Path(self.output).read_text()
+        preprocessing.run_chunked(self.raw, self.output, chunksize=100, workers=1, output_format="csv")
+        self.assertEqual(Path(self.output).read_text(), first_run)
+
+        self.assertEqual(load_doctors(iter_csv(self.output)).inserted, rows_written)
+
+    def test_chunked_keeps_the_same_practitioners_as_legacy(self):
+        preprocessing.run_legacy(self.raw, self.output)
+        legacy = {row[0] for row in iter_csv(self.output)}
+        preprocessing.run_chunked(self.raw, self.output, chunksize=64, workers=1, output_format="csv")
+        self.assertEqual({row[0] for row in iter_csv(self.output)}, legacy)
+
+
+class ParquetDatasetTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.raw = os.path.join(directory, "raw.csv")
+        self.dataset = os.path.join(directory, "doctors")
+        write_cms_file(self.raw, 300, duplicate_rate=0, incomplete_rate=0)
+        preprocessing.run_chunked(self.raw, self.dataset, chunksize=64, workers=1)
+
+    def test_schema_matches_the_doctor_model(self):
+        self.assertEqual(tuple(DOCTOR_SCHEMA.names), DOCTOR_COLUMNS)
+        for column in DOCTOR_SCHEMA:
+            self.assertEqual(column.nullable, DoctorSerializer().fields[column.name].allow_null, column.name)
+
+    def test_reads_only_the_requested_columns(self):
+        table = read_doctors(self.dataset, columns=["state", "specialization"])
+        self.assertEqual(table.column_names, ["state", "specialization"])
+        self.assertEqual(table.num_rows, 300)
+
+    def test_reload_only_reads_changed_partitions(self):
+        result, files = load_parquet(self.dataset)
+        self.assertEqual(result.inserted, 300)
+        self.assertEqual(DoctorImportFile.objects.count(), len(files))
+        self.assertEqual(load_parquet(self.dataset)[1], [])
+
+        with open(self.raw) as source:
+            lines = source.readlines()
+        fields = lines[1].split(",")
+        fields[27] = "9999999999"
+        lines[1] = ",".join(fields)
+        with open(self.raw, "w") as output:
+            output.writelines(lines)
+        preprocessing.run_chunked(self.raw, self.dataset, chunksize=64, workers=1)
+
+        result, files = load_parquet(self.dataset)
+        self.assertEqual(files, [f"{fields[25]}.parquet"])
+        self.assertEqual((result.inserted, result.updated), (0, 1))
+        self.assertEqual(Doctor.objects.get(pk=fields[1]).phone, "9999999999")
+
+    def test_command_skips_an_unchanged_dataset(self):
+        call_command("load_external_doctors_postgre", parquet=self.dataset, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("load_external_doctors_postgre", parquet=self.dataset, stdout=out)
+        self.assertIn("No dataset files changed", out.getvalue())
+
+
+CENTROIDS = {
+    "94107": (37.7648, -122.3963),  # San Francisco
+    "94612": (37.8085, -122.2727),  # Oakland, ~7 miles
+    "94043": (37.4186, -122.0572),  # Mountain View, ~30 miles
+    "10001": (40.7506, -73.9971),   # New York
+}
+
+
+class SparseFieldsetTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("2101", "ANA", "LEE")
+        make_doctor("2102", "BEN", "KIM", state="NY")
+        make_doctor("2103", "CARL", "DIAZ", city=None, state=None, zip_code=None)
+
+    def page(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/doctors/filter/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"], queries[-1]["sql"]
+
+    def test_without_fields_the_page_matches_the_model_serializer(self):
+        rows, _ = self.page({})
+        self.assertEqual(rows, DoctorSerializer(Doctor.objects.order_by_name(), many=True).data)
+        self.assertEqual([list(row) for row in rows], [list(DOCTOR_FIELDS)] * 3)
+
+    def test_fields_narrow_the_query_and_the_rows(self):
+        rows, sql = self.page({"fields": "city, first_name", "sort": "desc"})
+        self.assertEqual(rows, [{"first_name": "CARL", "city": None}, {"first_name": "BEN", "city": "SAN FRANCISCO"},
+                                {"first_name": "ANA", "city": "SAN FRANCISCO"}])
+        self.assertNotIn('"email"', sql)
+        self.assertNotIn(Specialty._meta.db_table, sql)
+        # The cursor's ordering columns are read but not returned.
+        rows, sql = self.page({"fields": "last_name", "cursor": "", "page_size": 2})
+        self.assertEqual(rows, [{"last_name": "LEE"}, {"last_name": "KIM"}])
+        self.assertNotIn(Location._meta.db_table, sql)
+
+    def test_fields_are_part_of_the_cache_key(self):
+        self.assertEqual(set(self.page({"fields": "state"})[0][0]), {"state"})
+        self.assertEqual(set(self.page({"fields": "zip_code"})[0][0]), {"zip_code"})
+
+    def test_unknown_fields_are_rejected(self):
+        for params in ({"fields": "first_name,search_vector"}, {"fields": ","}):
+            with self.subTest(params=params):
+                response = self.client.get("/api/doctors/filter/", params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+        self.assertEqual(self.client.get("/api/doctors/", {"fields": "distance"}).status_code, 400)
+
+    def test_doctor_list_streams_only_the_fields(self):
+        response = self.client.get("/api/doctors/", {"fields": "practitioner_id,state"})
+        rows = sorted(json.loads(b"".join(response.streaming_content)), key=lambda row: row["practitioner_id"])
+        self.assertEqual(rows, [{"practitioner_id": "2101", "state": "CA"}, {"practitioner_id": "2102", "state": "NY"},
+                                {"practitioner_id": "2103", "state": None}])
+
+    def test_elements_subset_the_practitioner(self):
+        resource = self.client.get("/api/doctor/2101/", {"_elements": "name,id"}).json()
+        self.assertEqual(Practitioner.model_validate(resource).model_dump(mode="json", exclude_none=True), resource)
+        self.assertEqual(set(resource), {"resourceType", "id", "meta", "name"})
+        self.assertEqual(resource["meta"]["tag"][0]["code"], "SUBSETTED")
+        everything = self.client.get("/api/doctor/2101/", {"_elements": "name,telecom,address,qualification"})
+        self.assertEqual(everything.json(), self.client.get("/api/doctor/2101/").json())
+        self.assertEqual(self.client.get("/api/doctor/2101/", {"_elements": "gender"}).status_code, 400)
+
+        body = self.client.get("/api/doctors/batch/", {"ids": "2102,2103", "_elements": "address"}).json()
+        new_york = {"line": ["1 MAIN ST, "], "city": "SAN FRANCISCO", "state": "NY", "postalCode": "941071234"}
+        self.assertEqual([entry["resource"].get("address") for entry in body["entry"]],
+                         [[new_york], [{"line": ["1 MAIN ST, "]}]])
+
+
+class ProximitySearchTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ZipCentroid.objects.bulk_create(
+            ZipCentroid(zip_code=zip_code, latitude=lat, longitude=lon) for zip_code, (lat, lon) in CENTROIDS.items()
+        )
+        for index, zip_code in enumerate(["941071234", "941079999", "946121111", "940432222", "100013333"]):
+            make_doctor(f"800{index}", "DOC", f"NUMBER{index}", zip_code=zip_code,
+                        specialization="CARDIOLOGY" if index % 2 else "DERMATOLOGY")
+        make_doctor("8009", "NO", "ZIP", zip_code="")
+
+    def nearby(self, **params):
+        response = self.client.get("/api/doctors/filter/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_saved_doctors_are_geocoded_from_the_zip_centroid(self):
+        doctor = Doctor.objects.get(pk="8002")
+        self.assertEqual((doctor.latitude, doctor.longitude), CENTROIDS["94612"])
+        self.assertIsNone(Doctor.objects.get(pk="8009").latitude)
+
+    def test_near_zip_returns_doctors_inside_the_radius_nearest_first(self):
+        results = self.nearby(near_zip="94107", radius="10")["results"]
+        self.assertEqual([r["practitioner_id"] for r in results], ["8000", "8001", "8002"])
+        expected = great_circle(CENTROIDS["94107"], CENTROIDS["94612"]).miles
+        self.assertAlmostEqual(results[2]["distance"], expected, places=1)
+        self.assertEqual(results[0]["distance"], 0)
+        self.assertEqual(list(results[0]), list(DOCTOR_FIELDS) + ["latitude", "longitude", "distance"])
+        sparse = self.nearby(near_zip="94107", radius="10", fields="distance")["results"]
+        self.assertEqual(sparse, [{"distance": result["distance"]} for result in results])
+
+        wider = self.nearby(near_zip="94107", radius="40", specialization="cardiology")["results"]
+        self.assertEqual([r["practitioner_id"] for r in wider], ["8001", "8003"])
+
+    def test_lat_lon_pages_with_a_cursor(self):
+        lat, lon = CENTROIDS["94043"]
+        pages, url = [], "/api/doctors/filter/"
+        params = {"lat": lat, "lon": lon, "radius": 50, "page_size": 2}
+        while url:
+            body = self.client.get(url, params).json()
+            pages.append([r["practitioner_id"] for r in body["results"]])
+            url, params = body["next"], None
+        self.assertEqual(pages, [["8003", "8002"], ["8000", "8001"]])
+
+    def test_bad_proximity_params_are_rejected(self):
+        for params in ({"near_zip": "99999"}, {"lat": "abc", "lon": "1"}, {"lat": "37"},
+                       {"lat": "37", "lon": "-122", "radius": "500"}):
+            response = self.client.get("/api/doctors/filter/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_nearest_first_is_an_index_scan(self):
+        queryset = Doctor.objects.filter_from_params({"near_zip": "94107"})[:13]
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+            plan = queryset.explain()
+        self.assertIn("Index Scan using doctors_location_gist_idx", plan)
+        self.assertIn("Order By", plan)
+
+    def test_gazetteer_file_and_batch_geocoding(self):
+        Doctor.objects.update(latitude=None, longitude=None)
+        handle, path = tempfile.mkstemp(suffix=".txt")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, "w") as output:
+            output.write("GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG                  \n")
+            output.write("94107\t1\t0\t1\t0\t37.7648\t-122.3963\n")
+            output.write("94612\t1\t0\t1\t0\t37.8085\t-122.2727\n")
+
+        self.assertEqual(load_centroids(path), 2)
+        self.assertEqual(geocode_doctors(batch_size=2), 3)
+        self.assertEqual(Doctor.objects.filter(latitude__isnull=False).count(), 3)
+        self.assertEqual(geocode_doctors(batch_size=2), 0)
+
+
+class AvailabilityTests(ApiTestCase):
+    # A Monday far enough ahead that no slot is in the past.
+    MONDAY = datetime.date(2030, 1, 7)
+
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9001", "ANA", "FREE")
+        make_doctor("9002", "BEN", "BUSY")
+        make_doctor("9003", "CAL", "NOSCHEDULE")
+        starting = {"valid_from": cls.MONDAY}
+        DoctorSchedule.objects.create(doctor_id="9001", weekday=0, start_time="09:00", end_time="11:00", **starting)
+        DoctorSchedule.objects.create(doctor_id="9001", weekday=1, start_time="09:00", end_time="10:00",
+                                      slot_minutes=20, **starting)
+        DoctorSchedule.objects.create(doctor_id="9002", weekday=0, start_time="09:00", end_time="10:00",
+                                      valid_until=cls.MONDAY + datetime.timedelta(days=7), **starting)
+        ScheduleException.objects.create(doctor_id="9001", date=cls.MONDAY + datetime.timedelta(days=1),
+                                         start_time="09:10", end_time="09:30")
+        ScheduleException.objects.create(doctor_id="9002", date=cls.MONDAY, reason="conference")
+        Appointment.objects.create(
+            doctor_id="9001", patient_name="PAT", phone_number="+14155550101", email="pat@example.com",
+            reason="checkup", appointment_date=cls.MONDAY, appointment_time="09:45",
+        )
+
+    def test_slots_skip_appointments_and_exceptions(self):
+        body = self.client.get("/api/doctor/9001/availability/", {
+            "start": self.MONDAY.isoformat(), "end": (self.MONDAY + datetime.timedelta(days=1)).isoformat(),
+        }).json()
+        self.assertEqual(body["slots"], {
+            "2030-01-07": ["09:00", "10:00", "10:30"],
+            "2030-01-08": ["09:40"],
+        })
+
+    def test_many_doctors_in_one_request(self):
+        monday, next_monday = self.MONDAY, self.MONDAY + datetime.timedelta(days=7)
+        end = next_monday + datetime.timedelta(days=7)
+        body = self.client.get(
+            "/api/availability/", {"doctors": "9002,9003", "start": monday.isoformat(), "end": end.isoformat()}
+        ).json()
+        # Day off on the first Monday, schedule ended before the third.
+        self.assertEqual(body["doctors"], {"9002": {"2030-01-14": ["09:00", "09:30"]}, "9003": {}})
+
+    def test_past_slots_are_left_out(self):
+        now = datetime.datetime.combine(self.MONDAY, datetime.time(10, 15))
+        slots = free_slots(["9001"], self.MONDAY, self.MONDAY, now)["9001"]
+        self.assertEqual(slots, [datetime.datetime.combine(self.MONDAY, datetime.time(10, 30))])
+
+    def test_bad_requests(self):
+        for url, params in [
+            ("/api/availability/", {}),
+            ("/api/availability/", {"doctors": ",".join(str(i) for i in range(101))}),
+            ("/api/availability/", {"doctors": "9001", "start": "next week"}),
+            ("/api/doctor/9001/availability/", {"start": "2030-01-08", "end": "2030-01-07"}),
+            ("/api/doctor/9001/availability/", {"start": "2030-01-01", "end": "2030-03-01"}),
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+        self.assertEqual(self.client.get("/api/doctor/404/availability/").status_code, 404)
+
+    def test_available_within_filter(self):
+        for weekday in range(7):
+            DoctorSchedule.objects.create(doctor_id="9003", weekday=weekday, start_time="00:00", end_time="23:59",
+                                          slot_minutes=1)
+        body = self.client.get("/api/doctors/filter/", {"available_within": "7", "last_name": "schedule"}).json()
+        self.assertEqual([row["practitioner_id"] for row in body["results"]], ["9003"])
+        # The other schedules start in 2030.
+        self.assertEqual(Doctor.objects.filter_from_params({"available_within": "7"}).count(), 1)
+        self.assertEqual(Doctor.objects.available(self.MONDAY, self.MONDAY).count(), 2)
+
+        response = self.client.get("/api/doctors/filter/", {"available_within": "90"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9101", "ANA", "BOOKED")
+
+    def post(self, payload, key=None):
+        headers = {"Idempotency-Key": key} if key is not None else {}
+        return self.client.post("/api/appointments/create/", payload, content_type="application/json", headers=headers)
+
+    def test_taken_slot_is_a_conflict(self):
+        payload = payloads(["9101"], 1)[0]
+        first = self.post(payload)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.json()["appointment_time"], "08:00:00")
+
+        second = self.post({**payload, "patient_name": "OTHER"})
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.json(), {
+            "error": "This slot is already booked.", "doctor": "9101",
+            "appointment_date": "2031-01-06", "appointment_time": "08:00",
+        })
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_idempotency_key_replays_the_first_response(self):
+        first, second = payloads(["9101"], 2)
+        booked = self.post(first, key="retry-1")
+        replayed = self.post(first, key="retry-1")
+        self.assertEqual((replayed.status_code, replayed.json()), (201, booked.json()))
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+        self.assertEqual(self.post(second, key="retry-1").status_code, 422)
+        self.assertEqual(self.post(first, key="x" * 256).status_code, 400)
+
+    def test_expired_key_is_reused(self):
+        first, second = payloads(["9101"], 2)
+        self.post(first, key="old")
+        IdempotencyKey.objects.filter(key="old").update(
+            created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        response = self.post(second, key="old")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["appointment_time"], "08:15:00")
+
+
+class AppointmentPartitionTests(ApiTestCase):
+    MONTH = datetime.date(2031, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9151", "ANA", "PARTITION")
+
+    def book(self, day, time="09:00"):
+        return Appointment.objects.create(
+            doctor_id="9151", patient_name="PAT", phone_number="+14155550101", email="pat@example.com",
+            reason="checkup", appointment_date=day, appointment_time=time,
+        )
+
+    def partition_of(self, appointment):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {partitions.TABLE} WHERE id = %s", [appointment.pk])
+            return cursor.fetchone()[0]
+
+    def plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_new_months_take_their_rows_from_the_default_partition(self):
+        appointment = self.book(datetime.date(2031, 1, 6))
+        self.assertEqual(self.partition_of(appointment), partitions.DEFAULT_PARTITION)
+
+        result = partitions.create_partitions(months_ahead=1, today=datetime.date(2031, 1, 20))
+        self.assertEqual(result.created, ["fhirapi_appointment_p2031_01", "fhirapi_appointment_p2031_02"])
+        self.assertEqual(result.moved, 1)
+        self.assertEqual(self.partition_of(appointment), "fhirapi_appointment_p2031_01")
+        self.assertEqual(partitions.create_partitions(months_ahead=1, today=datetime.date(2031, 1, 20)).created, [])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(datetime.date(2031, 1, 6))
+        response = self.client.post("/api/appointments/create/", {
+            **payloads(["9151"], 1)[0], "appointment_date": "2031-01-06", "appointment_time": "09:00",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 409)
+
+    def test_date_bounded_queries_are_pruned_to_their_months(self):
+        partitions.create_partitions(months_ahead=2, today=self.MONTH)
+        plan = Appointment.objects.filter(appointment_date__range=("2031-02-03", "2031-02-09")).explain()
+        self.assertEqual(set(re.findall(r"on (fhirapi_appointment_\w+)", plan)), {"fhirapi_appointment_p2031_02"})
+
+        start, end = datetime.date(2031, 1, 27), datetime.date(2031, 2, 2)
+        plan = self.plan(slots_sql("s.doctor_id = ANY(%s)"), [start, end, start, end, ["9151"], self.MONTH])
+        self.assertIn("fhirapi_appointment_p2031_01", plan)
+        self.assertIn("fhirapi_appointment_p2031_02", plan)
+        self.assertNotIn("fhirapi_appointment_p2031_03", plan)
+        self.assertNotIn(partitions.DEFAULT_PARTITION, plan)
+
+    def test_expired_months_are_archived_and_dropped(self):
+        with connection.cursor() as cursor:
+            partitions.create_partition(cursor, datetime.date(2020, 1, 1))
+        self.book(datetime.date(2020, 1, 6))
+        self.book(datetime.date(2031, 1, 6))
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root)
+
+        result = partitions.archive_partitions(keep_months=24, today=datetime.date(2026, 10, 18), root=root)
+        self.assertEqual(result.archived, {"fhirapi_appointment_p2020_01": 1})
+        with gzip.open(root / "fhirapi_appointment_p2020_01.csv.gz", "rt") as archive:
+            rows = list(csv.DictReader(archive))
+        self.assertEqual([(row["doctor_id"], row["appointment_date"]) for row in rows], [("9151", "2020-01-06")])
+        self.assertEqual(list(Appointment.objects.values_list("appointment_date", flat=True)),
+                         [datetime.date(2031, 1, 6)])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('fhirapi_appointment_p2020_01')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_command_creates_months_ahead(self):
+        out = io.StringIO()
+        call_command("appointment_partitions", "--ahead", "14", "--no-archive", stdout=out)
+        self.assertIn("2 partitions created", out.getvalue())
+
+
+class AppointmentPartitionMigrationTests(TransactionTestCase):
+    def test_rows_survive_partitioning_both_ways(self):
+        make_doctor("9152", "ANA", "MIGRATED")
+        executor = MigrationExecutor(connection)
+        latest = executor.loader.graph.leaf_nodes("fhirapi")
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(latest))
+        executor.migrate([("fhirapi", "0018_specialty_location")])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO fhirapi_appointment (appointment_id, doctor_id, patient_name, phone_number, email,
+                                                 reason, appointment_date, appointment_time, created_at)
+                VALUES (gen_random_uuid(), '9152', 'PAT', '+14155550101', 'p@example.com', '', '2019-05-06', '09:00',
+                        now())
+            """)
+
+        MigrationExecutor(connection).migrate(latest)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM fhirapi_appointment")
+            self.assertEqual(cursor.fetchall(), [("fhirapi_appointment_p2019_05",)])
+        appointment = Appointment.objects.create(
+            doctor_id="9152", patient_name="PAT", phone_number="+14155550101", email="p@example.com",
+            reason="", appointment_date=datetime.date(2019, 5, 7), appointment_time="09:00",
+        )
+        self.assertGreater(appointment.pk, 1)
+
+        MigrationExecutor(connection).migrate([("fhirapi", "0018_specialty_location")])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind, (SELECT count(*) FROM fhirapi_appointment) FROM pg_class "
+                           "WHERE relname = 'fhirapi_appointment'")
+            self.assertEqual(cursor.fetchone(), ("r", 2))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Threads on their own connections, so the races are real; hence a
+    TransactionTestCase.
+    """
+    def setUp(self):
+        make_doctor("9201", "HOT", "SLOTS")
+
+    def test_hot_slots_are_booked_once(self):
+        statuses, _ = hammer(payloads(["9201"], 3, copies=40), threads=8)
+        self.assertEqual(statuses, {201: 3, 409: 117})
+        self.assertEqual(Appointment.objects.count(), 3)
+
+    def test_concurrent_retries_book_once(self):
+        requests = payloads(["9201"], 2, copies=8)
+        keys = ["a"] * 8 + ["b"] * 8
+        statuses, _ = hammer(requests, threads=8, keys=keys)
+        # Every copy sees the first booking's 201, replayed.
+        self.assertEqual(statuses, {201: 16})
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9301", "OUT", "BOX")
+
+    def book(self, slots=1):
+        for payload in payloads(["9301"], slots):
+            self.client.post("/api/appointments/create/", payload, content_type="application/json")
+
+    def test_booking_queues_the_email_and_dispatch_sends_it(self):
+        self.book()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(outbox.stats()["pending"], 1)
+
+        result = outbox.dispatch()
+        self.assertEqual((result.sent, result.retried, result.dead), (1, 0, 0))
+        [message] = mail.outbox
+        self.assertEqual((message.subject, message.to), ("Appointment Confirmation", ["load@example.com"]))
+        self.assertIn("OUT BOX", message.body)
+        self.assertEqual(message.alternatives[0][1], "text/html")
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.SENT)
+        self.assertEqual(outbox.dispatch().sent, 0)
+
+    def test_rolled_back_booking_queues_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.book()
+            raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_batches_share_one_connection(self):
+        self.book(slots=25)
+        with mock.patch("fhirapi.outbox.get_connection", wraps=outbox.get_connection) as get_connection:
+            result = outbox.drain(batch_size=10)
+        self.assertEqual(result.sent, 25)
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual(len(mail.outbox), 25)
+
+    def test_failures_back_off_then_dead_letter(self):
+        self.book()
+        refused = smtplib.SMTPRecipientsRefused({"load@example.com": (550, b"No such user")})
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=refused):
+            self.assertEqual(outbox.dispatch(max_attempts=2).retried, 1)
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+            self.assertGreater(message.available_at, message.created_at)
+            self.assertIn("SMTPRecipientsRefused", message.last_error)
+            # Not due yet.
+            self.assertEqual(outbox.dispatch(max_attempts=2).retried, 0)
+
+            OutboxMessage.objects.update(available_at=message.created_at)
+            self.assertEqual(outbox.dispatch(max_attempts=2).dead, 1)
+        self.assertEqual(outbox.stats(), {"pending": 0, "dead": 1, "lag_seconds": 0.0})
+
+    def test_lost_connection_is_not_an_attempt(self):
+        self.book(slots=2)
+        lost = smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=lost):
+            result = outbox.dispatch()
+        self.assertEqual((result.sent, result.retried, result.dead), (0, 0, 0))
+        self.assertEqual(list(OutboxMessage.objects.values_list("status", "attempts")), [("pending", 0)] * 2)
+
+
+class AsyncViewTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(15):
+            make_doctor(f"{7000 + i}", "ASY", f"NC{i:02d}", state="TX" if i % 2 else "OK")
+
+    async def assertSameAsSync(self, path, params=None):
+        expected = await sync_to_async(self.client.get)(f"/api/{path}", params)
+        response = await self.async_client.get(f"/api/async/{path}", params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content.replace(b"/api/async/", b"/api/"), expected.content)
+        return response
+
+    async def test_filter_pages_match_the_sync_view(self):
+        for params in [
+            {"state": "TX"},
+            {"last_name": "nc1", "page": "2", "page_size": "3"},
+            {"first_name": "asy", "cursor": "", "page_size": "4", "count": "exact"},
+            {"page": "99"},
+            {"radius": "5"},
+            {"near_zip": "00000"},
+        ]:
+            with self.subTest(**params):
+                await self.assertSameAsSync("doctors/filter/", params)
+
+        first = await self.async_client.get("/api/async/doctors/filter/", {"cursor": "", "page_size": "4"})
+        second = await self.async_client.get(first.json()["next"])
+        self.assertEqual([row["practitioner_id"] for row in second.json()["results"]], ["7004", "7005", "7006", "7007"])
+
+    async def test_detail_matches_and_is_cached(self):
+        await self.assertSameAsSync("doctor/7003/")
+        response = await self.async_client.get("/api/async/doctor/7003/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual((await self.async_client.get("/api/async/doctor/404/")).status_code, 404)
+        self.assertEqual((await self.async_client.get("/api/async/")).json()["async"], "/api/async/")
+
+
+class MetricsTests(ApiTestCase):
+    DETAIL = ("GET", "api/doctor/<str:practitioner_id>/")
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = make_doctor("9501", "META", "TRICS")
+        for minute in range(12):
+            Appointment.objects.create(
+                doctor=doctor, patient_name="PAT", phone_number="+11234567890", email="p@example.com",
+                reason="checkup", appointment_date=datetime.date(2031, 1, 6),
+                appointment_time=datetime.time(9, minute),
+            )
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_requests_are_recorded_per_route(self):
+        for _ in range(2):
+            response = self.client.get("/api/doctor/9501/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        counts, _ = metrics.DB_QUERIES.samples(self.DETAIL)
+        self.assertEqual(sum(counts), 2)
+        # The miss reads the doctor; the hit is served from the cache.
+        self.assertEqual(counts[metrics.QUERY_BUCKETS.index(1)], 1)
+        self.assertEqual(counts[metrics.QUERY_BUCKETS.index(0)], 1)
+        self.assertGreater(metrics.SERIALIZE_SECONDS.samples(self.DETAIL)[1], 0)
+
+        body = self.client.get("/metrics").content.decode()
+        route = 'method="GET",route="api/doctor/<str:practitioner_id>/"'
+        self.assertIn(f"http_request_duration_seconds_count{{{route}}} 2", body)
+        self.assertIn(f'http_request_db_queries_bucket{{{route},le="+Inf"}} 2', body)
+        self.assertIn("# TYPE http_response_size_bytes histogram", body)
+        self.assertNotIn('route="metrics"', body)
+
+    async def test_async_view_queries_are_counted(self):
+        await self.async_client.get("/api/async/doctor/9501/")
+        counts, _ = metrics.DB_QUERIES.samples(("GET", "api/async/doctor/<str:practitioner_id>/"))
+        self.assertEqual(counts[metrics.QUERY_BUCKETS.index(1)], 1)
+
+    def test_lazy_related_lookups_are_flagged_as_n_plus_one(self):
+        def listing(appointments):
+            def view(request):
+                return HttpResponse(json.dumps(AppointmentSerializer(appointments, many=True).data, default=str))
+            return metrics.MetricsMiddleware(view)
+
+        request = RequestFactory().get("/appointments/")
+        with self.assertLogs("fhirapi.metrics", "WARNING") as logs:
+            listing(Appointment.objects.all())(request)
+        self.assertEqual(metrics.N_PLUS_ONE.value(("GET", "unmatched")), 1)
+        self.assertIn("ran 12 times", logs.output[0])
+
+        with self.assertNoLogs("fhirapi.metrics", "WARNING"):
+            listing(Appointment.objects.select_related("doctor"))(request)
+        self.assertEqual(metrics.N_PLUS_ONE.value(("GET", "unmatched")), 1)
+
+
+@override_settings(DATABASE_READ_REPLICA="replica")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    In tests the replica alias mirrors default on a connection of its own,
+    so it only sees committed rows.
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        make_doctor("9201", "RITA", "REPLICA")
+        # Past the replica lag window of that change.
+        cache.clear()
+
+    def doctor_queries(self, alias, path, **kwargs):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            response = self.client.get(path, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries if '"doctors"' in query["sql"]]
+
+    def test_search_detail_and_admin_read_from_the_replica(self):
+        for path in ["/api/doctors/filter/?last_name=replica", "/api/doctors/", "/api/doctor/9201/",
+                     "/api/async/doctor/9201/"]:
+            with self.subTest(path=path):
+                self.assertEqual(self.doctor_queries("default", path), [])
+                cache.clear()
+                self.assertTrue(self.doctor_queries("replica", path))
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        self.assertEqual(self.doctor_queries("default", "/admin/fhirapi/doctor/?state=CA"), [])
+        self.assertTrue(self.doctor_queries("replica", "/admin/fhirapi/doctor/?state=CA"))
+
+    def test_other_reads_and_all_writes_stay_on_the_primary(self):
+        self.assertEqual(router.db_for_read(Doctor), "default")
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Doctor), "replica")
+            self.assertEqual(router.db_for_read(Appointment), "default")
+            self.assertEqual(router.db_for_write(Doctor), "default")
+            # The write pins the rest of the block to the primary.
+            self.assertEqual(router.db_for_read(Doctor), "default")
+
+    def test_pages_cached_right_after_a_change_are_read_from_the_primary(self):
+        Doctor.objects.filter(pk="9201").update(first_name="RHEA")
+        response_cache.bump_doctor_versions(["9201"])
+        for path in ["/api/doctors/filter/?last_name=replica", "/api/doctor/9201/", "/api/async/doctor/9201/"]:
+            with self.subTest(path=path):
+                self.assertTrue(self.doctor_queries("default", path))
+                self.assertEqual(self.doctor_queries("replica", path), [])  # now a cache hit
+
+        cache.delete(response_cache.CHANGED_AT_KEY)
+        self.assertTrue(self.doctor_queries("replica", "/api/doctors/filter/?last_name=rep"))
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        response = self.client.post("/api/appointments/create/", payloads(["9201"], 1)[0],
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+        self.assertTrue(self.doctor_queries("default", "/api/doctor/9201/"))
+
+        del self.client.cookies[PIN_COOKIE]
+        cache.clear()
+        self.assertTrue(self.doctor_queries("replica", "/api/doctor/9201/"))
+
+    def test_batch_lookups_by_post_read_the_replica_without_pinning(self):
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            response = self.client.post("/api/doctors/batch/", {"ids": ["9201"]}, content_type="application/json")
+        self.assertEqual(response.json()["total"], 1)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class FacetTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9301", "ANA", "FACET", state="TX", city="AUSTIN", zip_code="787011234")
+        make_doctor("9302", "BEN", "FACET", state="TX", city="DALLAS", zip_code="75201")
+        make_doctor("9303", "CAL", "FACET", state="OK", city="TULSA", zip_code="74103",
+                    specialization="NEUROLOGY")
+        make_doctor("9304", "DAN", "FACET", state="", city=None, zip_code=None)
+
+    def setUp(self):
+        super().setUp()
+        facets.refresh_facets()
+
+    def test_unfiltered_facets_come_from_the_precomputed_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/doctors/facets/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "doctors"' in query["sql"]])
+        self.assertEqual(response.json(), {"total": 4, "facets": {
+            "specialization": [{"value": "INTERNAL MEDICINE", "count": 3}, {"value": "NEUROLOGY", "count": 1}],
+            "state": [{"value": "TX", "count": 2}, {"value": "OK", "count": 1}],
+            "city": [{"value": "AUSTIN", "count": 1}, {"value": "DALLAS", "count": 1}, {"value": "TULSA", "count": 1}],
+            "zip_code": [{"value": "74103", "count": 1}, {"value": "75201", "count": 1}, {"value": "78701", "count": 1}],
+        }})
+        self.assertEqual(self.client.get("/api/doctors/facets/", {"limit": "1"}).json()["facets"]["city"],
+                         [{"value": "AUSTIN", "count": 1}])
+        self.assertEqual(self.client.get("/api/doctors/facets/", {"limit": "0"}).status_code, 400)
+
+    def test_filtered_facets_count_the_matching_doctors(self):
+        data = self.client.get("/api/doctors/facets/", {"state": "tx", "last_name": "facet"}).json()
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(data["facets"]["state"], [{"value": "TX", "count": 2}])
+        self.assertEqual(data["facets"]["specialization"], [{"value": "INTERNAL MEDICINE", "count": 2}])
+        self.assertEqual(self.client.get("/api/doctors/facets/", {"specialization": "neuro"}).json()["facets"]["city"],
+                         [{"value": "TULSA", "count": 1}])
+
+    def test_cells_give_the_same_counts_as_the_doctors(self):
+        for params in [{"state": "tx"}, {"specialization": "internal", "city": "a"}, {"zip_code": "7"},
+                       {"state": "ok", "zip_code": "74103"}, {"state": "zz"}]:
+            with self.subTest(**params), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(facets.counts(params), facets.grouped(Doctor.objects.apply_filters(params)))
+                self.assertIn('"doctor_facet_cells"', queries[0]["sql"])
+
+    def test_refresh_only_writes_changed_counts(self):
+        self.assertEqual(facets.refresh_facets().changed, 0)
+        Doctor.objects.filter(pk="9303").update(location_id=Location.objects.resolve(["TULSA", "TX"]))
+        result = facets.refresh_facets()
+        # One cell moves (+1 -1); the OK facet goes, the TX one is recounted.
+        self.assertEqual((result.inserted, result.updated, result.deleted), (1, 1, 2))
+        self.assertEqual(facets.choices("state"), ["TX"])
+        self.assertFalse(DoctorFacet.objects.filter(field="name").exists())
+        make_doctor("9305", "ANA", "FACET")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(facets.choices("name", limit=3), ["ANA FACET", "BEN FACET", "CAL FACET"])
+        self.assertIn("LIMIT 3", queries[0]["sql"])
+
+    def test_admin_filters_read_the_facet_table(self):
+        DoctorFacet.objects.create(field="state", value="ZZ", doctors=1)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/fhirapi/doctor/")
+        self.assertContains(response, "?state=ZZ")
+        # Only the name filter reads doctors, 100 names off the name index.
+        scans = [query["sql"] for query in queries if "DISTINCT" in query["sql"]]
+        self.assertEqual(len(scans), 1)
+        self.assertIn('"first_name", "doctors"."last_name"', scans[0])
+        self.assertTrue(scans[0].endswith("LIMIT 100"))
+        response = self.client.get("/admin/fhirapi/doctor/", {"zip_code": "78701"})
+        self.assertContains(response, "9301")
+        self.assertNotContains(response, "9302")
+
+
+class DoctorAdminTests(ApiTestCase):
+    CHANGELIST = "/admin/fhirapi/doctor/"
+
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9601", "ADA", "LOVELACE", zip_code="787011234", city="AUSTIN", state="TX")
+        make_doctor("9602", "ALAN", "TURING", specialization="CARDIOLOGY")
+        make_doctor("9603", "GRACE", "HOPPER")
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pw")
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def search(self, term):
+        response = self.client.get(self.CHANGELIST, {"q": term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(doctor.pk for doctor in response.context["cl"].result_list)
+
+    def test_search_input_is_routed_to_one_filter(self):
+        self.assertEqual(search_params(" 9601 "), {"id": "9601"})
+        self.assertEqual(search_params("78701-1234"), {"zip_code": "787011234"})
+        self.assertEqual(search_params("City: austin"), {"city": "austin"})
+        self.assertEqual(search_params("zip:787"), {"zip_code": "787"})
+        self.assertEqual(search_params("note: lovelace"), {"q": "note: lovelace"})
+        self.assertEqual(search_params(""), {})
+
+    def test_search_results(self):
+        self.assertEqual(self.search("9602"), ["9602"])
+        self.assertEqual(self.search("78701"), ["9601"])
+        self.assertEqual(self.search("specialization:cardio"), ["9602"])
+        self.assertEqual(self.search("grace hopper"), ["9603"])
+        self.assertEqual(self.search(""), ["9601", "9602", "9603"])
+        response = self.client.get(self.CHANGELIST, {"q": "state:"}, follow=True)
+        self.assertEqual(response.status_code, 200)
+
+    def test_large_results_are_counted_from_the_estimate(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.CHANGELIST)
+        self.assertEqual(sum("COUNT(*)" in query["sql"] for query in queries), 1)
+
+        with mock.patch.object(EstimatedCountPaginator, "exact_below", 0), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.CHANGELIST, {"q": "state:tx"})
+        self.assertFalse([query["sql"] for query in queries if "COUNT(*)" in query["sql"]])
+        self.assertEqual(len(response.context["cl"].result_list), 1)
+        self.assertEqual(Doctor.objects.none().estimated_count(), 0)
+
+    def test_filter_choices_are_cached_until_the_data_version_changes(self):
+        def facet_reads():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.CHANGELIST)
+            return sum('"doctor_facets"' in query["sql"] for query in queries)
+
+        self.assertEqual(facet_reads(), 4)
+        self.assertEqual(facet_reads(), 0)
+        response_cache.bump_data_version()
+        self.assertEqual(facet_reads(), 4)
+
+    def test_appointment_doctors_are_joined(self):
+        doctor = Doctor.objects.get(pk="9601")
+        for minute in range(5):
+            Appointment.objects.create(
+                doctor=doctor, patient_name="PAT", phone_number="+11234567890", email="p@example.com",
+                reason="checkup", appointment_date=datetime.date(2031, 1, 6), appointment_time=datetime.time(9, minute),
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/fhirapi/appointment/")
+        self.assertContains(response, '<td class="field-doctor nowrap">ADA LOVELACE (INTERNAL MEDICINE)</td>', count=5)
+        self.assertFalse([query["sql"] for query in queries if 'FROM "doctors" WHERE' in query["sql"]])
+
+
+class AutocompleteTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_doctor("9401", "JOHN", "SMITH", city="JOLIET")
+        make_doctor("9402", "JOHN", "SMITH", city="JOLIET", specialization="CARDIOLOGY")
+        make_doctor("9403", "JOAN", "SMITHERS", city="JONESBORO")
+        make_doctor("9404", "ADA", "JONES", city="JOLIET")
+
+    def setUp(self):
+        super().setUp()
+        autocomplete._current = autocomplete.build()
+
+    def test_suggestions_are_ranked_by_doctors(self):
+        response = self.client.get("/api/doctors/autocomplete/", {"q": " jo"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [
+            {"value": "JOHN SMITH", "doctors": 2}, {"value": "ADA JONES", "doctors": 1},
+            {"value": "JOAN SMITHERS", "doctors": 1},
+        ])
+        data = self.client.get("/api/doctors/autocomplete/", {"q": "smith  j", "k": "1"}).json()
+        self.assertEqual(data["results"], [{"value": "JOHN SMITH", "doctors": 2}])
+        data = self.client.get("/api/doctors/autocomplete/", {"q": "Jo", "field": "city"}).json()
+        self.assertEqual(data["results"], [{"value": "JOLIET", "doctors": 3}, {"value": "JONESBORO", "doctors": 1}])
+        self.assertEqual(self.client.get("/api/doctors/autocomplete/", {"q": "zz"}).json()["results"], [])
+        self.assertEqual(self.client.get("/api/doctors/autocomplete/", {"q": "jo", "k": "0"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/doctors/autocomplete/", {"q": "jo", "field": "zip"}).status_code, 400)
+
+    def test_lookups_skip_the_database(self):
+        with self.assertNumQueries(0):
+            data = self.client.get("/api/doctors/autocomplete/", {"q": "card", "field": "specialization"}).json()
+        self.assertEqual(data["results"], [{"value": "CARDIOLOGY", "doctors": 1}])
+
+    def test_wide_prefixes_match_a_scan(self):
+        entries = [(f"{a}{b}{c}", f"{a}{b}{c}", (ord(a) * 7 + ord(b) * 3 + ord(c)) % 11)
+                   for a, b, c in itertools.product("ABC", "ABCD", "AB ")]
+        with mock.patch.object(autocomplete, "SCAN_LIMIT", 3):
+            index = autocomplete.PrefixIndex(entries)
+        self.assertIn(b"A", index.top)
+        for prefix in ["", "A", "AB", "CD", "BA", "CAB", "D"]:
+            with self.subTest(prefix=prefix):
+                expected = sorted((-doctors, key) for key, _, doctors in entries if key.startswith(prefix))[:5]
+                self.assertEqual(index.search(prefix, 5), [(key, -doctors) for doctors, key in expected])
+
+    def test_a_worker_answers_503_until_its_first_build(self):
+        autocomplete._current = None
+        with mock.patch.object(autocomplete, "_start_rebuild") as start:
+            response = self.client.get("/api/doctors/autocomplete/", {"q": "jo"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        start.assert_called_once()
+
+    def test_a_new_data_version_rebuilds_in_the_background(self):
+        make_doctor("9405", "JOSE", "SMITH")
+        response_cache.bump_data_version()
+        with mock.patch.object(autocomplete, "MIN_REBUILD_SECONDS", 0), \
+                mock.patch.object(autocomplete, "build", wraps=autocomplete.build) as build:
+            stale = autocomplete.indexes()
+            autocomplete._rebuilding.join()
+        build.assert_called_once_with(response_cache.data_version())
+        self.assertEqual(stale.fields["name"].search("jose"), [])
+        self.assertIsNot(autocomplete._current, stale)
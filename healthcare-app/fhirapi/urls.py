@@ -1,10 +1,22 @@
 from django.urls import path
+from . import async_views
 from .views import (
     api_root,
+    doctor_export,
     DoctorCreateView,
     DoctorFilterView,
+    DoctorFacetsView,
+    DoctorAutocompleteView,
     DoctorListView,
     DoctorDetailView,  
+    DoctorBatchView,
+    DoctorAvailabilityView,
+    AvailabilityView,
+    BulkExportView,
+    BulkExportStatusView,
+    BulkExportFileView,
+    CacheStatsView,
+    OutboxStatsView,
 )
 from .views import AppointmentCreateView
 
@@ -12,7 +24,21 @@ urlpatterns = [
     path('', api_root),
     path('create/', DoctorCreateView.as_view(), name='doctor-create'),
     path('doctors/filter/', DoctorFilterView.as_view(), name='doctor-filter'),
+    path('doctors/facets/', DoctorFacetsView.as_view(), name='doctor-facets'),
+    path('doctors/autocomplete/', DoctorAutocompleteView.as_view(), name='doctor-autocomplete'),
     path('doctors/', DoctorListView.as_view(), name='doctor-list'),
-    path('doctor/<int:practitioner_id>/', DoctorDetailView.as_view(), name='doctor-detail'),  
+    path('doctors/export/', doctor_export, name='doctor-export'),
+    path('doctors/batch/', DoctorBatchView.as_view(), name='doctor-batch'),
+    path('doctor/<str:practitioner_id>/', DoctorDetailView.as_view(), name='doctor-detail'),  
+    path('doctor/<str:practitioner_id>/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
     path('appointments/create/', AppointmentCreateView.as_view(), name='create-appointment'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('outbox/stats/', OutboxStatsView.as_view(), name='outbox-stats'),
+    path('async/', async_views.api_root, name='async-root'),
+    path('async/doctors/filter/', async_views.doctor_filter, name='async-doctor-filter'),
+    path('async/doctor/<str:practitioner_id>/', async_views.doctor_detail, name='async-doctor-detail'),
+    path('$export', BulkExportView.as_view(), name='bulk-export'),
+    path('bulkstatus/<uuid:job_id>/', BulkExportStatusView.as_view(), name='bulk-export-status'),
+    path('bulkfiles/<uuid:job_id>/<str:file_name>', BulkExportFileView.as_view(), name='bulk-export-file'),
 ]
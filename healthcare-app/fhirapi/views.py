@@ -2,19 +2,79 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import generics, status
-from django.http import JsonResponse
-from rest_framework.pagination import PageNumberPagination
+import re
+from urllib.parse import quote
 
-from .models import Doctor, Appointment
-from .serializers import DoctorSerializer, AppointmentSerializer
-from .tasks import send_confirmation_email
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from . import autocomplete, bulk_export, facets, outbox
+from .availability import MAX_DOCTORS, by_date, date_range, free_slots
+from .booking import MAX_KEY_LENGTH, book
+from .cache import VersionedCacheMixin, stats as cache_stats
+from .fhir import element_columns, practitioner_bundle, practitioner_json, requested_elements
+from .metrics import serializing
+from .models import Doctor, Appointment, ExportJob, nearest_first_scans, parse_int
+from .pagination import DoctorKeysetPagination, DoctorPagination
+from .routers import ReplicaReadsMixin
+from .serializers import (
+    DOCTOR_FIELDS, NEARBY_FIELDS, DoctorSerializer, AppointmentSerializer, row_serializer, sparse_fields,
+)
+from .streaming import iter_json_array, iter_ndjson
+from .tasks import start_practitioner_export
+
+
+API_LINKS = {
+    "create": "/api/create/",
+    "filter": "/api/doctors/filter/",
+    "facets": "/api/doctors/facets/",
+    "autocomplete": "/api/doctors/autocomplete/",
+    "batch": "/api/doctors/batch/",
+    "export": "/api/doctors/export/",
+    "availability": "/api/availability/",
+    "bulk_export": "/api/$export",
+    "async": "/api/async/",
+}
 
 
 def api_root(request):
-    return JsonResponse({
-        "create": "/api/create/",
-        "filter": "/api/doctors/filter/"
-    })
+    return JsonResponse(API_LINKS)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+    "json": (iter_json_array, "application/json"),
+}
+EXPORT_CHUNK_SIZE = 2000
+
+
+def doctor_export(request):
+    """
+    Streams every doctor matching the filter params as NDJSON (default) or
+    a chunked JSON array (?format=json).
+
+    Rows come from a PostgreSQL server-side cursor via .iterator() and are
+    encoded straight from .values() dicts, so memory stays flat regardless
+    of how many rows are exported. This is a plain Django view so DRF's
+    ?format= content negotiation doesn't get in the way.
+    """
+    export_format = request.GET.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(
+            {"error": f"Unsupported format; choose one of: {', '.join(EXPORT_FORMATS)}"}, status=400
+        )
+    encode, content_type = EXPORT_FORMATS[export_format]
+
+    try:
+        queryset = Doctor.objects.filter_from_params(request.GET)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    rows = queryset.with_names().values(*DOCTOR_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(encode(rows, batch_size=EXPORT_CHUNK_SIZE), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="doctors.{export_format}"'
+    return response
 
 
 class DoctorCreateView(generics.CreateAPIView):
@@ -22,127 +82,345 @@ class DoctorCreateView(generics.CreateAPIView):
     serializer_class = DoctorSerializer
 
 
-class DoctorListView(APIView):
+class DoctorListView(ReplicaReadsMixin, APIView):
+    """
+    Every doctor as one JSON array, the same objects DoctorSerializer would
+    produce, streamed like /doctors/export/?format=json so a national-sized
+    table never has to fit in memory. ``?fields=first_name,city`` selects
+    and returns only those columns.
+    """
     permission_classes = [AllowAny]
 
     def get(self, request):
+        try:
+            fields = sparse_fields(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        # The rows are read after dispatch returns, so bind the replica now.
         doctors = Doctor.objects.all()
-        serializer = DoctorSerializer(doctors, many=True)
-        return Response(serializer.data)
+        rows = doctors.using(doctors.db).select_fields(fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        objects = map(row_serializer(fields), rows)
+        return StreamingHttpResponse(iter_json_array(objects, batch_size=EXPORT_CHUNK_SIZE),
+                                     content_type="application/json")
 
 
-class DoctorPagination(PageNumberPagination):
-    page_size = 12
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+class DoctorFilterView(ReplicaReadsMixin, VersionedCacheMixin, APIView):
+    """
+    A page of the doctors matching the filter params. Rows are read with
+    ``.values()`` and encoded by ``serializers.row_serializer``;
+    ``?fields=first_name,city`` narrows both to those columns.
+    """
+    permission_classes = [AllowAny]
+    cache_prefix = "filter"
+    cache_params = ("sort", "page", "page_size", "cursor", "count", "fields")
+    uncached_params = ("available_within",)
 
+    def get(self, request):
+        # Delegate filtering and sorting to model layer
+        try:
+            queryset = Doctor.objects.filter_from_params(request.query_params)
+            nearby = "distance" in queryset.query.annotations
+            fields = sparse_fields(request.query_params, NEARBY_FIELDS if nearby else DOCTOR_FIELDS)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-class DoctorFilterView(APIView):
+        # ?cursor= opts into keyset pagination (no OFFSET scan, count on request);
+        # proximity searches always page by (distance, id).
+        if nearby or DoctorKeysetPagination.cursor_query_param in request.query_params:
+            paginator = DoctorKeysetPagination()
+        else:
+            paginator = DoctorPagination()
+        rows = queryset.select_fields(fields, cursor=isinstance(paginator, DoctorKeysetPagination))
+        if nearby:
+            with nearest_first_scans(using=queryset.db):
+                result_page = paginator.paginate_queryset(rows, request)
+        else:
+            result_page = paginator.paginate_queryset(rows, request)
+        serialize = row_serializer(fields)
+        with serializing():
+            data = [serialize(row) for row in result_page]
+        return paginator.get_paginated_response(data)
+
+
+class DoctorFacetsView(ReplicaReadsMixin, VersionedCacheMixin, APIView):
+    """
+    Doctor counts per specialization, state, city and 5-digit ZIP, the top
+    ``?limit=`` values of each, for the doctors matching the same filter
+    params as /doctors/filter/ (see facets.counts).
+    """
     permission_classes = [AllowAny]
+    cache_prefix = "facets"
+    cache_params = ("limit",)
+    uncached_params = ("available_within",)
 
     def get(self, request):
-        # Delegate filtering and sorting to model layer
-        queryset = Doctor.objects.filter_from_params(request.query_params)
+        params = request.query_params
+        try:
+            limit = parse_int(params, "limit", 1, facets.MAX_LIMIT) if "limit" in params else facets.DEFAULT_LIMIT
+            data = facets.counts(params, limit)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
 
-        paginator = DoctorPagination()
-        result_page = paginator.paginate_queryset(queryset, request)
-        serializer = DoctorSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
 
+class DoctorAutocompleteView(APIView):
+    """
+    Typeahead suggestions for ``?q=``: doctor names, or with ``?field=``
+    specializations or cities, starting with it; the ``?k=`` commonest.
+    Answered from the in-process index (see autocomplete); 503 while a
+    freshly started worker is still building it.
+    """
+    permission_classes = [AllowAny]
 
-class DoctorDetailView(APIView):
+    def get(self, request):
+        params = request.query_params
+        field = params.get("field", "name")
+        if field not in autocomplete.FIELDS:
+            return Response(
+                {"error": f"'field' must be one of: {', '.join(autocomplete.FIELDS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            k = parse_int(params, "k", 1, autocomplete.MAX_RESULTS) if "k" in params else autocomplete.DEFAULT_RESULTS
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        text = params.get("q", "")
+        results = autocomplete.suggest(field, text, k) if text.strip() else []
+        if results is None:
+            return Response({"error": "Autocomplete is still loading, retry shortly."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "5"})
+        return Response({"field": field, "q": text, "results": results})
+
+
+class DoctorDetailView(ReplicaReadsMixin, VersionedCacheMixin, APIView):
     """
-    Returns a FHIR Practitioner. We first try the model's to_fhir() helper.
-    If that fails due to invalid fields (e.g., 'specialty' on Practitioner),
-    we fall back to a sanitized Practitioner that maps specialization into
-    'qualification.code.coding' (FHIR-correct) and NEVER includes 'specialty'.
+    Returns a FHIR Practitioner, encoded straight from a .values() row by
+    fhir.practitioner_json (specialization is mapped to 'qualification').
+    ``?_elements=name,telecom`` returns and reads only those elements.
     """
     permission_classes = [AllowAny]
+    cache_prefix = "detail"
+    cache_params = ("_elements",)
+    version_kwarg = "practitioner_id"
 
     def get(self, request, practitioner_id):
         try:
-            doctor = Doctor.objects.get(practitioner_id=practitioner_id)
-        except Doctor.DoesNotExist:
+            elements = requested_elements(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        row = Doctor.objects.filter(practitioner_id=practitioner_id).select_fields(element_columns(elements)).first()
+        if row is None:
             return Response({"error": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+        with serializing():
+            return Response(practitioner_json(row, elements))
+
+
+MAX_BATCH_IDS = 100
+
+
+class DoctorBatchView(ReplicaReadsMixin, APIView):
+    """
+    Up to MAX_BATCH_IDS Practitioners as one FHIR searchset Bundle, read in
+    a single ``practitioner_id = ANY(...)`` query: ``?ids=id1,id2,...`` or a
+    POST body ``{"ids": [...]}``. Unknown ids get an OperationOutcome entry
+    instead of failing the request (see fhir.practitioner_bundle).
+    ``?_elements=`` works as on the detail view.
+    """
+    permission_classes = [AllowAny]
+    read_only_methods = ("POST",)
 
-        # 1) Try the model helper first (your current path)
+    def get(self, request):
+        ids = [value for values in request.query_params.getlist("ids") for value in values.split(",")]
+        return self.bundle(request, ids)
+
+    def post(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(value, (str, int)) for value in ids):
+            return Response({"error": "'ids' must be a list of practitioner ids."}, status=status.HTTP_400_BAD_REQUEST)
+        return self.bundle(request, [str(value) for value in ids])
+
+    def bundle(self, request, ids):
         try:
-            fhir_resource = doctor.to_fhir()  # may raise Pydantic validation error
-            # fhir.resources uses pydantic; .dict() -> JSON-ready dict
-            return Response(fhir_resource.dict())
-        except Exception as e:
-            # 2) Fallback: build a clean Practitioner without 'specialty'
-            #    and optionally map your specialization to qualification
-            #    to keep the UI data available.
-            sanitized = {
-                "resourceType": "Practitioner",
-                "id": str(doctor.practitioner_id),
-                "name": [{
-                    "family": (doctor.last_name or ""),
-                    "given": [x for x in [doctor.first_name] if x] or [""],
-                }],
-                "telecom": [],
-            }
-
-            # Add telecom safely
-            phone = getattr(doctor, "phone", None)
-            if phone:
-                sanitized["telecom"].append({"system": "phone", "value": str(phone)})
-            email = getattr(doctor, "email", None)
-            if email:
-                sanitized["telecom"].append({"system": "email", "value": str(email)})
-
-            # Optional common fields if you store them
-            gender = getattr(doctor, "gender", None)
-            if gender:
-                sanitized["gender"] = str(gender)
-
-            # ✅ Map specialization into qualification instead of invalid 'specialty'
-            specialization_display = getattr(doctor, "specialization", None)
-            specialization_code = getattr(doctor, "specialization_code", None) or (
-                str(specialization_display).upper().replace(" ", "_") if specialization_display else None
+            elements = requested_elements(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(value.strip() for value in ids if value.strip()))
+        if not ids:
+            return Response({"error": "'ids' must list practitioner ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BATCH_IDS:
+            return Response(
+                {"error": f"At most {MAX_BATCH_IDS} practitioners can be requested at once."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            if specialization_display:
-                sanitized["qualification"] = [{
-                    "code": {
-                        "coding": [{
-                            "system": "http://terminology.hl7.org/CodeSystem/practitioner-role",
-                            "code": specialization_code,
-                            "display": str(specialization_display),
-                        }]
-                    }
-                }]
-
-            # Optionally include address, birthDate, etc., if you have them
-
-            # Also send back the reason we sanitized (useful for debugging)
+        rows = Doctor.objects.filter(practitioner_id__any=ids).select_fields(element_columns(elements))
+        # One reverse() for the whole bundle: every detail URL is this prefix, the id and a slash.
+        prefix = request.build_absolute_uri(reverse("doctor-detail", args=["-"])).removesuffix("-/")
+        with serializing():
+            return Response(practitioner_bundle(ids, rows, lambda practitioner_id: f"{prefix}{quote(practitioner_id)}/",
+                                                elements))
+
+
+class DoctorAvailabilityView(APIView):
+    """
+    Free appointment slots of one doctor, grouped by date, for ``?start=``
+    to ``?end=`` (ISO dates; the next 7 days by default).
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, practitioner_id):
+        if not Doctor.objects.filter(practitioner_id=practitioner_id).exists():
+            return Response({"error": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            start, end = date_range(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        slots = free_slots([practitioner_id], start, end)[practitioner_id]
+        return Response({"practitioner_id": practitioner_id, "start": start, "end": end, "slots": by_date(slots)})
+
+
+class AvailabilityView(APIView):
+    """
+    Free appointment slots of several doctors in one query:
+    ``?doctors=id1,id2,...`` (up to MAX_DOCTORS) with ``?start=``/``?end=``.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        ids = [value.strip() for value in request.query_params.get("doctors", "").split(",") if value.strip()]
+        if not ids:
+            return Response({"error": "'doctors' must list practitioner ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_DOCTORS:
             return Response(
-                {
-                    **sanitized,
-                    "_note": "Returned sanitized Practitioner without 'specialty'; original to_fhir() failed: {}".format(str(e)),
-                },
-                status=status.HTTP_200_OK,
+                {"error": f"At most {MAX_DOCTORS} doctors can be requested at once."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        try:
+            start, end = date_range(request.query_params)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        slots = free_slots(dict.fromkeys(ids), start, end)
+        return Response({
+            "start": start,
+            "end": end,
+            "doctors": {doctor_id: by_date(doctor_slots) for doctor_id, doctor_slots in slots.items()},
+        })
+
+
+class CacheStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+
+class OutboxStatsView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(outbox.stats())
 
 
 class AppointmentCreateView(generics.CreateAPIView):
+    """
+    Books a slot. A taken slot answers 409 with the slot in the body; an
+    ``Idempotency-Key`` header makes retries replay the first response
+    instead of booking twice (see ``booking``).
+    """
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
 
     def create(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            appointment = serializer.save()
-            doctor = appointment.doctor
-
-            # fire-and-forget confirmation email (Celery)
-            send_confirmation_email.delay(
-                patient_email=appointment.email,
-                doctor_name=f"{doctor.first_name} {doctor.last_name}",
-                appointment_date=str(appointment.appointment_date),
-                appointment_time=str(appointment.appointment_time),
-                appointment_id=str(appointment.appointment_id),
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # The confirmation email is queued in the booking's transaction.
+        response_status, body, _ = book(serializer, key)
+        return Response(body, status=response_status)
+
+
+class BulkExportView(APIView):
+    """
+    FHIR Bulk Data kick-off (``GET /api/$export``). Queues a Celery job that
+    writes Practitioner NDJSON files and answers 202 with the status URL in
+    ``Content-Location``.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        if request.headers.get("Prefer") != "respond-async":
+            return Response(
+                bulk_export.operation_outcome("The Prefer: respond-async header is required.", code="required"),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        requested_types = request.query_params.get("_type")
+        if requested_types and set(requested_types.split(",")) != {"Practitioner"}:
+            return Response(
+                bulk_export.operation_outcome("Only _type=Practitioner can be exported.", code="not-supported"),
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        output_format = request.query_params.get("_outputFormat")
+        if output_format and output_format not in bulk_export.OUTPUT_FORMATS:
+            return Response(
+                bulk_export.operation_outcome("Only NDJSON output is supported.", code="not-supported"),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        job = ExportJob.objects.create(request_url=request.build_absolute_uri())
+        transaction.on_commit(lambda: start_practitioner_export.delay(str(job.job_id)))
+
+        response = Response(status=status.HTTP_202_ACCEPTED)
+        response["Content-Location"] = request.build_absolute_uri(
+            reverse("bulk-export-status", args=[job.job_id])
+        )
+        return response
+
+
+class BulkExportStatusView(APIView):
+    """
+    Polling endpoint for a $export job: 202 with ``X-Progress`` while it runs,
+    then the completion manifest. DELETE cancels the job and removes its files.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ExportJob, pk=job_id)
+        if job.status == ExportJob.CANCELLED:
+            raise Http404("Export job was cancelled")
+        if job.status == ExportJob.FAILED:
+            return Response(bulk_export.operation_outcome(job.error or "Export failed"),
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if job.status == ExportJob.COMPLETED:
+            def file_url(name):
+                return request.build_absolute_uri(reverse("bulk-export-file", args=[job.job_id, name]))
+            return Response(bulk_export.manifest(job, file_url))
+
+        total = job.chunks.count()
+        done = job.chunks.filter(done=True).count()
+        response = Response(status=status.HTTP_202_ACCEPTED)
+        response["X-Progress"] = f"{done}/{total} chunks, {job.resource_count} resources"
+        response["Retry-After"] = "5"
+        return response
+
+    def delete(self, request, job_id):
+        job = get_object_or_404(ExportJob, pk=job_id)
+        bulk_export.cancel_job(job)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class BulkExportFileView(APIView):
+    permission_classes = [AllowAny]
+    file_name_pattern = re.compile(r"^Practitioner\.\d{5}\.ndjson$")
 
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def get(self, request, job_id, file_name):
+        job = get_object_or_404(ExportJob, pk=job_id, status=ExportJob.COMPLETED)
+        path = bulk_export.job_dir(job) / file_name
+        if not self.file_name_pattern.match(file_name) or not path.is_file():
+            raise Http404("No such export file")
+        return FileResponse(open(path, "rb"), content_type=bulk_export.NDJSON_CONTENT_TYPE)
@@ -1,13 +1,42 @@
+"""
+Clean the CMS National Downloadable File into the doctor CSV that
+``manage.py load_external_doctors_postgre --csv`` loads.
+
+    python preprocessing.py RawData_DAC_NationalDownloadableFile.csv filtered_doctors/
+    python preprocessing.py RawData_DAC_NationalDownloadableFile.csv filtered_doctors.csv --format csv
+
+The default ``chunked`` engine reads ``--chunksize`` rows at a time with only
+the columns it needs (all as strings, so zip codes keep their leading
+zeros), cleans the chunks in a process pool and writes them out in input
+order. Duplicate ``ind_pac_id`` rows are dropped across chunks using a
+sorted array of 64-bit id hashes, 8 bytes per practitioner. Emails are
+derived from that hash, so re-running on the same file gives the same
+output.
+
+The default output is a Parquet dataset (see ``fhirapi/parquet.py``): one
+file per state plus a manifest of digests, so the loader only re-reads the
+states that changed. ``--format csv`` writes a single CSV instead.
+``--engine legacy`` is the original whole-file pandas pipeline (CSV only),
+kept for comparison.
+"""
+import argparse
+import csv
 import os
-import django
-import pandas as pd
 import random
 import string
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-django.setup()
+import numpy as np
+import pandas as pd
+
+from fhirapi.parquet import DatasetWriter
 
-from fhirapi.models import Doctor
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 columns = [
     'npi', 'ind_pac_id', 'ind_enrl_id', 'provider_last_name', 'provider_first_name',
@@ -18,43 +47,192 @@ columns = [
     'telephone_number', 'ind_assgn', 'grp_assgn', 'adrs_id'
 ]
 
-file_path = "C:\\Users\\lenovo\\OneDrive\\Desktop\\Django Doctor Finder\\healthcare-app\\backend\\RawData_DAC_NationalDownloadableFile.csv"
-output_path = "C:\\Users\\lenovo\\OneDrive\\Desktop\\Django Doctor Finder\\healthcare-app\\backend\\filtered_doctors.csv"
+required_cols = ['ind_pac_id', 'provider_first_name', 'provider_last_name', 'pri_spec', 'telephone_number',
+                 'adr_ln_1', 'city_town', 'state', 'zip_code']
 
-df = pd.read_csv(file_path, names=columns, header=None, low_memory=False)
+used_cols = required_cols + ['adr_ln_2']
 
-if df.iloc[0]['provider_first_name'].strip().lower() == 'provider first name':
-    df = df.iloc[1:]
+output_columns = {
+    'ind_pac_id': 'practitioner_id',
+    'provider_first_name': 'first_name',
+    'provider_last_name': 'last_name',
+    'pri_spec': 'specialization',
+    'telephone_number': 'phone',
+    'email': 'email',
+    'address': 'address',
+    'city_town': 'city',
+    'state': 'state',
+    'zip_code': 'zip_code',
+}
 
-required_cols = ['ind_pac_id', 'provider_first_name', 'provider_last_name', 'pri_spec', 'telephone_number',
-                 'adr_ln_1', 'city_town', 'state', 'zip_code']
-df = df.dropna(subset=required_cols)
+email_domains = ['gmail.com', 'yahoo.com', 'docmail.com', 'healthpro.org']
+
+
+def has_header(file_path):
+    with open(file_path, newline='', encoding='utf-8') as source:
+        first_row = next(csv.reader(source), [])
+    return len(first_row) > 4 and first_row[4].strip().lower() == 'provider first name'
+
+
+def id_hashes(ids):
+    return pd.util.hash_pandas_object(ids, index=False).to_numpy()
+
+
+def clean_chunk(df):
+    """
+    Drop incomplete rows and derive address and email for one chunk.
+    Returns the output frame and the ``ind_pac_id`` hash of every row.
+    """
+    df = df.dropna(subset=required_cols)
+    hashes = id_hashes(df['ind_pac_id'])
+
+    digits = pd.Series(hashes % 1000, index=df.index).astype(str).str.zfill(3)
+    domains = pd.Series(np.array(email_domains)[(hashes >> 10) % len(email_domains)], index=df.index)
+    df = df.assign(
+        address=df['adr_ln_1'] + ', ' + df['adr_ln_2'].fillna(''),
+        email=(df['provider_first_name'].str[:1] + df['provider_last_name'] + digits).str.lower() + '@' + domains,
+    )
+    return df[list(output_columns)].rename(columns=output_columns), hashes
+
+
+class SeenIds:
+    """
+    Hashes of the ``ind_pac_id`` values written so far, kept sorted so
+    membership is a binary search.
+    """
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def first_seen(self, hashes):
+        fresh = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(self.hashes):
+            positions = np.searchsorted(self.hashes, hashes).clip(max=len(self.hashes) - 1)
+            fresh &= self.hashes[positions] != hashes
+        self.hashes = np.sort(np.concatenate([self.hashes, hashes[fresh]]))
+        return fresh
+
+
+def ordered_map(executor, func, items, ahead):
+    """
+    ``executor.map`` that keeps at most ``ahead`` items in flight, so the
+    reader can't run ahead of the workers and buffer the whole file.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
-df = df.drop_duplicates(subset='ind_pac_id')
 
-df['address'] = (
-    df['adr_ln_1'].fillna('') + ', ' +
-    df['adr_ln_2'].fillna('')
-)
+class CsvWriter:
+    def __init__(self, output_path):
+        self.output = open(output_path, 'w', newline='', encoding='utf-8')
+        self.output.write(','.join(output_columns.values()) + '\n')
+
+    def write(self, df):
+        df.to_csv(self.output, index=False, header=False)
+
+    def close(self):
+        self.output.close()
+
+
+def run_chunked(file_path, output_path, chunksize=200_000, workers=None, output_format='parquet'):
+    workers = workers or os.cpu_count() or 1
+    rows_read = rows_written = 0
+
+    def chunks():
+        nonlocal rows_read
+        reader = pd.read_csv(
+            file_path, names=columns, header=None, usecols=used_cols, dtype=str,
+            skiprows=1 if has_header(file_path) else 0, chunksize=chunksize,
+        )
+        for chunk in reader:
+            rows_read += len(chunk)
+            yield chunk
+
+    seen = SeenIds()
+    output = DatasetWriter(output_path) if output_format == 'parquet' else CsvWriter(output_path)
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        cleaned = ordered_map(executor, clean_chunk, chunks(), workers * 2) if executor else map(clean_chunk, chunks())
+        for df, hashes in cleaned:
+            df = df[seen.first_seen(hashes)]
+            output.write(df)
+            rows_written += len(df)
+    finally:
+        output.close()
+        if executor:
+            executor.shutdown()
+    return rows_read, rows_written
+
 
 def generate_email(first, last):
     domain = random.choice(['gmail.com', 'yahoo.com', 'docmail.com', 'healthpro.org'])
     user = (first[:1] + last + ''.join(random.choices(string.digits, k=3))).lower()
     return f"{user}@{domain}"
 
-df['email'] = df.apply(lambda row: generate_email(row['provider_first_name'], row['provider_last_name']), axis=1)
 
-df_filtered = df[[ 
-    'ind_pac_id', 'provider_first_name', 'provider_last_name', 'pri_spec', 'telephone_number', 
-    'email', 'address', 'city_town', 'state', 'zip_code'
-]].rename(columns={
-    'ind_pac_id': 'practitioner_id',
-    'provider_first_name': 'first_name',
-    'provider_last_name': 'last_name',
-    'pri_spec': 'specialization',
-    'telephone_number': 'phone',
-    'city_town': 'city'
-})
+def run_legacy(file_path, output_path):
+    df = pd.read_csv(file_path, names=columns, header=None, low_memory=False)
+    rows_read = len(df)
+
+    if df.iloc[0]['provider_first_name'].strip().lower() == 'provider first name':
+        df = df.iloc[1:]
+        rows_read -= 1
+
+    df = df.dropna(subset=required_cols)
+
+    df = df.drop_duplicates(subset='ind_pac_id')
+
+    df['address'] = (
+        df['adr_ln_1'].fillna('') + ', ' +
+        df['adr_ln_2'].fillna('')
+    )
+
+    df['email'] = df.apply(lambda row: generate_email(row['provider_first_name'], row['provider_last_name']), axis=1)
+
+    df_filtered = df[list(output_columns)].rename(columns=output_columns)
+
+    df_filtered.to_csv(output_path, index=False)
+    return rows_read, len(df_filtered)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and of its largest worker.
+    """
+    if resource is None:
+        return None, None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help='RawData_DAC_NationalDownloadableFile.csv')
+    parser.add_argument('output', help='Parquet dataset directory (or CSV file with --format csv) to write')
+    parser.add_argument('--engine', choices=['chunked', 'legacy'], default='chunked')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help='Output format (chunked engine)')
+    parser.add_argument('--chunksize', type=int, default=200_000, help='Rows per chunk (chunked engine)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.engine == 'legacy':
+        rows_read, rows_written = run_legacy(args.input, args.output)
+    else:
+        rows_read, rows_written = run_chunked(args.input, args.output, args.chunksize, args.workers, args.format)
+    elapsed = time.perf_counter() - started
+
+    own, workers = peak_rss_mb()
+    memory = f"peak RSS {own:,.0f} MB, largest worker {workers:,.0f} MB" if own else "peak RSS n/a"
+    print(f"{args.engine}: {rows_read:,} rows in, {rows_written:,} doctors out in {elapsed:.1f}s "
+          f"({rows_read / elapsed:,.0f} rows/s, {memory})")
+    print(f"Cleaned data is saved at: {args.output}")
+
 
-df_filtered.to_csv(output_path, index=False)
-print(f"Cleaned data is saved at: {output_path}")
+if __name__ == '__main__':
+    main()